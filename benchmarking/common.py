@@ -0,0 +1,89 @@
+import os
+import csv
+
+CSV_HEADER = [
+    'approach', 'script', 'scene', 'time', 'image_count', 'image_width', 'image_height', 'scene_size',
+    'avg_gpu_usage', 'max_gpu_usage', 'avg_cpu_memory_usage', 'max_cpu_memory_usage',
+    'avg_combined_usage', 'max_combined_usage', 'cpu_time', 'io_read', 'io_write', 'timeseries',
+    'trial', 'warmup', 'cache_state', 'frame_count', 'render_views', 'time_per_frame', 'model_load_time', 'compute_time'
+]
+
+def rotate_legacy_results(output_file, header=CSV_HEADER):
+    """
+    Moves a results CSV written with a header other than the expected one aside, so new rows are never
+    appended under mismatching columns. Old benchmark CSVs can still be imported with the results store.
+    """
+    if not os.path.isfile(output_file) or os.path.getsize(output_file) == 0:
+        return
+    with open(output_file, newline='') as file:
+        existing_header = next(csv.reader(file), [])
+    if existing_header != header:
+        root, ext = os.path.splitext(output_file)
+        legacy_file = f"{root}_{int(os.path.getmtime(output_file))}{ext}"
+        os.replace(output_file, legacy_file)
+        print(f"Moved {output_file} with an older header to {legacy_file}.")
+
+def open_results_writer(file):
+    """
+    Wraps an open results file in a csv writer and writes the header if the file is empty.
+    """
+    writer = csv.writer(file)
+    if file.tell() == 0:
+        writer.writerow(CSV_HEADER)
+    return writer
+
+def timeseries_path(output_file, approach, script, scene, start_time):
+    script_name = os.path.splitext(os.path.basename(script))[0]
+    return os.path.join(os.path.dirname(output_file), "timeseries",
+                        f"{approach}_{script_name}_{scene}_{int(start_time * 1000)}.csv")
+
+def summary_row(approach, script, scene, image_count, image_width, image_height, scene_size, summary, series_path,
+                trial=None, warmup=False, cache_state=None, frame_count=None, render_views=None):
+    return [
+        approach, script, scene, summary['time'], image_count, image_width, image_height, scene_size,
+        summary['avg_gpu_usage'], summary['max_gpu_usage'], summary['avg_cpu_memory_usage'], summary['max_cpu_memory_usage'],
+        summary['avg_combined_usage'], summary['max_combined_usage'], summary['cpu_time'],
+        summary['io_read'], summary['io_write'], series_path, trial, int(warmup), cache_state,
+        frame_count, render_views, summary.get('time_per_frame'), summary.get('model_load_time'), summary.get('compute_time')
+    ]
+
+def print_summary(scene, summary, scene_size):
+    if summary.get('time_per_frame') is not None:
+        print(f"Rendered scene {scene} at {summary['time_per_frame']:.3f} seconds per frame")
+    if summary.get('model_load_time') is not None:
+        print(f"Ran scene {scene} in a warm worker: {summary['model_load_time']:.2f} seconds loading models, "
+              f"{summary['compute_time']:.2f} seconds compute")
+    print(f"Processed scene {scene}: {summary['time']:.2f} seconds, "
+          f"Avg GPU: {summary['avg_gpu_usage']:.2f} GB, Max GPU: {summary['max_gpu_usage']:.2f} GB, "
+          f"Avg CPU Memory: {summary['avg_cpu_memory_usage']:.2f} GB, Max CPU Memory: {summary['max_cpu_memory_usage']:.2f} GB, "
+          f"Avg Combined: {summary['avg_combined_usage']:.2f} GB, Max Combined: {summary['max_combined_usage']:.2f} GB, "
+          f"CPU Time: {summary['cpu_time']:.2f} s, IO Read: {summary['io_read']:.2f} GB, IO Write: {summary['io_write']:.2f} GB, "
+          f"Scene Size: {scene_size:.2f} GB")
+
+def record_result(writer, store, run_id, output_file, approach, script, scene, metadata, sampler, returncode=None):
+    """
+    Saves the time series of a finished stage and records its summary in the results CSV and store.
+    """
+    summary = sampler.summary()
+    m = metadata
+    # Rendering stages report how many frames they render, so approaches can be compared per frame
+    frame_count = m.get('frame_count')
+    summary['time_per_frame'] = summary['time'] / frame_count if frame_count else None
+    series_path = timeseries_path(output_file, approach, script, scene, sampler.start_time)
+    sampler.save(series_path)
+
+    extra = dict(trial=m.get('trial'), warmup=m.get('warmup', False), cache_state=m.get('cache_state'), frame_count=frame_count,
+                 render_views=m.get('render_views'))
+    writer.writerow(summary_row(approach, script, scene, m['image_count'], m['image_width'], m['image_height'], m['scene_size'], summary, series_path, **extra))
+    if store is not None:
+        store.record_stage(run_id, approach, script, scene, summary, m['image_count'], m['image_width'], m['image_height'],
+                           m['scene_size'], returncode, sampler.series, **extra)
+    print_summary(scene, summary, m['scene_size'])
+
+def write_job_result(writer, store, run_id, output_file, approach, job, returncode, sampler):
+    """
+    Records the result of a finished scheduler job.
+    """
+    if sampler is None:
+        return
+    record_result(writer, store, run_id, output_file, approach, job.script, job.scene, job.metadata, sampler, returncode)
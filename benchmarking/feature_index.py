@@ -0,0 +1,188 @@
+import os
+import json
+import numpy as np
+
+INDEX_DIR = "feature_index"
+ASSIGN_CHUNK = 1 << 16
+
+def index_dir(features_path):
+    """
+    The index of a model's features is stored next to them, e.g.
+    <model>/point_cloud/iteration_10000/feature_index/.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(features_path)), INDEX_DIR)
+
+def file_fingerprint(path, **params):
+    """
+    Identifies a feature file version (and the parameters the indexed features were derived with) without
+    hashing its content.
+    """
+    stat = os.stat(path)
+    return json.dumps(dict(params, path=os.path.abspath(path), size=stat.st_size, mtime_ns=stat.st_mtime_ns), sort_keys=True)
+
+def assign(features, centroids, chunk_size=ASSIGN_CHUNK):
+    """
+    Returns the index of the most similar centroid for every feature, computed in chunks.
+    """
+    labels = np.empty(len(features), dtype=np.int32)
+    for start in range(0, len(features), chunk_size):
+        labels[start:start + chunk_size] = np.argmax(np.asarray(features[start:start + chunk_size]) @ centroids.T, axis=1)
+    return labels
+
+def spherical_kmeans(features, nlist, iterations=10, sample_size=None, init=None, seed=0):
+    """
+    k-means on the unit sphere over a random sample of the features. init warm-starts from existing centroids.
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(features), sample_size or max(64 * nlist, 100_000))
+    sample = np.asarray(features[np.sort(rng.choice(len(features), sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)] if init is None else np.array(init, dtype=np.float32)
+
+    for _ in range(iterations):
+        labels = assign(sample, centroids)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=nlist)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        empty = counts == 0
+        # reduceat needs the starts of non-empty lists only, a repeated or clipped start would cut a list short
+        sums = np.zeros((nlist, sample.shape[1]), dtype=np.float32)
+        sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+        sums[empty] = sample[rng.choice(len(sample), empty.sum())]  # Reseed empty lists
+        centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-8)
+    return centroids.astype(np.float32)
+
+class IVFIndex:
+    """
+    Inverted-file index for inner-product (cosine) search over unit-length features, e.g. SAGA contrastive
+    features or normalized splat features.
+
+    The features are clustered into nlist lists by spherical k-means and stored reordered by list, so a query
+    only scans the nprobe lists whose centroids are most similar to it. nprobe trades recall for latency:
+    nprobe = nlist is an exact search.
+
+    Args:
+        centroids: (nlist, D) unit-length list centroids.
+        ids: Original point index of every stored vector.
+        offsets: Start of every list in ids and vectors, with a final entry of N.
+        vectors: (N, D) features ordered by list.
+        fingerprint: Identifies the feature version the index was built from.
+    """
+
+    def __init__(self, centroids, ids, offsets, vectors, fingerprint=None):
+        self.centroids = centroids
+        self.ids = ids
+        self.offsets = offsets
+        self.vectors = vectors
+        self.fingerprint = fingerprint
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_assignment(cls, features, centroids, labels, fingerprint=None):
+        ids = np.argsort(labels, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(centroids)))]).astype(np.int64)
+        vectors = np.empty((len(ids), features.shape[1]), dtype=np.float32)
+        for start in range(0, len(ids), ASSIGN_CHUNK):
+            vectors[start:start + ASSIGN_CHUNK] = features[ids[start:start + ASSIGN_CHUNK]]
+        return cls(centroids, ids, offsets, vectors, fingerprint)
+
+    @classmethod
+    def build(cls, features, nlist=None, iterations=10, sample_size=None, seed=0, fingerprint=None):
+        """
+        Builds an index over (N, D) unit-length features. nlist defaults to 4 * sqrt(N).
+        """
+        nlist = min(len(features), nlist or max(1, int(4 * np.sqrt(len(features)))))
+        centroids = spherical_kmeans(features, nlist, iterations, sample_size, seed=seed)
+        return cls.from_assignment(features, centroids, assign(features, centroids), fingerprint)
+
+    def update(self, features, fingerprint=None, max_imbalance=8.0, iterations=3, seed=0):
+        """
+        Re-indexes re-trained or extended features without clustering from scratch: points are assigned to the
+        existing centroids, and only if the lists became too unbalanced are the centroids refined by a few
+        warm-started k-means iterations.
+        """
+        if features.shape[1] != self.centroids.shape[1]:
+            return IVFIndex.build(features, self.nlist, seed=seed, fingerprint=fingerprint)
+        centroids = self.centroids
+        labels = assign(features, centroids)
+        counts = np.bincount(labels, minlength=self.nlist)
+        if counts.max() > max_imbalance * len(features) / self.nlist:
+            centroids = spherical_kmeans(features, self.nlist, iterations, init=centroids, seed=seed)
+            labels = assign(features, centroids)
+        return IVFIndex.from_assignment(features, centroids, labels, fingerprint)
+
+    def _candidates(self, query, nprobe):
+        nprobe = min(nprobe or self.nlist, self.nlist)
+        lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe] if nprobe < self.nlist else range(self.nlist)
+        ranges = [(self.offsets[l], self.offsets[l + 1]) for l in lists]
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges]) if ranges else np.zeros(0, dtype=np.int64)
+        vectors = np.concatenate([self.vectors[start:end] for start, end in ranges]) if ranges else np.zeros((0, self.vectors.shape[1]))
+        return rows, vectors @ query
+
+    def search(self, queries, k=10, nprobe=8):
+        """
+        Returns the scores and point indices of the k most similar points for every query, both (Q, k). Missing
+        neighbours (fewer than k candidates) have index -1.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            rows, similarity = self._candidates(query, nprobe)
+            top = np.argpartition(-similarity, k - 1)[:k] if len(similarity) > k else np.arange(len(similarity))
+            top = top[np.argsort(-similarity[top])]
+            scores[i, :len(top)] = similarity[top]
+            ids[i, :len(top)] = self.ids[rows[top]]
+        return scores, ids
+
+    def radius(self, queries, threshold, nprobe=8):
+        """
+        Returns, for every query, the point indices with a similarity above threshold among the probed lists.
+        """
+        results = []
+        for query in np.atleast_2d(np.asarray(queries, dtype=np.float32)):
+            rows, similarity = self._candidates(query, nprobe)
+            results.append(self.ids[rows[similarity > threshold]])
+        return results
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in ("centroids", "ids", "offsets", "vectors"):
+            tmp_path = os.path.join(directory, f"{name}.tmp.npy")
+            np.save(tmp_path, getattr(self, name))
+            os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+        with open(os.path.join(directory, "index.json"), "w") as f:
+            json.dump({"nlist": self.nlist, "size": len(self), "fingerprint": self.fingerprint}, f)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Loads a saved index, memory-mapping the stored vectors.
+        """
+        with open(os.path.join(directory, "index.json")) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if name == "vectors" else None)
+                  for name in ("centroids", "ids", "offsets", "vectors")}
+        return cls(fingerprint=meta["fingerprint"], **arrays)
+
+def load_or_build(features, directory, fingerprint, nlist=None):
+    """
+    Returns the index saved in directory if it was built from the same feature version, updates it if the
+    features changed (e.g. after re-training) and builds it otherwise. The result is saved back.
+    """
+    index = None
+    if os.path.isfile(os.path.join(directory, "index.json")):
+        index = IVFIndex.load(directory)
+        if index.fingerprint == fingerprint and len(index) == len(features):
+            return index
+        print(f"Features changed since the index in {directory} was built, updating it.")
+        index = index.update(features, fingerprint)
+    else:
+        index = IVFIndex.build(features, nlist, fingerprint=fingerprint)
+    index.save(directory)
+    return IVFIndex.load(directory)
@@ -0,0 +1,67 @@
+import os
+from benchmarking.common import open_results_writer, rotate_legacy_results, write_job_result
+from benchmarking.results_store import DEFAULT_DB, ResultsStore
+from benchmarking.sampler import DEFAULT_INTERVAL, get_gpu_backend
+from benchmarking.scheduler import PeakMemoryEstimates, Scheduler
+from benchmarking.trials import CACHE_STATES, expand_trials, summarize_trials, write_trial_summary
+
+def add_benchmark_arguments(parser):
+    """
+    Adds the measurement, scheduling and repetition options shared by all benchmark scripts.
+    """
+    parser.add_argument('--results_db', default=DEFAULT_DB, help="SQLite database receiving runs, stages and time series.")
+    parser.add_argument('--sample_interval', type=float, default=DEFAULT_INTERVAL, help="Seconds between two resource samples.")
+    parser.add_argument('--cpu_slots', type=int, default=1, help="Number of jobs that may run at the same time.")
+    parser.add_argument('--memory_budget', type=float, default=None, help="Host memory budget in GB for concurrent jobs. Defaults to 90%% of the available memory.")
+    parser.add_argument('--gpu_budget', type=float, default=None, help="GPU memory budget in GB for concurrent jobs.")
+    parser.add_argument('--repetitions', type=int, default=1, help="Number of measured trials per scene and stage.")
+    parser.add_argument('--warmup', type=int, default=0, help="Number of discarded warmup trials before the measured ones.")
+    parser.add_argument('--shuffle', action='store_true', help="Randomize the scene order within every trial.")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for --shuffle.")
+    parser.add_argument('--cache_state', choices=CACHE_STATES, default="none",
+                        help="Evict scene files from (cold) or load them into (warm) the page cache before every trial; both runs one of each.")
+    return parser
+
+def is_repeated(args):
+    return args.repetitions > 1 or args.warmup > 0 or args.cache_state != "none"
+
+def run_benchmark(args, output_file, approach, chains, on_success=None, workers=None):
+    """
+    Runs chains of scheduler jobs (one chain per scene) with the trial, scheduling and sampling options of
+    add_benchmark_arguments and records every job in the results CSV and store.
+
+    Job metadata must contain image_count, image_width, image_height and scene_size, and may list the
+    files of the scene in cache_paths for cold and warm trials. on_success(job) is called for every job
+    that exited with return code 0. Jobs marked warm are dispatched to the WorkerPool workers if given,
+    which is closed at the end.
+    """
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    rotate_legacy_results(output_file)
+    chains = expand_trials(chains, args.repetitions, args.warmup, args.shuffle, args.seed, args.cache_state)
+
+    with open(output_file, mode='a', newline='') as file:
+        writer = open_results_writer(file)
+        gpu_backend = get_gpu_backend()
+        store = ResultsStore(args.results_db)
+        run_id = store.start_run(vars(args))
+
+        def on_complete(job, returncode, sampler):
+            if returncode == 0 and on_success is not None:
+                on_success(job)
+            write_job_result(writer, store, run_id, output_file, approach, job, returncode, sampler)
+            file.flush()
+
+        estimates = PeakMemoryEstimates().load_store(store)
+        scheduler = Scheduler(args.cpu_slots, args.memory_budget, args.gpu_budget, estimates, args.sample_interval, gpu_backend, workers)
+        try:
+            scheduler.run(chains, on_complete)
+        finally:
+            if workers is not None:
+                workers.close()
+
+        if is_repeated(args):
+            summary_file = os.path.join(os.path.dirname(output_file), "trials", f"run_{run_id}.csv")
+            write_trial_summary(summarize_trials(store, run_id), summary_file)
+
+        gpu_backend.close()
+        store.close()
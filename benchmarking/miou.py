@@ -0,0 +1,149 @@
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from data_loading.labels import CLASS_LABELS, VALID_CLASS_IDS
+
+LABEL_EXTENSIONS = (".png", ".npy")
+
+def class_lookup(valid_class_ids, max_id=None):
+    """
+    Lookup table from raw label ids (e.g. the 41 ScanNet ids) to contiguous class indices. Ids that are not
+    a valid class map to -1 (void).
+    """
+    max_id = max(valid_class_ids) if max_id is None else max_id
+    lookup = np.full(max_id + 1, -1, dtype=np.int64)
+    lookup[list(valid_class_ids)] = np.arange(len(valid_class_ids))
+    return lookup
+
+def read_label_image(path):
+    if path.endswith(".npy"):
+        return np.load(path)
+    with Image.open(path) as img:
+        return np.asarray(img)
+
+def map_labels(labels, lookup):
+    """
+    Maps raw ids through the lookup table, with ids outside of it becoming void.
+    """
+    labels = labels.astype(np.int64, copy=False)
+    inside = (labels >= 0) & (labels < len(lookup))
+    return np.where(inside, lookup[np.clip(labels, 0, len(lookup) - 1)], -1)
+
+def confusion_matrix(prediction, ground_truth, num_classes):
+    """
+    (num_classes, num_classes + 1) confusion matrix of one frame, rows ground truth and columns prediction.
+    Void ground-truth pixels are skipped, void predictions on valid pixels count in the last column.
+    """
+    valid = ground_truth >= 0
+    gt = ground_truth[valid]
+    pred = prediction[valid]
+    pred = np.where(pred >= 0, pred, num_classes)
+    counts = np.bincount(gt * (num_classes + 1) + pred, minlength=num_classes * (num_classes + 1))
+    return counts.reshape(num_classes, num_classes + 1)
+
+def _frame_confusion(job):
+    prediction_path, ground_truth_path, pred_lookup, gt_lookup = job
+    ground_truth = read_label_image(ground_truth_path)
+    prediction = read_label_image(prediction_path)
+    if prediction.shape != ground_truth.shape:
+        # Renders are often made at a downscaled resolution, compare at the resolution of the ground truth.
+        # Nearest neighbour by pixel centres, in numpy since PIL has no mode for int64 .npy label maps
+        (h, w), (H, W) = prediction.shape, ground_truth.shape
+        prediction = prediction[((2 * np.arange(H) + 1) * h // (2 * H))[:, None], (2 * np.arange(W) + 1) * w // (2 * W)]
+    return confusion_matrix(map_labels(prediction, pred_lookup), map_labels(ground_truth, gt_lookup), len(gt_lookup[gt_lookup >= 0]))
+
+def pair_frames(prediction_dir, ground_truth_dir):
+    """
+    Pairs prediction and ground-truth label images by file name without extension.
+    """
+    def stems(folder):
+        return {os.path.splitext(f)[0]: os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(LABEL_EXTENSIONS)}
+
+    predictions, ground_truths = stems(prediction_dir), stems(ground_truth_dir)
+    missing = len(ground_truths.keys() - predictions.keys())
+    if missing:
+        print(f"Warning: {missing} ground-truth frames in {ground_truth_dir} have no prediction and are skipped.")
+    return [(predictions[s], ground_truths[s]) for s in sorted(ground_truths.keys() & predictions.keys())]
+
+def accumulate(pairs, gt_lookup, pred_lookup=None, workers=None, chunksize=8):
+    """
+    Sums the confusion matrices of all (prediction, ground truth) frame pairs on a process pool. Frames are
+    read by the workers and only their small confusion matrices are returned, so memory stays constant in the
+    number of frames.
+    """
+    pred_lookup = gt_lookup if pred_lookup is None else pred_lookup
+    num_classes = int((gt_lookup >= 0).sum())
+    total = np.zeros((num_classes, num_classes + 1), dtype=np.int64)
+    jobs = ((prediction, ground_truth, pred_lookup, gt_lookup) for prediction, ground_truth in pairs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for matrix in pool.map(_frame_confusion, jobs, chunksize=chunksize):
+            total += matrix
+    return total
+
+def scores(confusion, class_labels=CLASS_LABELS):
+    """
+    Per-class IoU, mIoU over the classes present in ground truth or prediction, pixel accuracy and mean
+    class accuracy of a confusion matrix from accumulate.
+    """
+    num_classes = confusion.shape[0]
+    true_positives = np.diag(confusion[:, :num_classes]).astype(np.float64)
+    ground_truth = confusion.sum(axis=1)
+    predicted = confusion[:, :num_classes].sum(axis=0)
+    union = ground_truth + predicted - true_positives
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        iou = np.where(union > 0, true_positives / union, np.nan)
+        class_accuracy = np.where(ground_truth > 0, true_positives / ground_truth, np.nan)
+
+    return {
+        "iou": {label: (None if np.isnan(v) else float(v)) for label, v in zip(class_labels, iou)},
+        "miou": float(np.nanmean(iou)) if np.any(union > 0) else None,
+        "accuracy": float(true_positives.sum() / ground_truth.sum()) if ground_truth.sum() else None,
+        "mean_class_accuracy": float(np.nanmean(class_accuracy)) if np.any(ground_truth > 0) else None,
+        "pixels": int(ground_truth.sum()),
+    }
+
+def evaluate(prediction_dir, ground_truth_dir, valid_class_ids=VALID_CLASS_IDS, class_labels=CLASS_LABELS,
+             predictions_are_indices=False, workers=None):
+    """
+    Evaluates a folder of predicted label images against ground truth. Ground-truth ids are mapped to
+    classes through valid_class_ids; predictions too, unless they already hold class indices.
+    """
+    gt_lookup = class_lookup(valid_class_ids)
+    pred_lookup = np.arange(len(valid_class_ids)) if predictions_are_indices else gt_lookup
+    pairs = pair_frames(prediction_dir, ground_truth_dir)
+    result = scores(accumulate(pairs, gt_lookup, pred_lookup, workers), class_labels)
+    result["frames"] = len(pairs)
+    return result
+
+def main():
+    """
+    Compute per-class IoU, mIoU and accuracy of rendered label images.
+
+    Usage:
+        python -m benchmarking.miou <prediction_dir> <ground_truth_dir> [--indices] [--output results.json]
+    """
+    parser = argparse.ArgumentParser(description="Evaluate rendered semantic label images against ground truth.")
+    parser.add_argument('prediction_dir', help="Folder of predicted label images (.png or .npy).")
+    parser.add_argument('ground_truth_dir', help="Folder of ground-truth label images with matching file names.")
+    parser.add_argument('--indices', action='store_true', help="Predictions hold class indices 0..19 instead of ScanNet ids.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes.")
+    parser.add_argument('--output', default=None, help="Write the scores as JSON.")
+    args = parser.parse_args()
+
+    result = evaluate(args.prediction_dir, args.ground_truth_dir, predictions_are_indices=args.indices, workers=args.workers)
+
+    for label, iou in result["iou"].items():
+        print(f"{label:<16} {'-' if iou is None else f'{iou:.4f}'}")
+    print(f"mIoU: {result['miou'] or 0:.4f}, Accuracy: {result['accuracy'] or 0:.4f}, "
+          f"Mean class accuracy: {result['mean_class_accuracy'] or 0:.4f} over {result['frames']} frames")
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=4)
+
+if __name__ == "__main__":
+    main()
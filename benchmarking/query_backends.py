@@ -0,0 +1,164 @@
+import os
+import re
+import zlib
+import numpy as np
+from numpy.lib import recfunctions
+from benchmarking.text_embeddings import DEFAULT_CACHE, TextEmbeddingCache, open_clip_encoder
+from data_loading.splat_ply import map_vertices
+
+# Per-point feature properties in PLY files, e.g. f_0 ... f_31 of a SAGA contrastive feature point cloud
+FEATURE_PROPERTY = re.compile(r"(?:f|point_feature)_(\d+)")
+
+def normalize(x, axis=-1, eps=1e-8):
+    return x / (np.linalg.norm(x, axis=axis, keepdims=True) + eps)
+
+def load_point_features(path):
+    """
+    Loads per-point features as an (N, D) array from a .npy file (memory-mapped) or from the numbered
+    feature properties of a binary PLY vertex element (memory-mapped, copied once into the result).
+    """
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+
+    vertices = map_vertices(path)
+    columns = sorted((int(m.group(1)), name) for name in vertices.dtype.names if (m := FEATURE_PROPERTY.fullmatch(name)))
+    if not columns:
+        raise ValueError(f"{path} has no per-point feature properties")
+    return recfunctions.structured_to_unstructured(vertices[[name for _, name in columns]], dtype=np.float32)
+
+def index_counts(index, queries, threshold, nprobe):
+    """
+    Segments through a feature index instead of scanning every point: the number of points above the
+    threshold among the probed lists.
+    """
+    return np.array([len(ids) for ids in index.radius(queries, threshold, nprobe)])
+
+def load_scale_gate(path):
+    """
+    Loads the SAGA scale gate (Linear(1, D) followed by a sigmoid) as weight and bias arrays.
+    """
+    import torch
+    state = torch.load(path, map_location="cpu")
+    return state["0.weight"][:, 0].numpy(), state["0.bias"].numpy()
+
+class SyntheticBackend:
+    """
+    Random unit-length per-point features on the CPU, so the query benchmark runs without a trained scene
+    or a GPU. Text prompts are mapped to deterministic random embeddings of the same dimension.
+    """
+    name = "synthetic"
+    index = None
+    nprobe = 8
+
+    def __init__(self, num_points=1_000_000, feature_dim=32, seed=0):
+        self.num_points = num_points
+        self.feature_dim = feature_dim
+        self.seed = seed
+
+    def feature_array(self):
+        return self.features
+
+    def load(self):
+        rng = np.random.default_rng(self.seed)
+        self.features = normalize(rng.standard_normal((self.num_points, self.feature_dim), dtype=np.float32))
+        return self
+
+    def encode_text(self, texts):
+        return np.stack([
+            normalize(np.random.default_rng(zlib.crc32(text.encode())).standard_normal(self.feature_dim, dtype=np.float32))
+            for text in texts
+        ])
+
+    def click_embedding(self, clicks):
+        """
+        Returns one query per click set, the normalized mean feature of the clicked points.
+        """
+        return normalize(np.stack([self.features[list(indices)].mean(axis=0) for indices in clicks]))
+
+    def segment(self, queries, threshold):
+        """
+        Returns the number of points whose cosine similarity to each query exceeds the threshold.
+        """
+        if self.index is not None:
+            return index_counts(self.index, queries, threshold, self.nprobe)
+        return (self.features @ queries.T > threshold).sum(axis=0)
+
+    def synchronize(self):
+        pass
+
+class FeatureBackend:
+    """
+    Per-point features of a trained scene, held on a torch device.
+
+    Args:
+        features_path: PLY with per-point feature properties or (N, D) .npy file.
+        scale_gate_path: Optional SAGA scale_gate.pt; features are gated at the given scale.
+        scale: Segmentation scale for the scale gate.
+        clip_path: Optional open_clip checkpoint used to encode text prompts. Text prompts need features
+            in the CLIP embedding space. Embeddings go through a TextEmbeddingCache, so the text model is
+            only loaded for texts that were never encoded before.
+        clip_model: open_clip architecture of the checkpoint.
+        device: torch device, e.g. cuda or cpu.
+        template: Prompt template of the text embeddings.
+        text_cache: SQLite file of the text-embedding cache.
+        preload: Names of label sets whose embeddings are loaded with the features.
+    """
+    name = "features"
+    index = None
+    nprobe = 8
+
+    def __init__(self, features_path, scale_gate_path=None, scale=1.0, clip_path=None, clip_model="ViT-B-16", device="cuda",
+                 template="{}", text_cache=DEFAULT_CACHE, preload=()):
+        self.features_path = features_path
+        self.scale_gate_path = scale_gate_path
+        self.scale = scale
+        self.clip_path = clip_path
+        self.clip_model = clip_model
+        self.device = device
+        self.template = template
+        self.text_cache_path = text_cache
+        self.preload = preload
+        self.text_cache = None
+
+    def load(self):
+        import torch
+        self.torch = torch
+
+        features = np.asarray(load_point_features(self.features_path), dtype=np.float32)
+        if self.scale_gate_path is not None:
+            weight, bias = load_scale_gate(self.scale_gate_path)
+            features = features * (1.0 / (1.0 + np.exp(-(weight * self.scale + bias))))
+        self.features = torch.from_numpy(normalize(features)).to(self.device)
+        self.num_points, self.feature_dim = self.features.shape
+
+        if self.clip_path is not None:
+            encoder = open_clip_encoder(self.clip_path, self.clip_model, self.device)
+            self.text_cache = TextEmbeddingCache(encoder, self.clip_path, self.template, self.text_cache_path)
+            self.text_cache.preload(self.preload)
+        self.synchronize()
+        return self
+
+    def encode_text(self, texts):
+        if self.text_cache is None:
+            raise ValueError("Text prompts need --clip_path")
+        embeddings = self.text_cache.get(texts)
+        if embeddings.shape[1] != self.feature_dim:
+            raise ValueError(f"Text embeddings have dimension {embeddings.shape[1]}, the point features {self.feature_dim}")
+        return self.torch.from_numpy(embeddings).to(self.device)
+
+    def click_embedding(self, clicks):
+        queries = self.torch.stack([self.features[list(indices)].mean(dim=0) for indices in clicks])
+        return self.torch.nn.functional.normalize(queries, dim=-1)
+
+    def feature_array(self):
+        return self.features.cpu().numpy()
+
+    def segment(self, queries, threshold):
+        if self.index is not None:
+            return index_counts(self.index, queries.cpu().numpy(), threshold, self.nprobe)
+        with self.torch.no_grad():
+            return (self.features @ queries.T > threshold).sum(dim=0).cpu().numpy()
+
+    def synchronize(self):
+        if str(self.device).startswith("cuda"):
+            self.torch.cuda.synchronize()
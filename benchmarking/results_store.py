@@ -0,0 +1,265 @@
+import os
+import sys
+import csv
+import json
+import time
+import socket
+import statistics
+import sqlite3
+import argparse
+import subprocess
+
+DEFAULT_DB = os.path.join("results", "benchmarks", "benchmarks.db")
+
+METRICS = [
+    'time', 'avg_gpu_usage', 'max_gpu_usage', 'avg_cpu_memory_usage', 'max_cpu_memory_usage',
+    'avg_combined_usage', 'max_combined_usage', 'cpu_time', 'io_read', 'io_write', 'time_per_frame',
+    'model_load_time', 'compute_time'
+]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at REAL NOT NULL,
+    git_commit TEXT,
+    host TEXT,
+    command TEXT,
+    arguments TEXT
+);
+CREATE TABLE IF NOT EXISTS stages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    approach TEXT NOT NULL,
+    script TEXT NOT NULL,
+    scene TEXT NOT NULL,
+    returncode INTEGER,
+    image_count INTEGER,
+    image_width INTEGER,
+    image_height INTEGER,
+    scene_size REAL,
+    {', '.join(f'{m} REAL' for m in METRICS)},
+    trial INTEGER,
+    warmup INTEGER DEFAULT 0,
+    cache_state TEXT,
+    frame_count INTEGER,
+    render_views TEXT
+);
+CREATE TABLE IF NOT EXISTS samples (
+    stage_id INTEGER NOT NULL REFERENCES stages(id),
+    time REAL,
+    rss INTEGER,
+    gpu INTEGER,
+    cpu_time REAL,
+    io_read INTEGER,
+    io_write INTEGER,
+    num_processes INTEGER
+);
+CREATE INDEX IF NOT EXISTS stages_run ON stages(run_id);
+CREATE INDEX IF NOT EXISTS samples_stage ON samples(stage_id);
+"""
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class ResultsStore:
+    """
+    SQLite store of benchmark runs, their stages (one row per scene and script) and the sampled time
+    series of every stage.
+    """
+
+    def __init__(self, path=DEFAULT_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        # Databases created by older versions lack the trial, rendering and warm worker columns
+        columns = {row['name'] for row in self.connection.execute("PRAGMA table_info(stages)")}
+        for column, definition in [('trial', 'INTEGER'), ('warmup', 'INTEGER DEFAULT 0'), ('cache_state', 'TEXT'),
+                                   ('frame_count', 'INTEGER'), ('time_per_frame', 'REAL'), ('model_load_time', 'REAL'),
+                                   ('compute_time', 'REAL'), ('render_views', 'TEXT')]:
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE stages ADD COLUMN {column} {definition}")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def start_run(self, arguments=None, command=None, started_at=None, git_commit=None, host=None):
+        cursor = self.connection.execute(
+            "INSERT INTO runs (started_at, git_commit, host, command, arguments) VALUES (?, ?, ?, ?, ?)",
+            (started_at if started_at is not None else time.time(),
+             git_commit if git_commit is not None else get_git_commit(),
+             host if host is not None else socket.gethostname(),
+             command if command is not None else " ".join(sys.argv),
+             json.dumps(arguments if arguments is not None else {})))
+        self.connection.commit()
+        return cursor.lastrowid
+
+    def record_stage(self, run_id, approach, script, scene, summary, image_count=None, image_width=None,
+                     image_height=None, scene_size=None, returncode=None, series=(), trial=None, warmup=False, cache_state=None,
+                     frame_count=None, render_views=None):
+        """
+        Stores the summary of one stage and its sampled time series (rows as in ResourceSampler.series).
+        render_views names the view set a rendering stage rendered, e.g. SAGA's test views.
+        """
+        columns = ['run_id', 'approach', 'script', 'scene', 'returncode', 'image_count', 'image_width', 'image_height', 'scene_size',
+                   'trial', 'warmup', 'cache_state', 'frame_count', 'render_views'] + METRICS
+        values = [run_id, approach, script, scene, returncode, image_count, image_width, image_height, scene_size,
+                  trial, int(warmup), cache_state, frame_count, render_views] + [summary.get(m) for m in METRICS]
+        cursor = self.connection.execute(
+            f"INSERT INTO stages ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values)
+        stage_id = cursor.lastrowid
+        self.connection.executemany("INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(stage_id,) + tuple(s) for s in series])
+        self.connection.commit()
+        return stage_id
+
+    def runs(self):
+        return self.connection.execute(
+            "SELECT runs.*, COUNT(stages.id) AS num_stages FROM runs LEFT JOIN stages ON stages.run_id = runs.id "
+            "GROUP BY runs.id ORDER BY runs.id").fetchall()
+
+    def stages(self, run_id):
+        return self.connection.execute("SELECT * FROM stages WHERE run_id = ? ORDER BY id", (run_id,)).fetchall()
+
+    @staticmethod
+    def stage_key(stage):
+        # Stages rendering different view sets are measured separately, their times are not comparable
+        return stage['approach'], stage['script'], stage['scene'], stage['cache_state'], stage['render_views']
+
+    def measurements(self, run_id, metric):
+        """
+        Returns the values of a metric per (approach, script, scene, cache state, render views), ignoring
+        warmup trials.
+        """
+        values = {}
+        for s in self.stages(run_id):
+            if s['warmup'] or s[metric] is None:
+                continue
+            values.setdefault(self.stage_key(s), []).append(s[metric])
+        return values
+
+    def diff(self, base_run, new_run, metrics=('time', 'max_cpu_memory_usage', 'max_gpu_usage')):
+        """
+        Compares two runs per (approach, script, scene, cache state, render views). Stages measured in several trials are
+        compared by their median.
+
+        Returns:
+            A list of (key, metric, base value, new value, relative change) tuples for the stages of both runs.
+            Values a run did not measure (e.g. no GPU backend) and their change are None.
+        """
+        def stage_keys(run_id):
+            return {self.stage_key(s) for s in self.stages(run_id) if not s['warmup']}
+
+        keys = sorted(stage_keys(base_run) & stage_keys(new_run), key=str)
+        rows = []
+        for metric in metrics:
+            base = self.measurements(base_run, metric)
+            new = self.measurements(new_run, metric)
+            for key in keys:
+                old_value = statistics.median(base[key]) if key in base else None
+                new_value = statistics.median(new[key]) if key in new else None
+                if old_value is None or new_value is None:
+                    change = None
+                else:
+                    change = (new_value - old_value) / old_value if old_value else 0.0
+                rows.append((key, metric, old_value, new_value, change))
+        rows.sort(key=lambda row: str(row[0]))
+        return rows
+
+    def import_csv(self, csv_path):
+        """
+        Imports a results CSV written by the benchmark scripts as a single run.
+        """
+        run_id = self.start_run(arguments={"imported_from": csv_path}, command=f"import {csv_path}",
+                                started_at=os.path.getmtime(csv_path), git_commit="", host="")
+        count = 0
+        with open(csv_path, newline='') as file:
+            for row in csv.DictReader(file):
+                def number(column, cast=float):
+                    try:
+                        return cast(float(row[column]))
+                    except (KeyError, TypeError, ValueError):
+                        return None
+                summary = {m: number(m) for m in METRICS}
+                series = []
+                series_path = row.get('timeseries')
+                if series_path and os.path.isfile(series_path):
+                    with open(series_path, newline='') as f:
+                        series = [tuple(float(v) for v in r) for r in list(csv.reader(f))[1:]]
+                self.record_stage(run_id, row['approach'], row['script'], row['scene'], summary,
+                                  number('image_count', int), number('image_width', int), number('image_height', int),
+                                  number('scene_size'), series=series, trial=number('trial', int),
+                                  warmup=bool(number('warmup', int)), cache_state=row.get('cache_state') or None,
+                                  frame_count=number('frame_count', int), render_views=row.get('render_views') or None)
+                count += 1
+        print(f"Imported {count} stages from {csv_path} as run {run_id}.")
+        return run_id
+
+def format_value(value, spec):
+    """
+    Formats a metric that may be NULL, shown as '-' aligned like the formatted values.
+    """
+    if value is None:
+        width = "".join(c for c in spec.split('.')[0] if c.isdigit())
+        return f"{'-':>{width or 1}}"
+    return f"{value:{spec}}"
+
+def main():
+    """
+    Inspect and compare benchmark runs.
+
+    Usage:
+        python -m benchmarking.results_store list
+        python -m benchmarking.results_store show <run>
+        python -m benchmarking.results_store diff <base_run> <new_run> [--threshold 0.05]
+        python -m benchmarking.results_store import-csv results/benchmarks/train_benchmarks.csv
+    """
+    parser = argparse.ArgumentParser(description="Inspect and compare benchmark runs.")
+    parser.add_argument('--db', default=DEFAULT_DB, help="Path to the results database.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="List all runs.")
+    show = subparsers.add_parser('show', help="Show the stages of a run.")
+    show.add_argument('run', type=int)
+    diff = subparsers.add_parser('diff', help="Compare two runs per scene and stage.")
+    diff.add_argument('base_run', type=int)
+    diff.add_argument('new_run', type=int)
+    diff.add_argument('--threshold', type=float, default=0.05, help="Relative increase flagged as regression.")
+    import_csv = subparsers.add_parser('import-csv', help="Import a results CSV as a run.")
+    import_csv.add_argument('csv_path')
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db)
+
+    if args.command == 'list':
+        for run in store.runs():
+            started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['started_at']))
+            print(f"{run['id']:>4}  {started}  {(run['git_commit'] or '-')[:10]:<10}  {run['host'] or '-':<16}  "
+                  f"{run['num_stages']:>4} stages  {run['command']}")
+    elif args.command == 'show':
+        for stage in store.stages(args.run):
+            print(f"{stage['approach']:<10} {stage['script']:<45} {stage['scene']:<30} {stage['render_views'] or '-':<20} {format_value(stage['time'], '>10.2f')} s  "
+                  f"max CPU {format_value(stage['max_cpu_memory_usage'], '.2f')} GB  "
+                  f"max GPU {format_value(stage['max_gpu_usage'], '.2f')} GB")
+    elif args.command == 'diff':
+        regressions = 0
+        for (approach, script, scene, cache_state, render_views), metric, old_value, new_value, change in store.diff(args.base_run, args.new_run):
+            flag = "REGRESSION" if change is not None and change > args.threshold else ""
+            regressions += bool(flag)
+            print(f"{approach:<10} {script:<45} {scene:<30} {render_views or '-':<20} {metric:<22} {format_value(old_value, '>10.2f')} -> "
+                  f"{format_value(new_value, '>10.2f')} ({format_value(change, '+.1%')}) {flag}")
+        print(f"{regressions} regressions above {args.threshold:.0%}.")
+        store.close()
+        sys.exit(1 if regressions else 0)
+    elif args.command == 'import-csv':
+        store.import_csv(args.csv_path)
+
+    store.close()
+
+if __name__ == "__main__":
+    main()
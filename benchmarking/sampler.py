@@ -0,0 +1,192 @@
+import os
+import csv
+import time
+import threading
+import subprocess
+import psutil
+
+DEFAULT_INTERVAL = 0.1  # seconds between two samples
+SERIES_HEADER = ['time', 'rss', 'gpu', 'cpu_time', 'io_read', 'io_write', 'num_processes']
+
+class NoGpuBackend:
+    """
+    GPU backend used when NVML is not available (e.g. CPU-only nodes). Always reports zero usage.
+    """
+    name = "none"
+
+    def usage(self, pids):
+        return 0
+
+    def close(self):
+        pass
+
+class NvmlGpuBackend:
+    """
+    Reads the GPU memory used by a set of processes over all visible devices.
+    """
+    name = "nvml"
+
+    def __init__(self):
+        import pynvml
+        pynvml.nvmlInit()
+        self.nvml = pynvml
+        self.handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+
+    def usage(self, pids):
+        used = 0
+        for handle in self.handles:
+            for query in (self.nvml.nvmlDeviceGetComputeRunningProcesses, self.nvml.nvmlDeviceGetGraphicsRunningProcesses):
+                try:
+                    processes = query(handle)
+                except self.nvml.NVMLError:
+                    continue
+                for process in processes:
+                    if process.pid in pids and process.usedGpuMemory:
+                        used += process.usedGpuMemory
+        return used
+
+    def close(self):
+        self.nvml.nvmlShutdown()
+
+def get_gpu_backend(use_gpu=True):
+    """
+    Returns the NVML backend if pynvml is installed and a driver is present, otherwise the no-GPU backend.
+    """
+    if not use_gpu:
+        return NoGpuBackend()
+    try:
+        return NvmlGpuBackend()
+    except Exception as e:
+        print(f"NVML not available ({e}), GPU memory will not be sampled.")
+        return NoGpuBackend()
+
+class ResourceSampler:
+    """
+    Samples RSS, CPU time, /proc I/O bytes and GPU memory of a process and all of its children on a
+    background thread.
+
+    CPU time and I/O bytes are cumulative counters, so the last value seen for every process is kept
+    and children that exited between two samples are still accounted for. With relative, they are reported
+    from the first sample on, for processes that were already running before (e.g. a warm worker).
+
+    Jobs run in a warm worker set model_load_time and compute_time, the split of their time into loading
+    models and the actual work.
+    """
+
+    def __init__(self, pid, interval=DEFAULT_INTERVAL, gpu_backend=None, relative=False):
+        self.pid = pid
+        self.interval = interval
+        self.gpu_backend = gpu_backend if gpu_backend is not None else NoGpuBackend()
+        self.series = []
+        self.elapsed = 0.0
+        self.model_load_time = None
+        self.compute_time = None
+        self._offset = None if relative else (0.0, 0, 0)
+        self._counters = {}
+        self._processes = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.start_time = time.time()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.time() - self.start_time
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def _process_tree(self):
+        try:
+            root = self._processes.get(self.pid) or psutil.Process(self.pid)
+            tree = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return []
+        # Reuse Process objects so psutil can detect pid reuse
+        self._processes = {process.pid: self._processes.get(process.pid, process) for process in tree}
+        return list(self._processes.values())
+
+    def sample(self):
+        rss = 0
+        pids = set()
+        for process in self._process_tree():
+            try:
+                with process.oneshot():
+                    rss += process.memory_info().rss
+                    cpu = process.cpu_times()
+                    try:
+                        io = process.io_counters()
+                        io_read, io_write = io.read_bytes, io.write_bytes
+                    except (psutil.AccessDenied, AttributeError):
+                        io_read, io_write = 0, 0
+            except psutil.Error:
+                continue
+            pids.add(process.pid)
+            self._counters[process.pid] = (cpu.user + cpu.system, io_read, io_write)
+
+        if not pids:
+            return
+
+        gpu = self.gpu_backend.usage(pids)
+        cpu_time = sum(c[0] for c in self._counters.values())
+        io_read = sum(c[1] for c in self._counters.values())
+        io_write = sum(c[2] for c in self._counters.values())
+        if self._offset is None:
+            self._offset = (cpu_time, io_read, io_write)
+        cpu_time, io_read, io_write = cpu_time - self._offset[0], io_read - self._offset[1], io_write - self._offset[2]
+        self.series.append((time.time() - self.start_time, rss, gpu, cpu_time, io_read, io_write, len(pids)))
+
+    def summary(self):
+        """
+        Returns the summary of the sampled series. Memory and I/O values are in gigabytes, times in seconds.
+        """
+        gb = 1024 ** 3
+        rss = [s[1] / gb for s in self.series] or [0.0]
+        gpu = [s[2] / gb for s in self.series] or [0.0]
+        combined = [r + g for r, g in zip(rss, gpu)]
+        last = self.series[-1] if self.series else (0, 0, 0, 0.0, 0, 0, 0)
+
+        return {
+            'time': self.elapsed,
+            'avg_gpu_usage': sum(gpu) / len(gpu),
+            'max_gpu_usage': max(gpu),
+            'avg_cpu_memory_usage': sum(rss) / len(rss),
+            'max_cpu_memory_usage': max(rss),
+            'avg_combined_usage': sum(combined) / len(combined),
+            'max_combined_usage': max(combined),
+            'cpu_time': last[3],
+            'io_read': last[4] / gb,
+            'io_write': last[5] / gb,
+            'samples': len(self.series),
+            'model_load_time': self.model_load_time,
+            'compute_time': self.compute_time,
+        }
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(SERIES_HEADER)
+            writer.writerows(self.series)
+
+def run_sampled(command, interval=DEFAULT_INTERVAL, gpu_backend=None, **popen_kwargs):
+    """
+    Runs a command and samples its process tree until it exits.
+
+    Returns:
+        The return code of the command and the stopped sampler.
+    """
+    start_time = time.time()
+    process = subprocess.Popen(command, **popen_kwargs)
+    sampler = ResourceSampler(process.pid, interval, gpu_backend).start()
+    returncode = process.wait()
+    sampler.stop()
+    sampler.elapsed = time.time() - start_time
+    return returncode, sampler
@@ -0,0 +1,174 @@
+import os
+import csv
+import queue
+import threading
+import traceback
+import psutil
+from benchmarking.sampler import DEFAULT_INTERVAL, run_sampled
+
+class Job:
+    """
+    A single benchmarked command, e.g. one SAGA stage of one scene.
+
+    Args:
+        scene: Name of the scene the job belongs to.
+        script: Name of the script, used as key for the recorded peak memory.
+        command: Command passed to subprocess.Popen.
+        cpu_slots: Number of CPU slots the job occupies while running.
+        shell: Whether to run the command through the shell.
+        metadata: Arbitrary data handed back to the completion callback.
+        prepare: Optional callable run right before the command, outside of the measurement.
+        warm: Whether a `python <script>` command may run in a warm worker of the scheduler instead of a
+            new process.
+    """
+
+    def __init__(self, scene, script, command, cpu_slots=1, shell=False, metadata=None, prepare=None, warm=False):
+        self.scene = scene
+        self.script = script
+        self.command = command
+        self.cpu_slots = cpu_slots
+        self.shell = shell
+        self.metadata = metadata if metadata is not None else {}
+        self.prepare = prepare
+        self.warm = warm
+
+class PeakMemoryEstimates:
+    """
+    Peak host and GPU memory (in GB) recorded for each (script, scene) pair. Unknown scenes fall back to
+    the largest peak recorded for the same script, unknown scripts to the given defaults.
+    """
+
+    def __init__(self, default_memory=4.0, default_gpu=0.0):
+        self.default_memory = default_memory
+        self.default_gpu = default_gpu
+        self.peaks = {}
+
+    def load_csv(self, path):
+        if not os.path.isfile(path):
+            return self
+        with open(path, newline='') as file:
+            for row in csv.DictReader(file):
+                try:
+                    self.record(row['script'], row['scene'], float(row['max_cpu_memory_usage']), float(row['max_gpu_usage']))
+                except (KeyError, TypeError, ValueError):
+                    continue
+        return self
+
+    def load_store(self, store):
+        for stage in store.connection.execute("SELECT script, scene, max_cpu_memory_usage, max_gpu_usage FROM stages ORDER BY id"):
+            if stage['max_cpu_memory_usage'] is not None:
+                self.record(stage['script'], stage['scene'], stage['max_cpu_memory_usage'], stage['max_gpu_usage'] or 0.0)
+        return self
+
+    def record(self, script, scene, memory, gpu):
+        # Later measurements replace earlier ones so a changed scene is not stuck with an old peak
+        self.peaks[(script, scene)] = (memory, gpu)
+
+    def estimate(self, script, scene):
+        if (script, scene) in self.peaks:
+            return self.peaks[(script, scene)]
+        same_script = [peak for (s, _), peak in self.peaks.items() if s == script]
+        if same_script:
+            return max(p[0] for p in same_script), max(p[1] for p in same_script)
+        return self.default_memory, self.default_gpu
+
+class Scheduler:
+    """
+    Runs chains of jobs concurrently under CPU-slot and memory budgets.
+
+    Jobs within a chain run strictly in order, and a failing job cancels the rest of its chain. Separate
+    chains (usually one per scene) run in parallel, except that chains of the same scene run one after
+    another in the order they were given, e.g. repeated trials. A job is only admitted while the sum of the estimated
+    peaks of all running jobs stays within the budgets; if nothing is running the next job is always
+    admitted so oversized jobs still make progress. Every job is sampled on its own process tree, so
+    measurements of concurrent jobs don't mix.
+
+    Args:
+        cpu_slots: Total number of CPU slots.
+        memory_budget: Host memory budget in GB. Defaults to 90% of the currently available memory.
+        gpu_budget: GPU memory budget in GB. None disables the GPU check.
+        estimates: PeakMemoryEstimates used for admission; updated with every finished job.
+        interval: Sampling interval passed to the resource sampler.
+        gpu_backend: GPU backend passed to the resource sampler.
+        workers: Optional benchmarking.warm_worker.WorkerPool running the warm jobs.
+    """
+
+    def __init__(self, cpu_slots=1, memory_budget=None, gpu_budget=None, estimates=None, interval=DEFAULT_INTERVAL, gpu_backend=None,
+                 workers=None):
+        self.cpu_slots = cpu_slots
+        self.memory_budget = memory_budget if memory_budget is not None else 0.9 * psutil.virtual_memory().available / 1024 ** 3
+        self.gpu_budget = gpu_budget
+        self.estimates = estimates if estimates is not None else PeakMemoryEstimates()
+        self.interval = interval
+        self.gpu_backend = gpu_backend
+        self.workers = workers
+
+    def _fits(self, job, running):
+        if not running:
+            return True
+        memory, gpu = self.estimates.estimate(job.script, job.scene)
+        used_slots = sum(j.cpu_slots for j in running)
+        used_memory = sum(self.estimates.estimate(j.script, j.scene)[0] for j in running)
+        used_gpu = sum(self.estimates.estimate(j.script, j.scene)[1] for j in running)
+        if used_slots + job.cpu_slots > self.cpu_slots:
+            return False
+        if used_memory + memory > self.memory_budget:
+            return False
+        if self.gpu_budget is not None and used_gpu + gpu > self.gpu_budget:
+            return False
+        return True
+
+    def _work(self, job, done):
+        # run() waits for every admitted job, so a result is posted even if preparing or sampling raises
+        returncode, sampler = -1, None
+        try:
+            if job.prepare is not None:
+                job.prepare()
+            if job.warm and self.workers is not None:
+                returncode, sampler = self.workers.run_sampled(job.command, self.interval, self.gpu_backend, shell=job.shell)
+            else:
+                returncode, sampler = run_sampled(job.command, self.interval, self.gpu_backend, shell=job.shell)
+        except OSError as e:
+            print(f"Failed to start {job.script} for scene {job.scene}: {e}")
+        except Exception:
+            print(f"Failed to run {job.script} for scene {job.scene}:")
+            traceback.print_exc()
+        finally:
+            done.put((job, returncode, sampler))
+
+    def run(self, chains, on_complete):
+        """
+        Runs all chains and calls on_complete(job, returncode, sampler) on the calling thread for every
+        finished job.
+        """
+        pending = {i: list(chain) for i, chain in enumerate(chains) if chain}
+        busy = {}  # chain index -> running job
+        scene_of = {i: chain[0].scene for i, chain in pending.items()}
+        done = queue.Queue()
+
+        while pending or busy:
+            # Admit the heads of idle chains in order until the budgets are exhausted
+            for i, chain in list(pending.items()):
+                if i in busy:
+                    continue
+                if any(k < i and (k in busy or k in pending) and scene_of[k] == scene_of[i] for k in scene_of):
+                    continue
+                job = chain[0]
+                if not self._fits(job, list(busy.values())):
+                    continue
+                busy[i] = chain.pop(0)
+                if not chain:
+                    del pending[i]
+                threading.Thread(target=self._work, args=(job, done), daemon=True).start()
+
+            job, returncode, sampler = done.get()
+            i = next(i for i, j in busy.items() if j is job)
+            del busy[i]
+
+            if sampler is not None:
+                summary = sampler.summary()
+                self.estimates.record(job.script, job.scene, summary['max_cpu_memory_usage'], summary['max_gpu_usage'])
+            if returncode != 0 and i in pending:
+                print(f"{job.script} failed for scene {job.scene}, skipping its remaining stages.")
+                del pending[i]
+            on_complete(job, returncode, sampler)
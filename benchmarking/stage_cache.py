@@ -0,0 +1,179 @@
+import os
+import json
+import shutil
+import hashlib
+from data_loading.scene_manifest import sha256_file
+
+class Stage:
+    """
+    A pipeline stage whose outputs are fully determined by its command, its input files and the stages it
+    depends on.
+
+    Args:
+        name: Short name of the stage, used for --force.
+        command: Command line of the stage.
+        inputs: Files or directories read by the stage (images, checkpoints, trained models).
+        outputs: Files or directories written by the stage.
+        deps: Names of the stages that have to run before this one.
+    """
+
+    def __init__(self, name, command, inputs, outputs, deps=()):
+        self.name = name
+        self.command = command
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.key = None
+
+class StageCache:
+    """
+    Content-addressed cache of stage outputs.
+
+    The key of a stage is a hash over its command line, the contents of its inputs and the keys of the
+    stages it depends on, so a change anywhere upstream invalidates everything downstream. File hashes
+    are memoized by (size, mtime) so unchanged multi-GB image folders are not re-read on every run.
+
+    Layout of the cache directory:
+        file_hashes.json    memoized file hashes
+        state.json          key of the outputs currently materialised at each output location
+        <key>/<i>           copy of the i-th output of the stage with this key
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hashes_file = os.path.join(cache_dir, "file_hashes.json")
+        self.state_file = os.path.join(cache_dir, "state.json")
+        self.file_hashes = self._load(self.hashes_file)
+        self.state = self._load(self.state_file)
+
+    @staticmethod
+    def _load(path):
+        if not os.path.isfile(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _dump(data, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def save(self):
+        self._dump(self.file_hashes, self.hashes_file)
+        self._dump(self.state, self.state_file)
+
+    def hash_file(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        cached = self.file_hashes.get(path)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = sha256_file(path)
+        self.file_hashes[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def hash_path(self, path):
+        h = hashlib.sha256()
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    fp = os.path.join(dirpath, name)
+                    h.update(os.path.relpath(fp, path).encode())
+                    h.update(self.hash_file(fp).encode())
+        elif os.path.isfile(path):
+            h.update(self.hash_file(path).encode())
+        else:
+            h.update(b"missing")
+        return h.hexdigest()
+
+    def compute_key(self, stage, dep_keys):
+        h = hashlib.sha256()
+        h.update(stage.command.encode())
+        for path in stage.inputs:
+            h.update(self.hash_path(path).encode())
+        for key in dep_keys:
+            h.update(key.encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def _location(stage):
+        return "|".join(os.path.abspath(p) for p in stage.outputs)
+
+    def is_materialised(self, stage):
+        return self.state.get(self._location(stage)) == stage.key and all(os.path.exists(p) for p in stage.outputs)
+
+    def has_entry(self, stage):
+        entry = os.path.join(self.cache_dir, stage.key)
+        return all(os.path.exists(os.path.join(entry, str(i))) for i in range(len(stage.outputs)))
+
+    @staticmethod
+    def _copy(src, dst):
+        if os.path.isdir(dst):
+            shutil.rmtree(dst)
+        elif os.path.exists(dst):
+            os.remove(dst)
+        os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+        if os.path.isdir(src):
+            shutil.copytree(src, dst)
+        else:
+            shutil.copy2(src, dst)
+
+    def restore(self, stage):
+        entry = os.path.join(self.cache_dir, stage.key)
+        for i, path in enumerate(stage.outputs):
+            self._copy(os.path.join(entry, str(i)), path)
+        self.state[self._location(stage)] = stage.key
+
+    def store(self, stage):
+        """
+        Records the outputs of a stage that just ran successfully and copies them into the cache, unless the
+        cache already holds an entry for its key (e.g. from an earlier trial of a repeated run).
+        """
+        missing = [p for p in stage.outputs if not os.path.exists(p)]
+        if missing:
+            print(f"Stage {stage.name} did not produce {', '.join(missing)}, not caching it.")
+            return
+        entry = os.path.join(self.cache_dir, stage.key)
+        if not self.has_entry(stage):
+            # Entries are renamed into place once complete, so an interrupted copy is never taken for one
+            partial = entry + ".part"
+            for path in (partial, entry):
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+            for i, path in enumerate(stage.outputs):
+                self._copy(path, os.path.join(partial, str(i)))
+            os.replace(partial, entry)
+        self.state[self._location(stage)] = stage.key
+        self.save()
+
+def plan_stages(stages, cache, force=()):
+    """
+    Computes the keys of a dependency-ordered list of stages and returns the stages that have to run.
+
+    Stages whose outputs are already materialised are skipped, stages found in the cache are restored.
+    Stages named in force, and every stage that depends on them, always run.
+    """
+    keys = {}
+    forced = set(force)
+    to_run = []
+
+    for stage in stages:
+        stage.key = cache.compute_key(stage, [keys[d] for d in stage.deps])
+        keys[stage.name] = stage.key
+        if "all" in forced or stage.name in forced or any(d in forced for d in stage.deps):
+            forced.add(stage.name)
+            to_run.append(stage)
+        elif cache.is_materialised(stage):
+            print(f"Stage {stage.name} is up to date, skipping it.")
+        elif cache.has_entry(stage):
+            print(f"Restoring stage {stage.name} from {cache.cache_dir}.")
+            cache.restore(stage)
+        else:
+            to_run.append(stage)
+
+    cache.save()
+    return to_run
@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import argparse
+from collections import OrderedDict
+import numpy as np
+from data_loading.labels import LABEL_SETS
+from data_loading.scene_manifest import sha256_file
+
+DEFAULT_CACHE = os.path.join("results", "text_embeddings.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha256 TEXT
+);
+CREATE TABLE IF NOT EXISTS embeddings (
+    checkpoint TEXT NOT NULL,
+    template TEXT NOT NULL,
+    text TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    PRIMARY KEY (checkpoint, template, text)
+);
+"""
+
+class TextEmbeddingCache:
+    """
+    Cache of text embeddings keyed by (checkpoint hash, prompt template, text).
+
+    Lookups go through an in-memory LRU first, then a SQLite store on disk. All misses of a lookup are
+    encoded together in a single call of the encoder, which is only invoked (and so the text model only
+    loaded) if something is missing.
+
+    Args:
+        encoder: Callable mapping a list of prompts to an (N, D) float array of normalized embeddings.
+        checkpoint_path: Checkpoint of the text model. Its content hash is memoized by size and mtime.
+        template: Prompt template with one {} for the text, e.g. "a photo of a {}.".
+        path: SQLite file of the on-disk store.
+        capacity: Number of embeddings kept in memory.
+    """
+
+    def __init__(self, encoder, checkpoint_path, template="{}", path=DEFAULT_CACHE, capacity=4096):
+        self.encoder = encoder
+        self.template = template
+        self.capacity = capacity
+        self.memory = OrderedDict()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.checkpoint = self._checkpoint_hash(checkpoint_path)
+        self.hits = self.disk_hits = self.misses = 0
+
+    def _checkpoint_hash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self.connection.execute("SELECT size, mtime_ns, sha256 FROM checkpoints WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return row[2]
+        digest = sha256_file(path)
+        self.connection.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)", (path, stat.st_size, stat.st_mtime_ns, digest))
+        self.connection.commit()
+        return digest
+
+    def close(self):
+        self.connection.close()
+
+    def _remember(self, text, embedding):
+        self.memory[text] = embedding
+        self.memory.move_to_end(text)
+        while len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def get(self, texts):
+        """
+        Returns the embeddings of the texts as an (N, D) float32 array, in order.
+        """
+        found = {}
+        for text in dict.fromkeys(texts):
+            if text in self.memory:
+                self.memory.move_to_end(text)
+                found[text] = self.memory[text]
+        self.hits += len(found)
+
+        missing = [text for text in dict.fromkeys(texts) if text not in found]
+        if missing:
+            rows = []
+            # Stay below SQLite's limit of host parameters per statement
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows += self.connection.execute(
+                    f"SELECT text, embedding FROM embeddings WHERE checkpoint = ? AND template = ? AND text IN ({', '.join('?' * len(chunk))})",
+                    [self.checkpoint, self.template] + chunk).fetchall()
+            for text, blob in rows:
+                found[text] = np.frombuffer(blob, dtype=np.float32)
+                self._remember(text, found[text])
+            self.disk_hits += len(rows)
+            missing = [text for text in missing if text not in found]
+
+        if missing:
+            embeddings = np.asarray(self.encoder([self.template.format(text) for text in missing]), dtype=np.float32)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                [(self.checkpoint, self.template, text, embedding.tobytes()) for text, embedding in zip(missing, embeddings)])
+            self.connection.commit()
+            for text, embedding in zip(missing, embeddings):
+                found[text] = embedding
+                self._remember(text, embedding)
+            self.misses += len(missing)
+
+        return np.stack([found[text] for text in texts])
+
+    def preload(self, label_sets=(), texts=()):
+        """
+        Loads the named label sets (see data_loading.labels.LABEL_SETS) and further texts, encoding whatever
+        is not stored yet in one batch.
+        """
+        texts = [text for name in label_sets for text in LABEL_SETS[name]] + list(texts)
+        if texts:
+            self.get(texts)
+        return len(texts)
+
+def open_clip_encoder(clip_path, clip_model="ViT-B-16", device="cuda"):
+    """
+    Returns an encoder for TextEmbeddingCache that loads the open_clip model on its first call.
+    """
+    model = {}
+
+    def encode(prompts):
+        import torch
+        import open_clip
+        if not model:
+            model["clip"], _, _ = open_clip.create_model_and_transforms(clip_model, pretrained=clip_path, device=device)
+            model["clip"].eval()
+            model["tokenizer"] = open_clip.get_tokenizer(clip_model)
+        with torch.no_grad():
+            embeddings = model["clip"].encode_text(model["tokenizer"](prompts).to(device)).float()
+        return torch.nn.functional.normalize(embeddings, dim=-1).cpu().numpy()
+
+    return encode
+
+if __name__ == "__main__":
+    """
+    Fill the text-embedding cache with label sets and prompts.
+
+    Usage:
+    python -m benchmarking.text_embeddings --clip_path <path_to_clip> --label_sets scannet replica [--prompts prompts.txt]
+    """
+    parser = argparse.ArgumentParser(description="Fill the text-embedding cache with label sets and prompts.")
+    parser.add_argument('--clip_path', required=True, help="open_clip checkpoint.")
+    parser.add_argument('--clip_model', default="ViT-B-16", help="open_clip architecture of the checkpoint.")
+    parser.add_argument('--device', default="cuda", help="torch device used for encoding.")
+    parser.add_argument('--template', default="{}", help="Prompt template, e.g. 'a photo of a {}.'")
+    parser.add_argument('--label_sets', nargs='*', default=list(LABEL_SETS), choices=list(LABEL_SETS), help="Label sets to preload.")
+    parser.add_argument('--prompts', default=None, help="Text file with one further prompt per line.")
+    parser.add_argument('--cache', default=DEFAULT_CACHE, help="SQLite file of the cache.")
+    args = parser.parse_args()
+
+    texts = []
+    if args.prompts is not None:
+        with open(args.prompts) as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    cache = TextEmbeddingCache(open_clip_encoder(args.clip_path, args.clip_model, args.device), args.clip_path, args.template, args.cache)
+    count = cache.preload(args.label_sets, texts)
+    print(f"Preloaded {count} texts: {cache.disk_hits} already stored, {cache.misses} encoded.")
+    cache.close()
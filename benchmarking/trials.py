@@ -0,0 +1,113 @@
+import os
+import csv
+import random
+import statistics
+from benchmarking.results_store import METRICS
+from benchmarking.scheduler import Job
+
+CACHE_STATES = ["none", "cold", "warm", "both"]
+
+def evict_from_page_cache(paths):
+    """
+    Drops the clean pages of all files below the given paths from the page cache. Works without root
+    privileges, unlike writing to /proc/sys/vm/drop_caches.
+    """
+    for path in paths:
+        for fp in _files(path):
+            try:
+                fd = os.open(fp, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+def warm_page_cache(paths, chunk_size=8 * 1024 ** 2):
+    """
+    Reads all files below the given paths once so that they are in the page cache.
+    """
+    for path in paths:
+        for fp in _files(path):
+            try:
+                with open(fp, "rb", buffering=0) as f:
+                    while f.read(chunk_size):
+                        pass
+            except OSError:
+                continue
+
+def _files(path):
+    if os.path.isfile(path):
+        yield path
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            yield os.path.join(dirpath, name)
+
+def _prepare(cache_state, paths):
+    if cache_state == "cold":
+        return lambda: evict_from_page_cache(paths)
+    if cache_state == "warm":
+        return lambda: warm_page_cache(paths)
+    return None
+
+def expand_trials(chains, repetitions=1, warmup=0, shuffle=False, seed=None, cache_state="none"):
+    """
+    Repeats every chain (one per scene) for warmup + repetitions trials.
+
+    Trials are ordered trial by trial, so a scene's trials are spread over the whole session instead of
+    running back to back; with shuffle the scene order is randomized within every trial. For cold and warm
+    trials, the files listed in each job's metadata['cache_paths'] are evicted from or loaded into the page
+    cache right before the job starts. "both" runs a cold and a warm trial per repetition.
+
+    Returns:
+        The expanded list of chains for the scheduler. Job metadata carries 'trial', 'warmup' and
+        'cache_state'.
+    """
+    states = ["cold", "warm"] if cache_state == "both" else [cache_state]
+    rng = random.Random(seed)
+    expanded = []
+
+    for trial in range(-warmup, repetitions):
+        for state in (states[:1] if trial < 0 else states):
+            order = list(chains)
+            if shuffle:
+                rng.shuffle(order)
+            for chain in order:
+                expanded.append([
+                    Job(job.scene, job.script, job.command, job.cpu_slots, job.shell,
+                        metadata=dict(job.metadata, trial=trial, warmup=trial < 0, cache_state=None if state == "none" else state),
+                        prepare=_prepare(state, job.metadata.get('cache_paths', [])), warm=job.warm)
+                    for job in chain
+                ])
+    return expanded
+
+def summarize_trials(store, run_id, metrics=METRICS):
+    """
+    Median, interquartile range and minimum of every metric over the non-warmup trials of a run, per
+    (approach, script, scene, cache state, render views).
+    """
+    rows = {}
+    for metric in metrics:
+        for key, values in store.measurements(run_id, metric).items():
+            row = rows.setdefault(key, {'approach': key[0], 'script': key[1], 'scene': key[2], 'cache_state': key[3],
+                                        'render_views': key[4], 'trials': len(values)})
+            q1, _, q3 = statistics.quantiles(values, n=4, method='inclusive') if len(values) > 1 else (values[0],) * 3
+            row[f'median_{metric}'] = statistics.median(values)
+            row[f'iqr_{metric}'] = q3 - q1
+            row[f'min_{metric}'] = min(values)
+    return [rows[key] for key in sorted(rows, key=str)]
+
+def write_trial_summary(rows, path):
+    if not rows:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode='w', newline='') as file:
+        # Metrics only some stages report (e.g. time_per_frame, model_load_time) are missing from other rows
+        writer = csv.DictWriter(file, fieldnames=list(dict.fromkeys(key for row in rows for key in row)))
+        writer.writeheader()
+        writer.writerows(rows)
+    for row in rows:
+        print(f"{row['scene']} {row['script']} ({row['cache_state'] or 'default'} cache, {row['trials']} trials): "
+              f"time median {row['median_time']:.2f} s, IQR {row['iqr_time']:.2f} s, min {row['min_time']:.2f} s, "
+              f"max CPU memory median {row['median_max_cpu_memory_usage']:.2f} GB, "
+              f"max GPU median {row['median_max_gpu_usage']:.2f} GB")
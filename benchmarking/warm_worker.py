@@ -0,0 +1,335 @@
+import os
+import gc
+import sys
+import time
+import queue
+import shlex
+import shutil
+import runpy
+import inspect
+import secrets
+import argparse
+import functools
+import tempfile
+import traceback
+import subprocess
+from multiprocessing.connection import Client, Listener
+from benchmarking.sampler import DEFAULT_INTERVAL, ResourceSampler, run_sampled
+
+AUTHKEY_VARIABLE = "WARM_WORKER_AUTHKEY"
+CONNECT_TIMEOUT = 60.0  # seconds until a started worker has to accept connections
+
+class WarmModels:
+    """
+    Memoizes the SAM and CLIP loaders inside the worker, so a stage script that builds its model on every
+    run gets the instance loaded by an earlier job. Time spent in actual loads is added to load_time.
+    """
+
+    def __init__(self):
+        self.models = {}
+        self.load_time = 0.0
+
+    @staticmethod
+    def _key(loader, args, kwargs):
+        """
+        Cache key of a loader call that does not depend on how it was made: arguments are bound to the
+        loader's parameters with their defaults filled in, and paths of existing files are made absolute.
+        Returns None for calls that do not match the signature.
+        """
+        def normalize(value):
+            if isinstance(value, str) and os.path.exists(value):
+                return os.path.realpath(value)
+            if isinstance(value, (tuple, list)):
+                return tuple(normalize(v) for v in value)
+            if isinstance(value, dict):
+                return tuple(sorted((k, normalize(v)) for k, v in value.items()))
+            return value
+
+        try:
+            bound = inspect.signature(loader).bind(*args, **kwargs)
+        except (TypeError, ValueError):
+            return None
+        bound.apply_defaults()
+        return loader.__module__, loader.__qualname__, repr(sorted((name, normalize(value)) for name, value in bound.arguments.items()))
+
+    def _memoize(self, loader):
+        @functools.wraps(loader)
+        def load(*args, **kwargs):
+            key = self._key(loader, args, kwargs)
+            if key is None:
+                return loader(*args, **kwargs)
+            if key not in self.models:
+                start = time.perf_counter()
+                self.models[key] = loader(*args, **kwargs)
+                self.load_time += time.perf_counter() - start
+            return self.models[key]
+        return load
+
+    def patch(self):
+        """
+        Replaces the loaders of segment_anything and open_clip that are installed. The SAM registry dict is
+        patched in place, so scripts importing it from either module see the memoized builders.
+        """
+        try:
+            from segment_anything import sam_model_registry
+            for arch, builder in list(sam_model_registry.items()):
+                sam_model_registry[arch] = self._memoize(builder)
+        except ImportError:
+            pass
+        try:
+            import open_clip
+            for name in ("create_model", "create_model_and_transforms"):
+                setattr(open_clip, name, self._memoize(getattr(open_clip, name)))
+        except ImportError:
+            pass
+
+    def take_load_time(self):
+        load_time, self.load_time = self.load_time, 0.0
+        return load_time
+
+def _initialize_torch(device):
+    try:
+        import torch
+    except ImportError:
+        return
+    if device.startswith("cuda") and torch.cuda.is_available():
+        torch.cuda.init()
+
+def _release_memory():
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+def run_script(script, argv, cwd):
+    """
+    Runs a Python script in this process as `python script *argv` would, from the directory cwd.
+
+    Returns:
+        The exit code of the script.
+    """
+    saved_argv, saved_path, saved_cwd = sys.argv, list(sys.path), os.getcwd()
+    os.chdir(cwd)
+    sys.argv = [script] + list(argv)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    try:
+        runpy.run_path(script, run_name="__main__")
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.argv, sys.path[:] = saved_argv, saved_path
+        os.chdir(saved_cwd)
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+def serve(address, authkey, sam_checkpoint=None, sam_arch="vit_h", device="cuda", clip_path=None, clip_model="ViT-B-16",
+          clip_precision="fp16"):
+    """
+    Worker loop: accepts a single client on address and runs its jobs one after another until the client
+    sends None or disconnects.
+
+    After connecting, the client receives {"load_time"} of the worker start (torch initialization and
+    preloaded models). Every job {"script", "argv", "cwd"} is answered with {"returncode", "load_time",
+    "compute_time"}, where load_time is the time spent loading models during the job.
+    """
+    with Listener(address, family="AF_UNIX", authkey=authkey) as listener, listener.accept() as connection:
+        start = time.perf_counter()
+        models = WarmModels()
+        models.patch()
+        _initialize_torch(device)
+        if sam_checkpoint is not None:
+            # The call of SAGA's extract_segment_everything_masks.py, so its first job finds the model
+            from segment_anything import sam_model_registry
+            sam_model_registry[sam_arch](checkpoint=sam_checkpoint).to(device)
+        if clip_path is not None:
+            # The call of SAGA's clip_utils (OpenCLIPNetwork), which get_clip_features.py builds on every run
+            import open_clip
+            open_clip.create_model_and_transforms(clip_model, pretrained=clip_path, precision=clip_precision)
+        models.take_load_time()
+        connection.send({"load_time": time.perf_counter() - start})
+
+        while True:
+            try:
+                job = connection.recv()
+            except EOFError:
+                break
+            if job is None:
+                break
+            start = time.perf_counter()
+            returncode = run_script(job["script"], job["argv"], job["cwd"])
+            _release_memory()
+            load_time = models.take_load_time()
+            connection.send({"returncode": returncode, "load_time": load_time,
+                             "compute_time": time.perf_counter() - start - load_time})
+
+def parse_python_command(command):
+    """
+    Splits a `python <script> [args]` command (string or list) into the script and its arguments.
+
+    Returns:
+        (script, argv), or None for other commands.
+    """
+    parts = shlex.split(command) if isinstance(command, str) else list(command)
+    if len(parts) < 2 or os.path.basename(parts[0]) not in ("python", "python3") or not parts[1].endswith(".py"):
+        return None
+    return parts[1], parts[2:]
+
+class WarmWorker:
+    """
+    Client of one long-lived worker process, started on the first job and restarted if it dies.
+
+    Args:
+        sam_checkpoint: SAM checkpoint loaded when the worker starts, instead of during its first job.
+        sam_arch: Architecture of the SAM checkpoint.
+        device: Device the preloaded models are placed on.
+        clip_path: open_clip checkpoint loaded when the worker starts, instead of during its first job.
+        clip_model: open_clip architecture of the checkpoint.
+        clip_precision: Precision the CLIP model is created with, as the stage script does.
+    """
+
+    def __init__(self, sam_checkpoint=None, sam_arch="vit_h", device="cuda", clip_path=None, clip_model="ViT-B-16",
+                 clip_precision="fp16"):
+        self.sam_checkpoint = sam_checkpoint
+        self.sam_arch = sam_arch
+        self.device = device
+        self.clip_path = clip_path
+        self.clip_model = clip_model
+        self.clip_precision = clip_precision
+        self.process = None
+        self.connection = None
+        self.address = None
+
+    def _start(self):
+        self.address = os.path.join(tempfile.mkdtemp(prefix="warm_worker_"), "socket")
+        authkey = secrets.token_bytes(32)
+        command = [sys.executable, "-m", "benchmarking.warm_worker", self.address, "--sam_arch", self.sam_arch, "--device", self.device]
+        if self.sam_checkpoint is not None:
+            command += ["--sam_checkpoint", self.sam_checkpoint]
+        if self.clip_path is not None:
+            command += ["--clip_path", self.clip_path, "--clip_model", self.clip_model, "--clip_precision", self.clip_precision]
+        # The key is passed through the environment so it does not show up in the process list
+        self.process = subprocess.Popen(command, env=dict(os.environ, **{AUTHKEY_VARIABLE: authkey.hex()}))
+
+        deadline = time.time() + CONNECT_TIMEOUT
+        while self.connection is None:
+            try:
+                self.connection = Client(self.address, family="AF_UNIX", authkey=authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if self.process.poll() is not None or time.time() > deadline:
+                    self.close()
+                    raise OSError("warm worker did not start")
+                time.sleep(0.05)
+
+    def run_sampled(self, script, argv, interval=DEFAULT_INTERVAL, gpu_backend=None):
+        """
+        Runs a script in the worker and samples the worker while it runs. A job that starts the worker
+        includes its startup in the measured time and in its model load time.
+
+        Returns:
+            The return code of the script and the stopped sampler, carrying model_load_time and
+            compute_time.
+        """
+        start_time = time.time()
+        starting = self.process is None
+        if starting:
+            self._start()
+        # The worker's counters include earlier jobs, so the sampler reports the increase during this one
+        sampler = ResourceSampler(self.process.pid, interval, gpu_backend, relative=True).start()
+        try:
+            load_time = self.connection.recv()["load_time"] if starting else 0.0
+            self.connection.send({"script": script, "argv": argv, "cwd": os.getcwd()})
+            result = self.connection.recv()
+            returncode = result["returncode"]
+            sampler.model_load_time = load_time + result["load_time"]
+            sampler.compute_time = result["compute_time"]
+        except (EOFError, OSError) as e:
+            print(f"Warm worker {self.process.pid} exited while running {script} ({e!r})")
+            returncode = self.close() or -1
+        finally:
+            sampler.stop()
+        sampler.elapsed = time.time() - start_time
+        return returncode, sampler
+
+    def close(self):
+        """
+        Stops the worker process.
+
+        Returns:
+            Its exit code, or None if it was not running.
+        """
+        returncode = None
+        if self.connection is not None:
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+            self.connection.close()
+            self.connection = None
+        if self.process is not None:
+            try:
+                returncode = self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                returncode = self.process.wait()
+            self.process = None
+        if self.address is not None:
+            shutil.rmtree(os.path.dirname(self.address), ignore_errors=True)
+            self.address = None
+        return returncode
+
+class WorkerPool:
+    """
+    A fixed number of warm workers shared by the scheduler threads. A job waits for an idle worker, so
+    at most size jobs run in workers at the same time. The remaining arguments are those of WarmWorker.
+    """
+
+    def __init__(self, size=1, sam_checkpoint=None, sam_arch="vit_h", device="cuda", clip_path=None, clip_model="ViT-B-16",
+                 clip_precision="fp16"):
+        self.workers = [WarmWorker(sam_checkpoint, sam_arch, device, clip_path, clip_model, clip_precision) for _ in range(size)]
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+
+    def run_sampled(self, command, interval=DEFAULT_INTERVAL, gpu_backend=None, shell=False):
+        """
+        Runs a `python <script>` command in an idle worker. Other commands run as a new process.
+        """
+        parsed = parse_python_command(command)
+        if parsed is None:
+            return run_sampled(command, interval, gpu_backend, shell=shell)
+        worker = self.idle.get()
+        try:
+            return worker.run_sampled(*parsed, interval, gpu_backend)
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+if __name__ == "__main__":
+    """
+    Warm worker process, started by WarmWorker.
+
+    Usage:
+    python -m benchmarking.warm_worker <socket_path> [--sam_checkpoint <path_to_sam>] [--sam_arch vit_h] [--clip_path <path_to_clip>] [--device cuda]
+    """
+    parser = argparse.ArgumentParser(description="Long-lived worker running stage scripts with preloaded SAM and CLIP models.")
+    parser.add_argument('address', help="Unix socket path the worker listens on.")
+    parser.add_argument('--sam_checkpoint', default=None, help="SAM checkpoint loaded at startup.")
+    parser.add_argument('--sam_arch', default="vit_h", help="Architecture of the SAM checkpoint.")
+    parser.add_argument('--clip_path', default=None, help="open_clip checkpoint loaded at startup.")
+    parser.add_argument('--clip_model', default="ViT-B-16", help="open_clip architecture of the checkpoint.")
+    parser.add_argument('--clip_precision', default="fp16", help="Precision the CLIP model is created with.")
+    parser.add_argument('--device', default="cuda", help="Device of the preloaded models.")
+    args = parser.parse_args()
+
+    serve(args.address, bytes.fromhex(os.environ.pop(AUTHKEY_VARIABLE)), args.sam_checkpoint, args.sam_arch, args.device,
+          args.clip_path, args.clip_model, args.clip_precision)
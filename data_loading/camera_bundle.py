@@ -0,0 +1,88 @@
+import json
+import os
+import struct
+import numpy as np
+from pathlib import Path
+from typing import List
+
+BUNDLE_NAME = "transforms.bundle"
+MAGIC = b"CAMBNDL1"
+ALIGNMENT = 64
+
+def write_camera_bundle(output_dir: Path, poses: np.ndarray, file_paths: List[str], intrinsics: dict) -> Path:
+    """Writes camera poses, image paths and intrinsics into a single binary file next to transforms.json.
+
+    Layout:
+        8 bytes magic, 8 bytes little-endian header length, JSON header (intrinsics, counts and offsets),
+        then the (N, 4, 4) float64 poses and the UTF-8 file paths as fixed-width byte strings, each block
+        aligned to 64 bytes so both can be memory-mapped.
+    """
+    poses = np.ascontiguousarray(poses, dtype="<f8").reshape((-1, 4, 4))
+    paths = np.array([p.encode("utf-8") for p in file_paths], dtype=bytes)
+    assert len(paths) == len(poses)
+
+    def aligned(offset):
+        return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+    header = {"intrinsics": intrinsics, "count": len(poses), "path_itemsize": max(paths.dtype.itemsize, 1)}
+    # The offsets depend on the header length, so reserve room for them before serializing
+    header_len = len(json.dumps(dict(header, poses_offset=0, paths_offset=0)).encode()) + 32
+    header["poses_offset"] = aligned(16 + header_len)
+    header["paths_offset"] = aligned(header["poses_offset"] + poses.nbytes)
+    header_bytes = json.dumps(header).encode().ljust(header_len)
+
+    path = Path(output_dir) / BUNDLE_NAME
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", header_len) + header_bytes)
+        f.write(b"\0" * (header["poses_offset"] - f.tell()))
+        f.write(poses.tobytes())
+        f.write(b"\0" * (header["paths_offset"] - f.tell()))
+        f.write(paths.astype(f"S{header['path_itemsize']}").tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+def read_camera_bundle(path: Path) -> dict:
+    """Memory-maps a camera bundle written by write_camera_bundle.
+
+    Returns:
+        A dict with "poses" as read-only (N, 4, 4) array, "file_paths" as list of str and "intrinsics".
+    """
+    with open(path, "rb") as f:
+        if f.read(8) != MAGIC:
+            raise ValueError(f"{path} is not a camera bundle")
+        header_len, = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+
+    count = header["count"]
+    if count == 0:
+        return {"poses": np.zeros((0, 4, 4)), "file_paths": [], "intrinsics": header["intrinsics"]}
+    poses = np.memmap(path, dtype="<f8", mode="r", offset=header["poses_offset"], shape=(count, 4, 4))
+    paths = np.memmap(path, dtype=f"S{header['path_itemsize']}", mode="r", offset=header["paths_offset"], shape=(count,))
+    return {
+        "poses": poses,
+        "file_paths": [p.decode("utf-8") for p in paths],
+        "intrinsics": header["intrinsics"],
+    }
+
+def load_cameras(dataset_dir: Path) -> dict:
+    """Loads the cameras of a nerfstudio dataset, preferring the binary bundle over transforms.json.
+
+    The bundle is only used if it is at least as new as transforms.json, so hand-edited JSON files win.
+    Returns the same dict as read_camera_bundle.
+    """
+    dataset_dir = Path(dataset_dir)
+    bundle_path = dataset_dir / BUNDLE_NAME
+    json_path = dataset_dir / "transforms.json"
+
+    if bundle_path.exists() and (not json_path.exists() or bundle_path.stat().st_mtime_ns >= json_path.stat().st_mtime_ns):
+        return read_camera_bundle(bundle_path)
+
+    with open(json_path) as f:
+        transforms = json.load(f)
+    frames = transforms.pop("frames")
+    return {
+        "poses": np.array([frame["transform_matrix"] for frame in frames], dtype=np.float64).reshape((-1, 4, 4)),
+        "file_paths": [frame["file_path"] for frame in frames],
+        "intrinsics": transforms,
+    }
@@ -0,0 +1,225 @@
+import os
+import sys
+import time
+import struct
+import argparse
+import tracemalloc
+import numpy as np
+from data_loading.preprocess_replica import CAMERA_MODEL_IDS, IMAGE_HEADER, POINT3D_RECORD
+
+MAX_CAMERA_PARAMS = max(model.num_params for model in CAMERA_MODEL_IDS.values())
+GATHER_BYTES = 1 << 22
+LARGE_BLOCK = 1 << 12
+
+CAMERA_RECORD = np.dtype([("camera_id", "<i4"), ("model_id", "<i4"), ("width", "<u8"), ("height", "<u8"),
+                          ("params", "<f8", MAX_CAMERA_PARAMS)])
+POINT2D_RECORD = np.dtype([("xy", "<f8", 2), ("point3D_id", "<i8")])
+TRACK_ELEMENT = np.dtype([("image_id", "<i4"), ("point2D_idx", "<i4")])
+
+def _ragged_arange(starts, lengths):
+    """
+    Concatenation of arange(start, start + length) for all pairs, vectorized.
+    """
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(lengths.sum()) + offsets
+
+def _gather(buffer, starts, counts, dtype):
+    """
+    Concatenates the records of dtype stored at the byte offsets starts of buffer, counts[i] records at
+    starts[i]. Small blocks need not be aligned, so their bytes are gathered, a bounded number at a time.
+    """
+    starts, counts = np.asarray(starts, dtype=np.int64), np.asarray(counts, dtype=np.int64)
+    if len(starts) and counts.sum() * dtype.itemsize >= LARGE_BLOCK * len(starts):
+        # Few large blocks (e.g. the 2D points of each image): concatenate views of the file
+        return np.concatenate([np.frombuffer(buffer, dtype=dtype, count=count, offset=start)
+                               for start, count in zip(starts.tolist(), counts.tolist())])
+    output = np.empty(counts.sum(), dtype=dtype)
+    raw = output.view(np.uint8)
+    sizes = counts * dtype.itemsize
+    ends = np.cumsum(sizes)
+    first, written = 0, 0
+    while first < len(starts):
+        # Blocks up to GATHER_BYTES at a time (at least one), so the index array stays bounded
+        last = max(first + 1, int(np.searchsorted(ends, written + GATHER_BYTES, side="right")))
+        chunk = slice(first, last)
+        size = int(sizes[chunk].sum())
+        raw[written:written + size] = buffer[_ragged_arange(starts[chunk], sizes[chunk])]
+        first, written = last, written + size
+    return output
+
+def _map(path):
+    return np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, dtype=np.uint8)
+
+def read_cameras_binary(path):
+    """
+    Reads a COLMAP cameras.bin into a structured array of CAMERA_RECORD. Parameters beyond the number of
+    the camera model are NaN.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    count, = struct.unpack_from("<Q", data, 0)
+    cameras = np.zeros(count, dtype=CAMERA_RECORD)
+    cameras["params"] = np.nan
+    position = 8
+    for i in range(count):
+        camera_id, model_id, width, height = struct.unpack_from("<iiQQ", data, position)
+        num_params = CAMERA_MODEL_IDS[model_id].num_params
+        cameras["camera_id"][i], cameras["model_id"][i] = camera_id, model_id
+        cameras["width"][i], cameras["height"][i] = width, height
+        cameras["params"][i, :num_params] = np.frombuffer(data, dtype="<f8", count=num_params, offset=position + 24)
+        position += 24 + 8 * num_params
+    return cameras
+
+def read_images_binary(path):
+    """
+    Reads a COLMAP images.bin into flat arrays. Only the image records are walked in Python; their 2D points
+    are gathered in bulk from the memory-mapped file.
+
+    Returns:
+        images: Structured array of IMAGE_HEADER (image_id, qvec, tvec, camera_id).
+        names: Image names.
+        points2D: Structured array of POINT2D_RECORD of all images, concatenated.
+        point2D_offsets: Start of the 2D points of every image in points2D, with a final entry of their total.
+    """
+    buffer = _map(path)
+    data = memoryview(buffer)
+    count, = struct.unpack_from("<Q", data, 0)
+    header_starts, names, point_starts, point_counts = [], [], [], []
+    position = 8
+    for _ in range(count):
+        header_starts.append(position)
+        name_start = position + IMAGE_HEADER.itemsize
+        name_length = bytes(data[name_start:name_start + 4096]).index(b"\0")
+        names.append(bytes(data[name_start:name_start + name_length]).decode("utf-8"))
+        position = name_start + name_length + 1
+        num_points, = struct.unpack_from("<Q", data, position)
+        point_starts.append(position + 8)
+        point_counts.append(num_points)
+        position += 8 + num_points * POINT2D_RECORD.itemsize
+
+    images = _gather(buffer, header_starts, np.ones(count, dtype=np.int64), IMAGE_HEADER)
+    points2D = _gather(buffer, point_starts, point_counts, POINT2D_RECORD)
+    point2D_offsets = np.concatenate([[0], np.cumsum(point_counts, dtype=np.int64)])
+    return images, np.array(names), points2D, point2D_offsets
+
+def read_points3D_binary(path):
+    """
+    Reads a COLMAP points3D.bin into flat arrays. Without any tracks (e.g. models written by
+    write_colmap_model) the records have a fixed size and are memory-mapped directly, otherwise the records
+    are located by one walk over the track lengths and gathered in bulk.
+
+    Returns:
+        points: Structured array of POINT3D_RECORD (point3D_id, xyz, rgb, error, track_length).
+        tracks: Structured array of TRACK_ELEMENT (image_id, point2D_idx) of all points, concatenated.
+        track_offsets: Start of the track of every point in tracks, with a final entry of their total.
+    """
+    buffer = _map(path)
+    count, = struct.unpack_from("<Q", buffer, 0)
+    if len(buffer) == 8 + count * POINT3D_RECORD.itemsize:
+        points = np.memmap(path, dtype=POINT3D_RECORD, mode="r", offset=8, shape=(count,))
+        return points, np.zeros(0, dtype=TRACK_ELEMENT), np.zeros(count + 1, dtype=np.int64)
+
+    data = memoryview(buffer)
+    unpack = struct.Struct("<Q").unpack_from
+    starts = [0] * count
+    position, length_offset, record_size = 8, POINT3D_RECORD.itemsize - 8, POINT3D_RECORD.itemsize
+    for i in range(count):
+        starts[i] = position
+        position += record_size + TRACK_ELEMENT.itemsize * unpack(data, position + length_offset)[0]
+
+    starts = np.array(starts, dtype=np.int64)
+    points = _gather(buffer, starts, np.ones(count, dtype=np.int64), POINT3D_RECORD)
+    tracks = _gather(buffer, starts + record_size, points["track_length"], TRACK_ELEMENT)
+    track_offsets = np.concatenate([[0], np.cumsum(points["track_length"], dtype=np.int64)])
+    return points, tracks, track_offsets
+
+class ColmapModel:
+    """
+    A COLMAP sparse model (e.g. sparse/0/) as flat structured arrays, with offset indexes into the
+    concatenated 2D points of the images and tracks of the 3D points.
+    """
+
+    def __init__(self, cameras, images, names, points2D, point2D_offsets, points3D, tracks, track_offsets):
+        self.cameras = cameras
+        self.images = images
+        self.names = names
+        self.points2D = points2D
+        self.point2D_offsets = point2D_offsets
+        self.points3D = points3D
+        self.tracks = tracks
+        self.track_offsets = track_offsets
+
+    @classmethod
+    def read(cls, sparse_dir):
+        return cls(read_cameras_binary(os.path.join(sparse_dir, "cameras.bin")),
+                   *read_images_binary(os.path.join(sparse_dir, "images.bin")),
+                   *read_points3D_binary(os.path.join(sparse_dir, "points3D.bin")))
+
+    def image_points(self, index):
+        """
+        The 2D points of the image at position index, as a view.
+        """
+        return self.points2D[self.point2D_offsets[index]:self.point2D_offsets[index + 1]]
+
+    def track(self, index):
+        """
+        The track of the 3D point at position index, as a view.
+        """
+        return self.tracks[self.track_offsets[index]:self.track_offsets[index + 1]]
+
+def _measure(function, *args):
+    """
+    Wall time of a call, and the peak of Python-allocated memory in a second, traced call (tracing slows
+    down allocation-heavy readers, so it is not timed).
+    """
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def benchmark(sparse_dir, gaussian_splatting_path=None):
+    """
+    Times reading a sparse model and the peak of Python-allocated memory, against the per-record readers of
+    the Gaussian Splatting repository (scene/colmap_loader.py) if its path is given.
+    """
+    reference = None
+    if gaussian_splatting_path is not None:
+        sys.path.insert(0, gaussian_splatting_path)
+        from scene import colmap_loader as reference
+
+    files = {
+        "cameras.bin": (read_cameras_binary, reference and reference.read_intrinsics_binary),
+        "images.bin": (read_images_binary, reference and reference.read_extrinsics_binary),
+        "points3D.bin": (read_points3D_binary, reference and reference.read_points3D_binary),
+    }
+    for name, (reader, reference_reader) in files.items():
+        path = os.path.join(sparse_dir, name)
+        size = os.path.getsize(path) / 1024 ** 2
+        elapsed, peak = _measure(reader, path)
+        line = f"{name:<13} {size:8.1f} MB  structured: {elapsed:8.3f}s {peak / 1024 ** 2:8.1f} MB peak"
+        if reference_reader:
+            reference_elapsed, reference_peak = _measure(reference_reader, path)
+            line += (f"  per-record: {reference_elapsed:8.3f}s {reference_peak / 1024 ** 2:8.1f} MB peak"
+                     f"  ({reference_elapsed / max(elapsed, 1e-9):.1f}x)")
+        print(line)
+
+if __name__ == "__main__":
+    """
+    Read a COLMAP sparse model into structured arrays and compare against the per-record readers.
+
+    Usage:
+    python -m data_loading.colmap_model <scene>/sparse/0 [--gaussian_splatting <path_to_gaussian_splatting_repo>]
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the structured COLMAP binary reader.")
+    parser.add_argument('sparse_dir', help="Folder with cameras.bin, images.bin and points3D.bin.")
+    parser.add_argument('--gaussian_splatting', default=None, help="Gaussian Splatting checkout whose scene/colmap_loader.py is compared against.")
+    args = parser.parse_args()
+
+    model = ColmapModel.read(args.sparse_dir)
+    print(f"{len(model.cameras)} cameras, {len(model.images)} images with {len(model.points2D)} 2D points, "
+          f"{len(model.points3D)} 3D points with {len(model.tracks)} track elements")
+    benchmark(args.sparse_dir, args.gaussian_splatting)
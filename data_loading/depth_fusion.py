@@ -0,0 +1,202 @@
+import os
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from data_loading.preprocess_replica import write_colmap_model, write_points3D_binary
+from data_loading.trajectory import load_trajectory
+
+KEY_BITS = 21
+KEY_OFFSET = 1 << (KEY_BITS - 1)  # Voxel coordinates may be negative, the keys are not
+
+# Vertex layout of the points3D.ply Gaussian Splatting writes (storePly) and reads before points3D.bin
+PLY_DTYPE = np.dtype([("x", "<f4"), ("y", "<f4"), ("z", "<f4"), ("nx", "<f4"), ("ny", "<f4"), ("nz", "<f4"),
+                      ("red", "u1"), ("green", "u1"), ("blue", "u1")])
+
+def _voxel_keys(points, voxel_size):
+    voxels = np.floor(points / voxel_size).astype(np.int64) + KEY_OFFSET
+    return (voxels[:, 0] << (2 * KEY_BITS)) | (voxels[:, 1] << KEY_BITS) | voxels[:, 2]
+
+class VoxelAccumulator:
+    """
+    Streaming voxel-grid downsampling: points are added chunk by chunk and only the per-voxel sums of
+    positions and colours and the point counts are kept, so memory grows with the occupied voxels and not
+    with the number of points.
+    """
+
+    def __init__(self, voxel_size):
+        self.voxel_size = voxel_size
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.xyz = np.zeros((0, 3))
+        self.rgb = np.zeros((0, 3))
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def _reduce(keys, xyz, rgb, counts):
+        keys, inverse = np.unique(keys, return_inverse=True)
+        sums = [np.bincount(inverse, weights=values, minlength=len(keys)) for values in (*xyz.T, *rgb.T, counts)]
+        return keys, np.stack(sums[:3], axis=1), np.stack(sums[3:6], axis=1), sums[6].astype(np.int64)
+
+    def add(self, points, colors):
+        keys, xyz, rgb, counts = self._reduce(_voxel_keys(points, self.voxel_size), points, colors, np.ones(len(points)))
+        # Merge into the sorted voxels without sorting them again: add to existing ones, insert the new ones
+        position = np.searchsorted(self.keys, keys)
+        found = position < len(self.keys)
+        found[found] = self.keys[position[found]] == keys[found]
+        self.xyz[position[found]] += xyz[found]
+        self.rgb[position[found]] += rgb[found]
+        self.counts[position[found]] += counts[found]
+        new, at = ~found, position[~found]
+        self.keys = np.insert(self.keys, at, keys[new])
+        self.xyz = np.insert(self.xyz, at, xyz[new], axis=0)
+        self.rgb = np.insert(self.rgb, at, rgb[new], axis=0)
+        self.counts = np.insert(self.counts, at, counts[new])
+
+    def coarsen(self, voxel_size):
+        """
+        Re-bins the voxels into larger ones by their centroids, keeping the sums exact.
+        """
+        self.voxel_size = voxel_size
+        self.keys, self.xyz, self.rgb, self.counts = self._reduce(
+            _voxel_keys(self.xyz / self.counts[:, None], voxel_size), self.xyz, self.rgb, self.counts)
+
+    def points(self):
+        """
+        Returns the centroid and mean colour of every occupied voxel.
+        """
+        return self.xyz / self.counts[:, None], np.clip(np.round(self.rgb / self.counts[:, None]), 0, 255).astype(np.uint8)
+
+def backproject(depths, colors, camera_to_worlds, intrinsics, pixel_step=1, depth_scale=6553.5, max_depth=10.0):
+    """
+    Back-projects a batch of depth frames into world space in one batched operation.
+
+    Args:
+        depths: (F, H, W) raw depth values, metres times depth_scale (0 is missing), of every pixel_step-th
+            pixel of the full-resolution frames along both axes.
+        colors: (F, H, W, 3) RGB values of the same pixels.
+        camera_to_worlds: (F, 4, 4) camera-to-world poses in the OpenCV convention of traj.txt.
+        intrinsics: fx, fy, cx, cy of the full-resolution frames.
+
+    Returns:
+        (N, 3) world points and their (N, 3) colours, for the valid depths.
+    """
+    fx, fy, cx, cy = intrinsics
+    depths = depths / depth_scale
+    v, u = np.meshgrid(np.arange(depths.shape[1]) * pixel_step, np.arange(depths.shape[2]) * pixel_step, indexing="ij")
+    valid = (depths > 0) & (depths < max_depth)
+
+    frame = np.nonzero(valid)[0]
+    z = depths[valid]
+    camera_points = np.stack([(np.broadcast_to(u, valid.shape)[valid] - cx) / fx * z,
+                              (np.broadcast_to(v, valid.shape)[valid] - cy) / fy * z, z], axis=1)
+    world = np.einsum("nij,nj->ni", camera_to_worlds[frame, :3, :3], camera_points) + camera_to_worlds[frame, :3, 3]
+    return world, colors[valid]
+
+def _read_frame(paths, pixel_step):
+    """
+    Reads every pixel_step-th pixel of a depth frame and the colour of the same pixels. JPEG frames are
+    decoded directly at a reduced scale where possible, which is much cheaper than a full decode.
+    """
+    depth_path, color_path = paths
+    with Image.open(depth_path) as depth, Image.open(color_path) as color:
+        depth = np.asarray(depth)[::pixel_step, ::pixel_step]
+        color.draft("RGB", (color.width // pixel_step, color.height // pixel_step))
+        color = color.convert("RGB")
+        if color.size != depth.shape[::-1]:
+            color = color.resize(depth.shape[::-1], Image.BILINEAR)
+        return depth, np.asarray(color)
+
+def write_ply(path, xyz, rgb):
+    """
+    Writes a point cloud in the binary PLY layout of Gaussian Splatting's points3D.ply (zero normals).
+    """
+    vertices = np.zeros(len(xyz), dtype=PLY_DTYPE)
+    vertices["x"], vertices["y"], vertices["z"] = xyz.T
+    vertices["red"], vertices["green"], vertices["blue"] = rgb.T
+    header = "ply\nformat binary_little_endian 1.0\nelement vertex {}\n{}end_header\n".format(
+        len(vertices), "".join(f"property {'float' if PLY_DTYPE[name].kind == 'f' else 'uchar'} {name}\n" for name in PLY_DTYPE.names))
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        f.write(vertices.tobytes())
+
+def fuse_depth(scene_path, images_folder='images', cam_params_path=None, max_points=200_000, voxel_size=0.01,
+               pixel_step=4, max_depth=10.0, chunk_frames=16, workers=8):
+    """
+    Fuses the depth frames of a Replica scene into a colored point cloud with at most max_points points.
+
+    The frames in images_folder (frame<index>.jpg) are back-projected with their results/depth<index>.png
+    and traj.txt pose, chunk_frames frames at a time, and accumulated into a voxel grid of voxel_size.
+    Afterwards the voxels are grown until the point budget is met. Memory is bounded by one chunk
+    of frames and the occupied voxels, and the result is deterministic.
+
+    Returns:
+        (N, 3) points, (N, 3) uint8 colours and the final voxel size.
+    """
+    scene_path = os.path.abspath(scene_path)
+    cam_params_path = cam_params_path or os.path.join(os.path.dirname(scene_path), 'cam_params.json')
+    with open(cam_params_path) as f:
+        camera = json.load(f)['camera']
+    intrinsics = (camera['fx'], camera['fy'], camera['cx'], camera['cy'])
+
+    names = sorted([f for f in os.listdir(os.path.join(scene_path, images_folder)) if f.startswith('frame') and f.endswith('.jpg')])
+    indices = [int(name[len('frame'):-len('.jpg')]) for name in names]
+    camera_to_worlds = load_trajectory(os.path.join(scene_path, 'traj.txt'))[indices]
+    results = os.path.join(scene_path, 'results')
+    paths = [(os.path.join(results, f'depth{index:06d}.png'), os.path.join(results, name)) for index, name in zip(indices, names)]
+
+    grid = VoxelAccumulator(voxel_size)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(paths), chunk_frames):
+            frames = list(pool.map(_read_frame, paths[start:start + chunk_frames], [pixel_step] * chunk_frames))
+            depths = np.stack([depth for depth, _ in frames])
+            colors = np.stack([color for _, color in frames])
+            grid.add(*backproject(depths, colors, camera_to_worlds[start:start + chunk_frames], intrinsics, pixel_step,
+                                  camera.get('scale', 6553.5), max_depth))
+
+    while len(grid) > max_points:
+        # The voxels of a surface scale with the square of their size, the 1.25x floor guarantees progress
+        grid.coarsen(grid.voxel_size * max(1.25, np.sqrt(len(grid) / max_points)))
+    xyz, rgb = grid.points()
+    return xyz, rgb, grid.voxel_size
+
+def write_depth_initialization(scene_path, images_folder='images', max_points=200_000, **kwargs):
+    """
+    Writes the fused depth point cloud as the initialization of a scene's sparse model: sparse/0/points3D.bin
+    and the points3D.ply Gaussian Splatting prefers over it. The cameras and images of the model are
+    written by write_colmap_model first if they do not exist yet.
+    """
+    xyz, rgb, voxel_size = fuse_depth(scene_path, images_folder, max_points=max_points, **kwargs)
+    sparse_path = os.path.join(scene_path, 'sparse', '0')
+    if os.path.isfile(os.path.join(sparse_path, 'images.bin')):
+        write_points3D_binary(os.path.join(sparse_path, 'points3D.bin'), xyz, rgb)
+    else:
+        write_colmap_model(scene_path, images_folder, points=(xyz, rgb))
+    write_ply(os.path.join(sparse_path, 'points3D.ply'), xyz, rgb)
+    return len(xyz), voxel_size
+
+if __name__ == "__main__":
+    """
+    Fuse the depth frames of a Replica scene into the initial point cloud of Gaussian Splatting.
+
+    Usage:
+    python -m data_loading.depth_fusion <replica_path>/office0 [--max_points 200000] [--pixel_step 4]
+    """
+    parser = argparse.ArgumentParser(description="Fuse Replica depth frames into an initialization point cloud.")
+    parser.add_argument('scene_path', help="Replica scene containing traj.txt, results/ and the extracted images.")
+    parser.add_argument('--images_folder', default='images', help="Folder of the frames to fuse, e.g. images_8 for every 8th frame.")
+    parser.add_argument('--max_points', type=int, default=200_000, help="Point budget of the initialization.")
+    parser.add_argument('--voxel_size', type=float, default=0.01, help="Initial voxel size in metres, grown until the budget is met.")
+    parser.add_argument('--pixel_step', type=int, default=4, help="Use every n-th pixel along both image axes.")
+    parser.add_argument('--max_depth', type=float, default=10.0, help="Depths beyond this (in metres) are ignored.")
+    parser.add_argument('--chunk_frames', type=int, default=16, help="Frames back-projected at a time.")
+    parser.add_argument('--workers', type=int, default=8, help="Frame decoding threads.")
+    args = parser.parse_args()
+
+    count, voxel_size = write_depth_initialization(args.scene_path, args.images_folder, args.max_points,
+                                                   voxel_size=args.voxel_size, pixel_step=args.pixel_step,
+                                                   max_depth=args.max_depth, chunk_frames=args.chunk_frames, workers=args.workers)
+    print(f"Wrote {count} points (voxel size {voxel_size:.3f} m) to {os.path.join(args.scene_path, 'sparse', '0')}")
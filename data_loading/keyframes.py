@@ -0,0 +1,185 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from scipy.spatial.transform import Rotation as R
+from data_loading.trajectory import load_trajectory
+
+SELECTION_METHODS = ["uniform", "motion", "fps"]
+POSE_TOLERANCE = 1e-6  # Poses closer than this (scene units, radians) count as the same pose
+
+def _quaternions(camera_to_worlds):
+    return R.from_matrix(np.asarray(camera_to_worlds)[:, :3, :3]).as_quat()
+
+def _angles(quaternions, reference):
+    """
+    Rotation angles in radians between every quaternion and the reference quaternion.
+    """
+    return 2 * np.arccos(np.clip(np.abs(quaternions @ reference), 0.0, 1.0))
+
+def select_by_motion(camera_to_worlds, translation=0.05, rotation=5.0):
+    """
+    Greedy keyframes along the trajectory: a frame is kept once the camera has moved more than translation
+    (in scene units) or turned more than rotation (in degrees) since the last keyframe. Each step scans
+    ahead in growing blocks, so long static or slow segments cost a few vectorized operations.
+
+    Returns:
+        The indices of the keyframes, starting with frame 0.
+    """
+    positions = np.asarray(camera_to_worlds)[:, :3, 3]
+    quaternions = _quaternions(camera_to_worlds)
+    max_angle = np.deg2rad(rotation)
+    keyframes = [0]
+    current, block = 0, 64
+    while current + 1 < len(positions):
+        window = slice(current + 1, min(current + 1 + block, len(positions)))
+        moved = (np.linalg.norm(positions[window] - positions[current], axis=1) > translation) | \
+                (_angles(quaternions[window], quaternions[current]) > max_angle)
+        if not moved.any():
+            if window.stop == len(positions):
+                break
+            block *= 2
+            continue
+        current = window.start + int(np.argmax(moved))
+        keyframes.append(current)
+        block = 64
+    return np.array(keyframes, dtype=np.int64)
+
+def select_count_by_motion(camera_to_worlds, count, translation=0.05, rotation=5.0, iterations=30):
+    """
+    select_by_motion with the thresholds scaled (keeping their ratio) so that at most count keyframes are
+    selected, found by bisection on the scale.
+    """
+    if count >= len(camera_to_worlds):
+        return np.arange(len(camera_to_worlds))
+    low, high = 0.0, 1.0
+    while len(select_by_motion(camera_to_worlds, translation * high, rotation * high)) > count:
+        low, high = high, high * 2
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        if len(select_by_motion(camera_to_worlds, translation * middle, rotation * middle)) > count:
+            low = middle
+        else:
+            high = middle
+    return select_by_motion(camera_to_worlds, translation * high, rotation * high)
+
+def farthest_pose_sampling(camera_to_worlds, count, rotation_weight=1.0):
+    """
+    Farthest-point sampling of camera poses: starting from frame 0, repeatedly adds the pose farthest from
+    all selected ones. The distance of two poses combines the distance of their positions and their rotation
+    angle in radians times rotation_weight (scene units per radian).
+
+    Returns:
+        The indices of the selected frames in trajectory order. Fewer than count once all remaining poses
+        duplicate a selected one.
+    """
+    positions = np.asarray(camera_to_worlds)[:, :3, 3]
+    quaternions = _quaternions(camera_to_worlds)
+    count = min(count, len(positions))
+    selected = np.zeros(count, dtype=np.int64)
+    distances = np.full(len(positions), np.inf)
+    for i in range(1, count + 1):
+        latest = selected[i - 1]
+        pose_distances = np.hypot(np.linalg.norm(positions - positions[latest], axis=1),
+                                  rotation_weight * _angles(quaternions, quaternions[latest]))
+        np.minimum(distances, pose_distances, out=distances)
+        distances[latest] = 0  # Rounding can leave a pose a tiny distance from itself
+        if i < count:
+            if distances.max() <= POSE_TOLERANCE:
+                return np.unique(selected[:i])
+            selected[i] = np.argmax(distances)
+    return np.sort(selected)
+
+def _thumbnail(path, size):
+    with Image.open(path) as image:
+        image.draft("L", (size[0] * 4, size[1] * 4))
+        pixels = np.asarray(image.convert("L").resize(size, Image.BILINEAR), dtype=np.float32).ravel()
+    pixels -= pixels.mean()
+    return pixels / (np.linalg.norm(pixels) + 1e-6)
+
+def drop_similar(image_paths, indices, threshold=0.95, size=(32, 24), workers=8):
+    """
+    Drops frames whose image is nearly identical to the previous kept frame, measured by the normalized
+    cross-correlation of small grayscale thumbnails.
+
+    Returns:
+        The kept subset of indices.
+    """
+    indices = np.asarray(indices)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        thumbnails = list(pool.map(lambda i: _thumbnail(image_paths[i], size), indices))
+    keep = [0]
+    for i in range(1, len(indices)):
+        if thumbnails[i] @ thumbnails[keep[-1]] < threshold:
+            keep.append(i)
+    return indices[keep]
+
+def select_keyframes(num_frames, count, method="uniform", camera_to_worlds=None, image_paths=None, similarity=None,
+                     translation=0.05, rotation=5.0, rotation_weight=1.0, workers=8):
+    """
+    Selects at most count of num_frames frames.
+
+    Args:
+        method: uniform (evenly spaced), motion (select_count_by_motion) or fps (farthest_pose_sampling).
+            The pose-based methods need the (num_frames, 4, 4) camera_to_worlds.
+        image_paths: Images of all frames, needed for the similarity check.
+        similarity: If given, keyframes with a thumbnail correlation above it to the previous keyframe are
+            dropped (see drop_similar).
+
+    Returns:
+        The indices of the selected frames in trajectory order.
+    """
+    if method == "uniform":
+        indices = np.unique(np.round(np.linspace(0, num_frames - 1, min(count, num_frames))).astype(np.int64))
+    elif camera_to_worlds is None:
+        raise ValueError(f"Keyframe selection {method} needs camera poses")
+    elif method == "motion":
+        indices = select_count_by_motion(camera_to_worlds, count, translation, rotation)
+    elif method == "fps":
+        indices = farthest_pose_sampling(camera_to_worlds, count, rotation_weight)
+    else:
+        raise ValueError(f"Unknown keyframe selection {method}, expected one of {SELECTION_METHODS}")
+
+    if similarity is not None:
+        indices = drop_similar(image_paths, indices, similarity, workers=workers)
+    return indices
+
+def add_keyframe_arguments(parser):
+    """
+    Adds the keyframe selection options shared by the downsampling scripts.
+    """
+    parser.add_argument('--selection', choices=SELECTION_METHODS, default="uniform",
+                        help="How the frames of each downsampled subset are chosen: every nth (uniform), by camera motion or by farthest-point sampling of the poses. A factor k keeps about 1/k of the frames.")
+    parser.add_argument('--similarity', type=float, default=None, help="Also drop frames whose thumbnail correlates above this with the previous kept frame, e.g. 0.95.")
+    parser.add_argument('--translation', type=float, default=0.05, help="Translation threshold of the motion selection, relative to the rotation threshold.")
+    parser.add_argument('--rotation', type=float, default=5.0, help="Rotation threshold in degrees of the motion selection.")
+    parser.add_argument('--rotation_weight', type=float, default=1.0, help="Scene units one radian of rotation counts as in farthest-point sampling.")
+    return parser
+
+def keyframe_options(args):
+    """
+    The select_keyframes options of parsed add_keyframe_arguments, or None for plain every-nth subsampling.
+    """
+    if args.selection == "uniform" and args.similarity is None:
+        return None
+    return {"method": args.selection, "similarity": args.similarity, "translation": args.translation,
+            "rotation": args.rotation, "rotation_weight": args.rotation_weight}
+
+if __name__ == "__main__":
+    """
+    Print the keyframes of a Replica trajectory.
+
+    Usage:
+    python -m data_loading.keyframes <scene>/traj.txt --count 200 --selection fps
+    """
+    parser = argparse.ArgumentParser(description="Select coverage-aware keyframes of a trajectory.")
+    parser.add_argument('trajectory', help="traj.txt with one flattened 4x4 camera-to-world matrix per line.")
+    parser.add_argument('--count', type=int, required=True, help="Maximum number of keyframes.")
+    add_keyframe_arguments(parser)
+    args = parser.parse_args()
+
+    poses = load_trajectory(args.trajectory)
+    if args.similarity is not None:
+        parser.error("--similarity needs the images, use it through the downsampling scripts")
+    indices = select_keyframes(len(poses), args.count, camera_to_worlds=poses, **(keyframe_options(args) or {}))
+    print(" ".join(map(str, indices)))
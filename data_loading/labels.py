@@ -0,0 +1,31 @@
+"""
+Label sets of the evaluation datasets, shared by the data loaders, the text-embedding cache and the
+evaluation scripts.
+"""
+
+# ScanNet 20-class benchmark, as used by PlenoxelScannetDataset in data_loader.ipynb
+CLASS_LABELS = (
+    "wall", "floor", "cabinet", "bed", "chair", "sofa", "table", "door", "window", "bookshelf",
+    "picture", "counter", "desk", "curtain", "refrigerator", "shower curtain", "toilet", "sink", "bathtub",
+    "otherfurniture",
+)
+
+VALID_CLASS_IDS = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 14, 16, 24, 28, 33, 34, 36, 39)
+
+CLASS_LABELS_INSTANCE = CLASS_LABELS[2:]
+
+VALID_CLASS_IDS_INSTANCE = VALID_CLASS_IDS[2:]
+
+# Semantic classes of the Replica scenes evaluated by OpenNeRF
+REPLICA_CLASSES = (
+    "basket", "bed", "bench", "bin", "blanket", "blinds", "book", "bottle", "box", "bowl",
+    "camera", "cabinet", "candle", "chair", "clock", "cloth", "comforter", "cushion", "desk", "desk-organizer",
+    "door", "indoor-plant", "lamp", "monitor", "nightstand", "panel", "picture", "pillar", "pillow", "pipe",
+    "plant-stand", "plate", "pot", "sculpture", "shelf", "sofa", "stool", "switch", "table", "tablet",
+    "tissue-paper", "tv-screen", "tv-stand", "vase", "vent", "wall-plug", "window", "rug",
+)
+
+LABEL_SETS = {
+    "scannet": CLASS_LABELS,
+    "replica": REPLICA_CLASSES,
+}
@@ -4,8 +4,13 @@ import struct
 import collections
 import json
 import os
-import shutil
-from tqdm import tqdm
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from data_loading.transfer import TRANSFER_MODES, prune_files, transfer_files
+from data_loading.splat_ply import map_vertices
+from data_loading.trajectory import load_trajectory
+from data_loading.keyframes import add_keyframe_arguments, keyframe_options, select_keyframes
 
 # Camera Models taken from Gaussian Splatting repository
 CameraModel = collections.namedtuple(
@@ -32,41 +37,234 @@ CAMERA_MODEL_IDS = dict([(camera_model.model_id, camera_model)
 CAMERA_MODEL_NAMES = dict([(camera_model.model_name, camera_model)
                            for camera_model in CAMERA_MODELS])
 
+# Fixed-size parts of the records of COLMAP's binary sparse model (see read_write_model.py in COLMAP)
+IMAGE_HEADER = np.dtype([("image_id", "<i4"), ("qvec", "<f8", 4), ("tvec", "<f8", 3), ("camera_id", "<i4")])
+POINT3D_RECORD = np.dtype([("point3D_id", "<u8"), ("xyz", "<f8", 3), ("rgb", "u1", 3), ("error", "<f8"), ("track_length", "<u8")])
+
+def write_cameras_binary(path, camera_ids, model_name, widths, heights, params):
+    """
+    Writes a COLMAP cameras.bin with one record per camera. params is (num_cameras, num_params) in the
+    parameter order of the camera model in CAMERA_MODEL_NAMES.
+    """
+    model = CAMERA_MODEL_NAMES[model_name]
+    params = np.atleast_2d(np.asarray(params, dtype=np.float64))
+    if params.shape[1] != model.num_params:
+        raise ValueError(f"{model_name} takes {model.num_params} parameters, got {params.shape[1]}")
+    records = np.zeros(len(params), dtype=[("camera_id", "<i4"), ("model_id", "<i4"), ("width", "<u8"), ("height", "<u8"),
+                                           ("params", "<f8", model.num_params)])
+    records["camera_id"], records["model_id"] = camera_ids, model.model_id
+    records["width"], records["height"], records["params"] = widths, heights, params
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(records)))
+        f.write(records.tobytes())
+
+def write_images_binary(path, qvecs, tvecs, names, camera_ids=1):
+    """
+    Writes a COLMAP images.bin of posed images without 2D points. Records have a variable-length name, so
+    they are assembled by scattering the fixed-size headers, names and point counts into one byte buffer.
+
+    Args:
+        qvecs: (N, 4) world-to-camera rotations as (w, x, y, z) quaternions.
+        tvecs: (N, 3) world-to-camera translations.
+        names: Image file names relative to the images folder.
+    """
+    headers = np.zeros(len(names), dtype=IMAGE_HEADER)
+    headers["image_id"] = np.arange(1, len(names) + 1)
+    headers["qvec"], headers["tvec"], headers["camera_id"] = qvecs, tvecs, camera_ids
+
+    encoded = [name.encode("utf-8") + b"\0" for name in names]
+    name_lengths = np.array([len(name) for name in encoded], dtype=np.int64)
+    record_lengths = IMAGE_HEADER.itemsize + name_lengths + 8
+    starts = np.concatenate([[0], np.cumsum(record_lengths)[:-1]])
+
+    buffer = np.zeros(record_lengths.sum(), dtype=np.uint8)  # num_points2D stays 0
+    buffer[(starts[:, None] + np.arange(IMAGE_HEADER.itemsize)).ravel()] = headers.view(np.uint8)
+    name_starts = starts + IMAGE_HEADER.itemsize
+    name_offsets = np.repeat(name_starts - np.concatenate([[0], np.cumsum(name_lengths)[:-1]]), name_lengths)
+    buffer[np.arange(name_lengths.sum()) + name_offsets] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(names)))
+        f.write(buffer.tobytes())
+
+def write_points3D_binary(path, xyz, rgb):
+    """
+    Writes a COLMAP points3D.bin without tracks, which is all Gaussian Splatting reads from it.
+    """
+    records = np.zeros(len(xyz), dtype=POINT3D_RECORD)
+    records["point3D_id"] = np.arange(1, len(xyz) + 1)
+    records["xyz"], records["rgb"] = xyz, rgb
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(records)))
+        f.write(records.tobytes())
+
+def world_to_camera(camera_to_worlds):
+    """
+    Converts (N, 4, 4) camera-to-world poses in the OpenCV convention of Replica's traj.txt into COLMAP's
+    world-to-camera (w, x, y, z) quaternions and translations.
+    """
+    rotations = np.transpose(camera_to_worlds[:, :3, :3], (0, 2, 1))
+    tvecs = -np.einsum("nij,nj->ni", rotations, camera_to_worlds[:, :3, 3])
+    qvecs = R.from_matrix(rotations).as_quat()[:, [3, 0, 1, 2]]
+    return qvecs, tvecs
+
+def initial_points(mesh_path, camera_to_worlds, max_points=100_000, seed=0):
+    """
+    Points and colours for points3D.bin: a random subset of the scene mesh vertices if the mesh exists,
+    otherwise random grey points in the bounding box of the camera positions (like the random initialization
+    of Gaussian Splatting for synthetic scenes).
+    """
+    rng = np.random.default_rng(seed)
+    if mesh_path is not None and os.path.isfile(mesh_path):
+        vertices = map_vertices(mesh_path)
+        rows = np.sort(rng.choice(len(vertices), min(max_points, len(vertices)), replace=False))
+        subset = vertices[rows]
+        xyz = np.stack([subset["x"], subset["y"], subset["z"]], axis=1)
+        names = vertices.dtype.names
+        rgb = np.stack([subset[c] for c in ("red", "green", "blue")], axis=1) if "red" in names else np.full((len(rows), 3), 128)
+        return xyz, rgb
+    centers = camera_to_worlds[:, :3, 3]
+    low, high = centers.min(axis=0) - 1.0, centers.max(axis=0) + 1.0
+    return rng.uniform(low, high, size=(max_points, 3)), np.full((max_points, 3), 128)
+
+def write_colmap_model(scene_path, images_folder='images', cam_params_path=None, mesh_path=None, max_points=100_000, points=None):
+    """
+    Writes sparse/0/{cameras,images,points3D}.bin of a Replica scene directly from the exact poses in
+    traj.txt and the intrinsics in cam_params.json, so Gaussian Splatting / SAGA can train on the scene
+    without running convert.py (COLMAP feature extraction and mapping).
+
+    Args:
+        scene_path: Path to the Replica scene containing traj.txt and the extracted images.
+        images_folder: Folder of the frames to register, named frame<index>.jpg after their row in traj.txt.
+        cam_params_path: Defaults to cam_params.json next to the scene folder.
+        mesh_path: Mesh the initial points are sampled from. Defaults to <scene>_mesh.ply next to the scene folder.
+        max_points: Number of initial points.
+        points: (xyz, rgb) initial points to write instead, e.g. from data_loading.depth_fusion.
+
+    Returns:
+        The path of the sparse model folder.
+    """
+    scene_path = os.path.abspath(scene_path)
+    parent, scene = os.path.split(scene_path)
+    cam_params_path = cam_params_path or os.path.join(parent, 'cam_params.json')
+    mesh_path = mesh_path or os.path.join(parent, f'{scene}_mesh.ply')
+
+    with open(cam_params_path) as f:
+        camera = json.load(f)['camera']
+    names = sorted([f for f in os.listdir(os.path.join(scene_path, images_folder)) if f.startswith('frame') and f.endswith('.jpg')])
+    camera_to_worlds = load_trajectory(os.path.join(scene_path, 'traj.txt'))[[int(name[len('frame'):-len('.jpg')]) for name in names]]
+
+    sparse_path = os.path.join(scene_path, 'sparse', '0')
+    os.makedirs(sparse_path, exist_ok=True)
+    write_cameras_binary(os.path.join(sparse_path, 'cameras.bin'), [1], 'PINHOLE', camera['w'], camera['h'],
+                         [[camera['fx'], camera['fy'], camera['cx'], camera['cy']]])
+    qvecs, tvecs = world_to_camera(camera_to_worlds)
+    write_images_binary(os.path.join(sparse_path, 'images.bin'), qvecs, tvecs, names)
+    xyz, rgb = points if points is not None else initial_points(mesh_path, camera_to_worlds, max_points)
+    write_points3D_binary(os.path.join(sparse_path, 'points3D.bin'), xyz, rgb)
+    return sparse_path
+
 def get_scenes(replica_path):
     all_items = os.listdir(replica_path)
     scene_names = [item for item in all_items if os.path.isdir(os.path.join(replica_path, item))]
 
     return scene_names
 
-def extract_images(scene_path):
+def _is_frame(name):
+    return name.startswith('frame') and name.endswith('.jpg')
+
+def frame_subset(scene_path, images, downsampling_factor, keyframes=None, workers=8):
+    """
+    The frames of images_<k>: every k-th frame, or with keyframes (options of
+    data_loading.keyframes.select_keyframes) at most 1/k of the frames selected from their traj.txt poses.
+    """
+    if keyframes is None:
+        return images[::downsampling_factor]
+    camera_to_worlds = load_trajectory(os.path.join(scene_path, 'traj.txt'))[[int(name[len('frame'):-len('.jpg')]) for name in images]]
+    indices = select_keyframes(len(images), -(-len(images) // downsampling_factor), camera_to_worlds=camera_to_worlds,
+                               image_paths=[os.path.join(scene_path, 'results', img) for img in images], workers=workers, **keyframes)
+    return [images[i] for i in indices]
+
+def extract_scene(scene_path, downsampling_factors=(), mode='link', workers=8, keyframes=None):
+    """
+    Fills images/ and every images_<k> subset of a Replica scene in a single pass over results/. Frames
+    left in a folder by an earlier run with a different selection are removed.
+
+    Args:
+        scene_path: Path to the Replica scene containing results/.
+        downsampling_factors: Factors k for which images_<k> receives every k-th frame.
+        mode: Transfer mode, see data_loading.transfer.transfer_file.
+        workers: Number of transfer threads.
+        keyframes: Keyframe selection options for the images_<k> subsets, see frame_subset.
+
+    Returns:
+        Transfer statistics including throughput in files/s and MB/s and the number of removed frames.
+    """
     results_path = os.path.join(scene_path, 'results')
-    images_path = os.path.join(scene_path, 'images')
+    images = sorted([f for f in os.listdir(results_path) if _is_frame(f)])
+
+    targets = [('images', images)] + [(f'images_{k}', frame_subset(scene_path, images, k, keyframes, workers)) for k in downsampling_factors]
+    pairs, removed = [], 0
+    for folder, subset in targets:
+        os.makedirs(os.path.join(scene_path, folder), exist_ok=True)
+        # write_colmap_model and fuse_depth use every frame in the folder
+        removed += prune_files(os.path.join(scene_path, folder), subset, _is_frame)
+        pairs += [(os.path.join(results_path, img), os.path.join(scene_path, folder, img)) for img in subset]
 
-    os.makedirs(images_path, exist_ok=True)
-    images = sorted([f for f in os.listdir(results_path) if f.startswith('frame') and f.endswith('.jpg')])
+    start_time = time.time()
+    stats = transfer_files(pairs, mode=mode, workers=workers, desc=f'Extracting {os.path.basename(scene_path)}')
+    stats['removed'] = removed
+    elapsed = max(time.time() - start_time, 1e-9)
+    stats['files_per_second'] = stats['transferred'] / elapsed
+    stats['mb_per_second'] = stats['bytes'] / 1024 ** 2 / elapsed
+    return stats
 
-    with tqdm(total=len(images), desc=f'Extracting images', unit="file") as pbar:
-        for img in images:
-            src = os.path.join(results_path, img)
-            dst = os.path.join(images_path, img)
-            
-            shutil.copy(src, dst)
-            pbar.update(1)
+def extract_all_scenes(replica_path, downsampling_factors=(), mode='link', workers=8, scene_workers=4, colmap=False,
+                       max_points=100_000, keyframes=None):
+    """
+    Runs extract_scene for every scene returned by get_scenes, several scenes at a time. With colmap, the
+    sparse model of every scene is written by write_colmap_model as well.
+    """
+    scenes = get_scenes(replica_path)
 
+    def work(scene):
+        stats = extract_scene(os.path.join(replica_path, scene), downsampling_factors, mode, workers, keyframes)
+        if colmap:
+            write_colmap_model(os.path.join(replica_path, scene), max_points=max_points)
+        return scene, stats
+
+    with ThreadPoolExecutor(max_workers=max(1, scene_workers)) as pool:
+        for scene, stats in pool.map(work, scenes):
+            print(f"{scene}: {stats['transferred']} files ({stats['files_per_second']:.1f} files/s, "
+                  f"{stats['mb_per_second']:.1f} MB/s), {stats['skipped']} up to date, {stats['removed']} removed")
+
+def extract_images(scene_path):
+    extract_scene(scene_path, mode='copy')
 
-def downsample_images(scene_path, downsampling_factor):
+def downsample_images(scene_path, downsampling_factor, keyframes=None):
 
     images_path = os.path.join(scene_path, 'images')
     downsampled_path = os.path.join(scene_path, f'images_{downsampling_factor}')
 
     os.makedirs(downsampled_path, exist_ok=True)
-    images = sorted([f for f in os.listdir(images_path) if f.startswith('frame') and f.endswith('.jpg')])
+    images = sorted([f for f in os.listdir(images_path) if _is_frame(f)])
 
-    with tqdm(total=len(images)//downsampling_factor, desc=f'Downsampling images', unit="file") as pbar:
-        for i in range(0, len(images), downsampling_factor):
-            src = os.path.join(images_path, images[i])
-            dst = os.path.join(downsampled_path, images[i])
+    subset = frame_subset(scene_path, images, downsampling_factor, keyframes)
+    prune_files(downsampled_path, subset, _is_frame)
+    pairs = [(os.path.join(images_path, img), os.path.join(downsampled_path, img)) for img in subset]
+    transfer_files(pairs, mode='copy', desc='Downsampling images')
 
-            shutil.copy(src, dst)
-            pbar.update(1)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract Replica frames into images/ and images_<k>/ for all scenes.")
+    parser.add_argument('replica_path', help="Path to the Replica dataset containing one folder per scene.")
+    parser.add_argument('--downsample', type=int, nargs='*', default=[], help="Factors k for the images_<k> subsets, e.g. 2 4 8")
+    parser.add_argument('--mode', choices=TRANSFER_MODES, default='link', help="How frames are placed, see data_loading/transfer.py")
+    parser.add_argument('--workers', type=int, default=8, help="Transfer threads per scene.")
+    parser.add_argument('--scene_workers', type=int, default=4, help="Number of scenes processed at the same time.")
+    parser.add_argument('--colmap', action='store_true', help="Also write sparse/0/ from the Replica poses instead of running convert.py.")
+    parser.add_argument('--max_points', type=int, default=100_000, help="Number of initial points in points3D.bin.")
+    add_keyframe_arguments(parser)
+    args = parser.parse_args()
 
+    keyframes = keyframe_options(args)
+    extract_all_scenes(args.replica_path, args.downsample, args.mode, args.workers, args.scene_workers, args.colmap, args.max_points,
+                       keyframes)
@@ -0,0 +1,136 @@
+import os
+import re
+import json
+import argparse
+from pathlib import Path
+from typing import List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from tqdm import tqdm
+from data_loading.transfer import TRANSFER_MODES, transfer_file
+
+def pyramid_dirs(image_dir: Path, num_downscales: int) -> List[Path]:
+    """Output folders of all levels, following the nerfstudio layout: images, images_2, images_4, ..."""
+    return [image_dir] + [image_dir.parent / f"{image_dir.name}_{2 ** level}" for level in range(1, num_downscales + 1)]
+
+def sources_path(image_dir: Path) -> Path:
+    """Sidecar next to image_dir recording the source every output name was built from."""
+    return image_dir.parent / f"{image_dir.name}.sources.json"
+
+def source_identity(src: Path) -> list:
+    stat = src.stat()
+    return [str(src.resolve()), stat.st_size, stat.st_mtime_ns]
+
+def _load_sources(image_dir: Path) -> dict:
+    try:
+        with open(sources_path(image_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_sources(image_dir: Path, sources: dict):
+    path = sources_path(image_dir)
+    tmp = path.with_name(path.name + ".part")
+    with open(tmp, "w") as f:
+        json.dump(sources, f)
+    os.replace(tmp, path)
+
+def build_levels(src: Path, outputs: List[Path], mode: str = "copy", quality: int = 95) -> bool:
+    """Writes all pyramid levels of a single image from one decode.
+
+    Level 0 is the original file. The downscaled levels are decoded once at half resolution in the DCT
+    domain (JPEG draft mode) and every further level is reduced from that image.
+
+    Returns:
+        True once the outputs are written.
+    """
+    for out in outputs:
+        out.parent.mkdir(parents=True, exist_ok=True)
+    transfer_file(str(src), str(outputs[0]), mode)
+    if len(outputs) == 1:
+        return True
+
+    with Image.open(src) as img:
+        width, height = img.size
+        # Let libjpeg scale by 1/2 while decoding, which is much cheaper than a full decode plus resize
+        img.draft("RGB", (width // 2, height // 2))
+        base = img.convert("RGB")
+
+    for level, out in enumerate(outputs[1:], start=1):
+        size = (max(1, width // 2 ** level), max(1, height // 2 ** level))
+        factor = max(1, base.width // size[0])
+        level_img = base.reduce(factor) if factor > 1 else base
+        if level_img.size != size:
+            level_img = level_img.resize(size, Image.Resampling.BICUBIC)
+        tmp = out.with_name(out.name + ".part")
+        level_img.save(tmp, format="JPEG", quality=quality)
+        os.replace(tmp, out)
+    return True
+
+def _build_levels(job):
+    return build_levels(*job)
+
+def build_pyramid(image_paths: List[Path], image_dir: Path, num_downscales: int = 3, image_prefix: Optional[str] = "frame_",
+                  workers: Optional[int] = None, mode: str = "copy", verbose: bool = False) -> List[Path]:
+    """Copies images into image_dir and writes num_downscales downscaled copies (2x, 4x, ...) of each.
+
+    This is a drop-in replacement for nerfstudio's copy_images_list that decodes every image once and
+    runs on a process pool. The source of every output name (path, size and mtime) is recorded in
+    sources_path(image_dir); images whose outputs exist and were built from the identical source are
+    skipped. Outputs of earlier builds that are not part of this one are deleted from all levels.
+
+    Args:
+        image_paths: Source images.
+        image_dir: Folder of the full resolution images.
+        num_downscales: Number of downscaled levels.
+        image_prefix: Output names are <prefix><index:05d><suffix> as in nerfstudio. None keeps the source names.
+        workers: Number of worker processes, defaults to the number of cores.
+        mode: How the full resolution images are placed, see data_loading.transfer.transfer_file.
+        verbose: Whether to report the number of skipped images.
+
+    Returns:
+        Paths of the full resolution images in image_dir.
+    """
+    image_dir = Path(image_dir)
+    dirs = pyramid_dirs(image_dir, num_downscales)
+    previous = _load_sources(image_dir)
+
+    sources, jobs, paths = {}, [], []
+    for i, src in enumerate(image_paths):
+        src = Path(src)
+        name = src.name if image_prefix is None else f"{image_prefix}{i + 1:05d}{src.suffix}"
+        outputs = [d / name for d in dirs]
+        sources[name] = source_identity(src)
+        paths.append(outputs[0])
+        # Names are positional, so an existing output may belong to a different frame than before
+        if previous.get(name) != sources[name] or not all(out.exists() for out in outputs):
+            jobs.append((src, outputs, mode))
+
+    # Outputs of an earlier, larger or different subset, e.g. after changing the keyframe selection
+    pattern = re.compile(rf"{re.escape(image_prefix)}\d{{5}}\.\w+$") if image_prefix is not None else None
+    for d in dirs:
+        if not d.is_dir():
+            continue
+        for out in d.iterdir():
+            if out.name not in sources and (out.name in previous or (pattern is not None and pattern.match(out.name))):
+                out.unlink()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(tqdm(pool.map(_build_levels, jobs, chunksize=8), total=len(jobs), desc="Building image pyramid", unit="image"))
+    _save_sources(image_dir, sources)
+
+    if verbose:
+        print(f"Built {len(jobs)} image pyramids, {len(paths) - len(jobs)} were up to date.")
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build images_2/4/8... pyramids for a folder of images, e.g. a SAGA input/ tree.")
+    parser.add_argument('input_dir', help="Folder with the full resolution images.")
+    parser.add_argument('output_dir', help="Folder receiving the full resolution images; levels go next to it as <output_dir>_<k>.")
+    parser.add_argument('--num_downscales', type=int, default=3, help="Number of downscaled levels (3 gives 2x, 4x and 8x).")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes.")
+    parser.add_argument('--mode', choices=TRANSFER_MODES, default='copy', help="How full resolution images are placed.")
+    args = parser.parse_args()
+
+    images = sorted(p for p in Path(args.input_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    build_pyramid(images, Path(args.output_dir), args.num_downscales, image_prefix=None, workers=args.workers, mode=args.mode, verbose=True)
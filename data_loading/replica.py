@@ -1,22 +1,46 @@
 import numpy as np
-import open3d as o3d
 from pathlib import Path
 from nerfstudio.process_data import process_data_utils, record3d_utils
 import json
+import os
 from nerfstudio.process_data.process_data_utils import CAMERA_MODELS
 from typing import Optional, List
-
-def process_replica(data: Path, output_dir: Path):
+from data_loading.pyramid import build_pyramid
+from data_loading.camera_bundle import write_camera_bundle
+from data_loading.keyframes import select_keyframes
+from data_loading.trajectory import load_trajectory
+
+# Rotation by pi around x, converts Replica camera poses to the nerfstudio/OpenGL convention
+ROT_X = np.array([
+    [1.0, 0.0, 0.0, 0.0],
+    [0.0, np.cos(np.pi), -np.sin(np.pi), 0.0],
+    [0.0, np.sin(np.pi), np.cos(np.pi), 0.0],
+    [0.0, 0.0, 0.0, 1.0],
+])
+
+def process_replica(data: Path, output_dir: Path, visualize: bool = False, mesh_path: Optional[Path] = None,
+                    max_preview_points: int = 200_000, workers: Optional[int] = None, keyframes: Optional[dict] = None):
     """Process Replica data into a nerfstudio dataset.
 
     This script does the following:
 
     1. Scales images to a specified size.
     2. Converts Record3D poses into the nerfstudio format.
+    3. Optionally saves a pyviz3d preview of the cameras and the scene mesh.
+
+    Args:
+        data: Path to the Replica scene (containing results/ and traj.txt).
+        output_dir: Path to the nerfstudio dataset to create.
+        visualize: Whether to save the pyviz3d preview. open3d and pyviz3d are only imported in that case.
+        mesh_path: Mesh shown in the preview. Defaults to <scene>_mesh.ply next to the scene folder.
+        max_preview_points: Point budget of the voxel-downsampled mesh preview.
+        workers: Number of processes used to build the image pyramid, defaults to the number of cores.
+        keyframes: Options of data_loading.keyframes.select_keyframes choosing the frames of a scene with more
+            than max_dataset_size frames from their poses. Evenly spaced frames are used by default.
     """
 
-    mesh_path = data / '..' / 'office0_mesh.ply'  # why do we need this?
-    scene_point_cloud = o3d.io.read_point_cloud(str(mesh_path))
+    if visualize and mesh_path is None:
+        mesh_path = data.parent / f'{data.name}_mesh.ply'
     verbose = True
     num_downscales = 3
     """Number of times to downscale the images. Downscales by 2 each time. For example a value of 3
@@ -46,16 +70,22 @@ def process_replica(data: Path, output_dir: Path):
     num_images = len(replica_image_filenames)
     idx = np.arange(num_images)
     if max_dataset_size != -1 and num_images > max_dataset_size:
-        idx = np.round(np.linspace(0, num_images - 1, max_dataset_size)).astype(int)
+        if keyframes is None:
+            idx = np.round(np.linspace(0, num_images - 1, max_dataset_size)).astype(int)
+        else:
+            camera_to_worlds = load_trajectory(data / "traj.txt")[:num_images]
+            idx = select_keyframes(num_images, max_dataset_size, camera_to_worlds=camera_to_worlds,
+                                   image_paths=replica_image_filenames, **keyframes)
 
     replica_image_filenames = list(np.array(replica_image_filenames)[idx])
 
-    # Copy images to output directory
-    copied_image_paths = process_data_utils.copy_images_list(
+    # Copy images to output directory and write the 2x/4x/8x levels from a single decode per image
+    copied_image_paths = build_pyramid(
         replica_image_filenames,
         image_dir=image_dir,
-        verbose=verbose,
         num_downscales=num_downscales,
+        workers=workers,
+        verbose=verbose,
     )
     num_frames = len(copied_image_paths)
 
@@ -68,9 +98,11 @@ def process_replica(data: Path, output_dir: Path):
         )
 
     traj_path = data / "traj.txt"
-    replica_to_json(copied_image_paths, traj_path, output_dir, indices=idx, scene_point_cloud=scene_point_cloud)
+    replica_to_json(copied_image_paths, traj_path, output_dir, indices=idx, visualize=visualize, mesh_path=mesh_path,
+                    max_preview_points=max_preview_points)
 
-def replica_to_json(images_paths: List[Path], trajectory_txt: Path, output_dir: Path, indices: np.ndarray, scene_point_cloud) -> int:
+def replica_to_json(images_paths: List[Path], trajectory_txt: Path, output_dir: Path, indices: np.ndarray,
+                    visualize: bool = False, mesh_path: Optional[Path] = None, max_preview_points: int = 200_000) -> int:
     """Converts Replica's metadata and image paths to a JSON file.
 
     Args:
@@ -78,6 +110,9 @@ def replica_to_json(images_paths: List[Path], trajectory_txt: Path, output_dir:
         traj_path: Path to the Replica trajectory file.
         output_dir: Path to the output directory.
         indices: Indices to sample the metadata_path. Should be the same length as images_paths.
+        visualize: Whether to save a pyviz3d preview of the cameras to output_dir / 'visualization'.
+        mesh_path: Optional mesh added to the preview.
+        max_preview_points: Point budget of the mesh preview.
 
     Returns:
         The number of registered images.
@@ -88,11 +123,7 @@ def replica_to_json(images_paths: List[Path], trajectory_txt: Path, output_dir:
     # metadata_dict = io.load_from_json(metadata_path)
     # poses_data = np.array(metadata_dict["poses"])  # (N, 3, 4)
 
-    poses_data = process_txt(trajectory_txt)
-    poses_data = np.array(
-            [np.array(
-                [float(v) for v in p.split()]).reshape((4, 4)) for p in poses_data]
-        )
+    poses_data = load_trajectory(trajectory_txt)
     # NB: Record3D / scipy use "scalar-last" format quaternions (x y z w)
     # https://fzheng.me/2017/11/12/quaternion_conventions_en/
     # camera_to_worlds = np.concatenate(
@@ -100,25 +131,11 @@ def replica_to_json(images_paths: List[Path], trajectory_txt: Path, output_dir:
     #     axis=-1,
     # ).astype(np.float32)
 
-    rot_x = np.eye(4)
-    a = np.pi
-    rot_x[1, 1] = np.cos(a)
-    rot_x[2, 2] = np.cos(a)
-    rot_x[1, 2] = -np.sin(a)
-    rot_x[2, 1] = np.sin(a)
+    # Batched over all selected frames: (N, 4, 4) @ (4, 4)
+    camera_to_worlds = poses_data[indices] @ ROT_X
 
-    camera_to_worlds = poses_data[indices] @ rot_x
-
-    import pyviz3d.visualizer as viz
-    v = viz.Visualizer()
-    for i in range(camera_to_worlds.shape[0]):
-        c2w = camera_to_worlds[i, 0:3, :]
-        origin = c2w @ np.array([0, 0, 0, 1])
-        v.add_arrow(f'{i};Arrow_1', start=origin, end=c2w @ np.array([0.1, 0.0, 0.0, 1]), color=np.array([255, 0, 0]), stroke_width=0.005, head_width=0.01)
-        v.add_arrow(f'{i};Arrow_2', start=origin, end=c2w @ np.array([0.0, 0.1, 0.0, 1]), color=np.array([0, 255, 0]), stroke_width=0.005, head_width=0.01)
-        v.add_arrow(f'{i};Arrow_3', start=origin, end=c2w @ np.array([0.0, 0.0, 0.1, 1]), color=np.array([0, 0, 255]), stroke_width=0.005, head_width=0.01)
-    v.add_points('scene', np.array(scene_point_cloud.points), np.array(scene_point_cloud.colors) * 255, np.array(scene_point_cloud.normals))
-    v.save('example_arrows')
+    if visualize:
+        save_camera_preview(camera_to_worlds, output_dir / 'visualization', mesh_path, max_preview_points)
 
     frames = []
     for i, im_path in enumerate(images_paths):
@@ -157,10 +174,43 @@ def replica_to_json(images_paths: List[Path], trajectory_txt: Path, output_dir:
 
     with open(output_dir / "transforms.json", "w", encoding="utf-8") as f:
         json.dump(out, f, indent=4)
+
+    # Binary copy of the same cameras for fast, memory-mapped loading (see data_loading/camera_bundle.py)
+    intrinsics = {k: v for k, v in out.items() if k != "frames"}
+    write_camera_bundle(output_dir, camera_to_worlds, [frame["file_path"] for frame in frames], intrinsics)
     return len(frames)
 
-def process_txt(filename):
-    with open(filename) as file:
-        lines = file.readlines()
-        lines = [line.rstrip() for line in lines]
-    return lines
+def load_preview_point_cloud(mesh_path: Path, max_points: int = 200_000):
+    """Loads a mesh as point cloud and voxel-downsamples it until it has at most max_points points."""
+    import open3d as o3d
+
+    point_cloud = o3d.io.read_point_cloud(str(mesh_path))
+    num_points = len(point_cloud.points)
+    if num_points <= max_points:
+        return point_cloud
+
+    # Start from the voxel size that spreads the budget evenly over the bounding box and grow it
+    extent = point_cloud.get_max_bound() - point_cloud.get_min_bound()
+    voxel_size = max(float(np.cbrt(np.prod(np.maximum(extent, 1e-6)) / max_points)), 1e-6)
+    preview = point_cloud.voxel_down_sample(voxel_size)
+    while len(preview.points) > max_points:
+        voxel_size *= 1.25
+        preview = point_cloud.voxel_down_sample(voxel_size)
+    return preview
+
+def save_camera_preview(camera_to_worlds: np.ndarray, output_path: Path, mesh_path: Optional[Path] = None,
+                        max_points: int = 200_000):
+    """Saves a pyviz3d scene with three axis arrows per camera and an optional downsampled mesh preview."""
+    import pyviz3d.visualizer as viz
+    v = viz.Visualizer()
+    for i in range(camera_to_worlds.shape[0]):
+        c2w = camera_to_worlds[i, 0:3, :]
+        origin = c2w @ np.array([0, 0, 0, 1])
+        v.add_arrow(f'{i};Arrow_1', start=origin, end=c2w @ np.array([0.1, 0.0, 0.0, 1]), color=np.array([255, 0, 0]), stroke_width=0.005, head_width=0.01)
+        v.add_arrow(f'{i};Arrow_2', start=origin, end=c2w @ np.array([0.0, 0.1, 0.0, 1]), color=np.array([0, 255, 0]), stroke_width=0.005, head_width=0.01)
+        v.add_arrow(f'{i};Arrow_3', start=origin, end=c2w @ np.array([0.0, 0.0, 0.1, 1]), color=np.array([0, 0, 255]), stroke_width=0.005, head_width=0.01)
+    if mesh_path is not None:
+        scene_point_cloud = load_preview_point_cloud(mesh_path, max_points)
+        normals = np.asarray(scene_point_cloud.normals) if scene_point_cloud.has_normals() else None
+        v.add_points('scene', np.asarray(scene_point_cloud.points), np.asarray(scene_point_cloud.colors) * 255, normals)
+    v.save(str(output_path))
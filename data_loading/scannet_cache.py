@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import argparse
+import warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from data_loading.labels import VALID_CLASS_IDS
+from data_loading.splat_ply import map_vertices
+
+NUM_LABELS = 41
+ARRAYS = ("coords", "feats", "labels", "instances")
+EXTRAS = ("trans_info.npz", "init.npy")
+DATA_PATH_FILE = {
+    "train": "scannetv2_train.txt",
+    "val": "scannetv2_val.txt",
+    "test": "scannetv2_test.txt",
+}
+
+def read_split(data_root, phase):
+    """
+    Scene ids of a split, read from data/split/ for a data_root of "data/", like PlenoxelScannetDataset in data_loader.ipynb.
+    """
+    with open(os.path.join(os.path.dirname(data_root), "split", DATA_PATH_FILE[phase])) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def read_scene_ply(path):
+    """
+    Returns the vertices of a ScanNet scene PLY as a structured array. Binary files are memory-mapped, ASCII
+    files are parsed with plyfile.
+    """
+    try:
+        return map_vertices(path)
+    except ValueError:
+        from plyfile import PlyData
+        return PlyData.read(path).elements[0].data
+
+def _fill_scene(vertices, arrays, start):
+    end = start + len(vertices)
+    names = vertices.dtype.names
+    for i, axis in enumerate("xyz"):
+        arrays["coords"][start:end, i] = vertices[axis]
+    for i, channel in enumerate(("red", "green", "blue")):
+        arrays["feats"][start:end, i] = vertices[channel]
+    # Same defaults as load_ply: unlabelled points get ScanNet id 0, missing instances are all 1
+    arrays["labels"][start:end] = vertices["label"] if "label" in names else 0
+    arrays["instances"][start:end] = vertices["instance"] if "instance" in names else 1
+
+def _load_extras(scene_dir):
+    """
+    Loads the per-scene arrays of trans_info.npz and init.npy without unpickling. Files that only load with
+    allow_pickle (or are not valid numpy files at all, like the LFS pointers of PeRFception-ScanNet) are skipped.
+    """
+    extras = {}
+    for name in EXTRAS:
+        path = os.path.join(scene_dir, name)
+        if not os.path.isfile(path):
+            continue
+        key = name.split(".")[0]
+        try:
+            loaded = np.load(path, allow_pickle=False)
+            if isinstance(loaded, np.lib.npyio.NpzFile):
+                with loaded:
+                    extras.update({f"{key}/{field}": loaded[field] for field in loaded.files})
+            else:
+                extras[key] = loaded
+        except (ValueError, OSError) as e:
+            warnings.warn(f"Skipping {path}: {e}")
+    return extras
+
+def convert_scenes(scenes, ply_dir, output_dir, scene_root=None, workers=8, force=False):
+    """
+    Converts the PLY files of the scenes into one memory-mappable sidecar: coords and feats (N, 3) float32,
+    labels and instances (N,) int32 of all scenes concatenated, and the start of every scene in offsets.npy.
+    The numeric arrays of each scene's trans_info.npz and init.npy (in scene_root/plenoxel_scannet_<scene>/)
+    are stored once in extras/<scene>.npz.
+
+    The sidecar is only rewritten if a source PLY changed since it was built, or with force.
+
+    Returns:
+        The path of the written (or up-to-date) sidecar.
+    """
+    paths = [os.path.join(ply_dir, f"{scene}.ply") for scene in scenes]
+    sources = [_source_stat(path) for path in paths]
+    meta_path = os.path.join(output_dir, "scenes.json")
+    if not force and os.path.isfile(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta["scenes"] == list(scenes) and meta["sources"] == sources:
+            return output_dir
+
+    if os.path.isfile(meta_path):
+        os.remove(meta_path)  # Mark the sidecar incomplete until all arrays are replaced
+
+    # Headers only: the total number of points sizes the arrays before any vertex data is read
+    counts = [len(read_scene_ply(path)) for path in paths]
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    os.makedirs(os.path.join(output_dir, "extras"), exist_ok=True)
+    total = int(offsets[-1])
+    shapes = {"coords": (total, 3), "feats": (total, 3), "labels": (total,), "instances": (total,)}
+    dtypes = {"coords": np.float32, "feats": np.float32, "labels": np.int32, "instances": np.int32}
+    arrays = {name: np.lib.format.open_memmap(os.path.join(output_dir, f"{name}.tmp.npy"), mode="w+",
+                                              dtype=dtypes[name], shape=shapes[name]) for name in ARRAYS}
+
+    def convert(i):
+        # Scenes write disjoint row ranges, so they can be filled concurrently
+        _fill_scene(read_scene_ply(paths[i]), arrays, offsets[i])
+        if scene_root is not None:
+            extras = _load_extras(os.path.join(scene_root, f"plenoxel_scannet_{scenes[i]}"))
+            if extras:
+                np.savez(os.path.join(output_dir, "extras", f"{scenes[i]}.npz"), **extras)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(convert, range(len(scenes))))
+
+    for name in ARRAYS:
+        arrays[name].flush()
+        del arrays[name]
+        os.replace(os.path.join(output_dir, f"{name}.tmp.npy"), os.path.join(output_dir, f"{name}.npy"))
+    np.save(os.path.join(output_dir, "offsets.npy"), offsets)
+    with open(meta_path, "w") as f:
+        json.dump({"scenes": list(scenes), "sources": sources}, f, indent=4)
+    return output_dir
+
+def label_lookup(valid_class_ids=VALID_CLASS_IDS, ignore_label=-100, num_labels=NUM_LABELS):
+    """
+    Lookup table from ScanNet ids to contiguous class indices, with ids that are not evaluated mapped to
+    ignore_label. Equivalent to the label_map dict of PlenoxelScannetDataset.
+    """
+    lookup = np.full(num_labels, ignore_label, dtype=np.int32)
+    lookup[list(valid_class_ids)] = np.arange(len(valid_class_ids))
+    return lookup
+
+class ScannetCacheDataset:
+    """
+    Map-style dataset over a sidecar written by convert_scenes. Items are views into the memory-mapped
+    arrays, so nothing is parsed or copied per item and pages are only read when the data is touched; only
+    the labels are copied when they are mapped to class indices.
+
+    The arrays are opened lazily in every process, so the dataset can be handed to a torch DataLoader with
+    worker processes as well as to PrefetchLoader.
+
+    Args:
+        cache_dir: Output directory of convert_scenes.
+        map_labels: Map ScanNet ids to contiguous class indices through label_lookup.
+        ignore_label: Index of the ids that are not evaluated.
+        valid_class_ids: The evaluated ScanNet ids.
+    """
+
+    def __init__(self, cache_dir, map_labels=True, ignore_label=-100, valid_class_ids=VALID_CLASS_IDS):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, "scenes.json")) as f:
+            self.files = json.load(f)["scenes"]
+        self.offsets = np.load(os.path.join(cache_dir, "offsets.npy"))
+        self.lookup = label_lookup(valid_class_ids, ignore_label) if map_labels else None
+        self.ignore_label = ignore_label
+        self._arrays = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_arrays"] = None
+        return state
+
+    @property
+    def arrays(self):
+        if self._arrays is None:
+            self._arrays = {name: np.load(os.path.join(self.cache_dir, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        return self._arrays
+
+    def __len__(self):
+        return len(self.files)
+
+    def extras(self, index):
+        """
+        The arrays of the scene's trans_info.npz and init.npy stored at conversion, if there were any.
+        """
+        path = os.path.join(self.cache_dir, "extras", f"{self.files[index]}.npz")
+        if not os.path.isfile(path):
+            return {}
+        with np.load(path) as extras:
+            return dict(extras)
+
+    def __getitem__(self, index) -> dict:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        labels = self.arrays["labels"][start:end]
+        if self.lookup is not None:
+            inside = (labels >= 0) & (labels < len(self.lookup))
+            labels = np.where(inside, self.lookup[np.clip(labels, 0, len(self.lookup) - 1)], self.ignore_label)
+        return {
+            "coordinates": self.arrays["coords"][start:end],
+            "features": self.arrays["feats"][start:end],
+            "labels": labels,
+            "instances": self.arrays["instances"][start:end],
+            "metadata": {"file": self.files[index]},
+        }
+
+def collate_scenes(items):
+    """
+    Concatenates the points of several items into contiguous arrays, with the batch index of every point and
+    the start of every item in offsets. This copy is where the memory-mapped pages are actually read.
+    """
+    counts = [len(item["coordinates"]) for item in items]
+    return {
+        "coordinates": np.concatenate([item["coordinates"] for item in items]),
+        "features": np.concatenate([item["features"] for item in items]),
+        "labels": np.concatenate([item["labels"] for item in items]),
+        "instances": np.concatenate([item["instances"] for item in items]),
+        "batch": np.repeat(np.arange(len(items), dtype=np.int32), counts),
+        "offsets": np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        "metadata": [item["metadata"] for item in items],
+    }
+
+class PrefetchLoader:
+    """
+    Iterates over batches of a dataset while worker threads load and collate the next ones, so reading from
+    disk overlaps with training on the current batch. Up to workers * prefetch batches are in flight and they
+    are yielded in order.
+
+    Args:
+        dataset: Map-style dataset, e.g. ScannetCacheDataset.
+        batch_size: Items per batch.
+        shuffle: Visit the items in a new random order every epoch.
+        workers: Number of loading threads.
+        prefetch: Batches queued per worker.
+        collate: Function turning a list of items into a batch.
+        drop_last: Drop the last batch if it is smaller than batch_size.
+        seed: Seed of the shuffling.
+    """
+
+    def __init__(self, dataset, batch_size=1, shuffle=False, workers=4, prefetch=2, collate=collate_scenes,
+                 drop_last=False, seed=None):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.workers = workers
+        self.prefetch = prefetch
+        self.collate = collate
+        self.drop_last = drop_last
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.dataset) // self.batch_size
+        return -(-len(self.dataset) // self.batch_size)
+
+    def _batches(self):
+        order = self.rng.permutation(len(self.dataset)) if self.shuffle else np.arange(len(self.dataset))
+        for start in range(0, len(self) * self.batch_size, self.batch_size):
+            yield order[start:start + self.batch_size]
+
+    def _load(self, indices):
+        return self.collate([self.dataset[i] for i in indices])
+
+    def __iter__(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            for indices in self._batches():
+                pending.append(pool.submit(self._load, indices))
+                if len(pending) >= self.workers * self.prefetch:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+def main():
+    """
+    Convert the ScanNet scene PLY files of a split into a memory-mapped sidecar for ScannetCacheDataset.
+
+    Usage:
+        python -m data_loading.scannet_cache --data_root data/ --ply_dir data/scannet_3d --phase train test
+    """
+    parser = argparse.ArgumentParser(description="Convert ScanNet scene PLY files into a memory-mapped cache.")
+    parser.add_argument('--data_root', default="data/", help="Data folder with the split files in split/.")
+    parser.add_argument('--ply_dir', required=True, help="Folder with one <scene>.ply per scene.")
+    parser.add_argument('--scene_root', default=None, help="Folder of the plenoxel_scannet_<scene> directories, defaults to <data_root>/scannet.")
+    parser.add_argument('--output', default=None, help="Cache folder, defaults to <data_root>/scannet_cache.")
+    parser.add_argument('--phase', nargs='+', default=["train", "test"], choices=list(DATA_PATH_FILE), help="Splits to convert.")
+    parser.add_argument('--workers', type=int, default=8, help="Number of conversion threads.")
+    parser.add_argument('--force', action='store_true', help="Rebuild even if the cache is up to date.")
+    parser.add_argument('--benchmark', action='store_true', help="Time one epoch of PrefetchLoader over each converted split.")
+    args = parser.parse_args()
+
+    scene_root = args.scene_root or os.path.join(args.data_root, "scannet")
+    output = args.output or os.path.join(args.data_root, "scannet_cache")
+    for phase in args.phase:
+        scenes = read_split(args.data_root, phase)
+        start = time.perf_counter()
+        cache_dir = convert_scenes(scenes, args.ply_dir, os.path.join(output, phase), scene_root, args.workers, args.force)
+        print(f"{phase}: {len(scenes)} scenes in {cache_dir} ({time.perf_counter() - start:.1f}s)")
+
+        if args.benchmark:
+            loader = PrefetchLoader(ScannetCacheDataset(cache_dir), workers=args.workers)
+            start = time.perf_counter()
+            points = sum(len(batch["coordinates"]) for batch in loader)
+            elapsed = time.perf_counter() - start
+            print(f"{phase}: one epoch of {points} points in {elapsed:.2f}s ({len(loader) / elapsed:.1f} scenes/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import json
+import hashlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+HASH_CHUNK = 1 << 20
+
+def sha256_file(path, chunk_size=HASH_CHUNK):
+    """
+    Hex SHA-256 of a file's content, read in chunks. hashlib.file_digest would need Python 3.11, while the
+    benchmarks run in the older interpreters of the SAGA and Gaussian Splatting environments.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def manifest_path(folder):
+    """
+    The manifest of scene/input is stored next to the folder as scene/.input_manifest.json, so listing the
+    folder itself is not affected.
+    """
+    folder = os.path.normpath(folder)
+    return os.path.join(os.path.dirname(folder), f".{os.path.basename(folder)}_manifest.json")
+
+def _probe(folder, relpath, with_hash):
+    path = os.path.join(folder, relpath)
+    stat = os.stat(path)
+    entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "width": None, "height": None}
+    if relpath.lower().endswith(IMAGE_EXTENSIONS):
+        try:
+            with Image.open(path) as img:
+                entry["width"], entry["height"] = img.size
+        except OSError:
+            pass
+    if with_hash:
+        entry["sha256"] = sha256_file(path)
+    return relpath, entry
+
+class SceneManifest:
+    """
+    Per-file size, mtime, pixel dimensions and optional content hash of every file below a folder.
+
+    Args:
+        folder: Folder described by the manifest, usually a scene's input/ or images/ folder.
+        files: Mapping from path relative to folder to its entry.
+    """
+
+    def __init__(self, folder, files):
+        self.folder = folder
+        self.files = files
+
+    def images(self, extension=".jpg"):
+        return sorted(f for f in self.files if f.endswith(extension))
+
+    def size_gb(self):
+        return sum(entry["size"] for entry in self.files.values()) / 1024 ** 3  # Convert bytes to gigabytes
+
+    def resolutions(self, images=None):
+        images = self.images() if images is None else images
+        return Counter((self.files[f]["width"], self.files[f]["height"]) for f in images)
+
+    def dimensions(self, images=None):
+        """
+        Returns the most common (width, height) of the images and warns if the scene mixes resolutions.
+        """
+        resolutions = self.resolutions(images)
+        if not resolutions:
+            return None, None
+        if len(resolutions) > 1:
+            print(f"Warning: {self.folder} contains images of mixed resolutions: {dict(resolutions)}")
+        return resolutions.most_common(1)[0][0]
+
+def load_manifest(folder, with_hash=False, workers=8, save=True):
+    """
+    Loads the manifest of a folder and brings it up to date.
+
+    Only files that are new or whose size or mtime changed are probed again (image header and, if
+    requested, content hash), in parallel. Entries of deleted files are dropped.
+    """
+    path = manifest_path(folder)
+    cached = {}
+    if os.path.isfile(path):
+        with open(path) as f:
+            cached = json.load(f).get("files", {})
+
+    files = {}
+    stale = []
+    for dirpath, dirnames, filenames in os.walk(folder):
+        for name in filenames:
+            fp = os.path.join(dirpath, name)
+            relpath = os.path.relpath(fp, folder)
+            stat = os.stat(fp)
+            entry = cached.get(relpath)
+            if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns \
+                    and (not with_hash or "sha256" in entry):
+                files[relpath] = entry
+            else:
+                stale.append(relpath)
+
+    if stale:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for relpath, entry in pool.map(lambda f: _probe(folder, f, with_hash), stale):
+                files[relpath] = entry
+
+    if save and (stale or len(files) != len(cached)):
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"files": files}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not save manifest {path}: {e}")
+
+    return SceneManifest(folder, files)
@@ -0,0 +1,235 @@
+import os
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy.spatial import cKDTree
+from data_loading.splat_ply import map_vertices
+
+VOID_LABEL = -1
+MAX_GRID_CELLS = 1 << 26  # Voxel grids up to 256 MB are looked up directly instead of by binary search
+
+# Corners of the 2x2x2 block of voxels closest to a query, as multiples of its per-axis direction
+OCTANT = np.stack(np.meshgrid([0, 1], [0, 1], [0, 1], indexing="ij"), axis=-1).reshape(-1, 3)
+
+def _ragged_arange(starts, ends):
+    """
+    Concatenation of arange(start, end) for all pairs, vectorized.
+    """
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(lengths.sum()) + offsets
+
+class VoxelHashIndex:
+    """
+    Nearest-neighbour index over a static 3D point set, e.g. the vertices of a Replica mesh.
+
+    Points are bucketed into cubic voxels and stored sorted by voxel. Occupied voxels are found through a
+    dense grid of voxel slots when the bounding box is small enough (a room at a few centimetres), and
+    otherwise by a binary search over packed int64 voxel keys. A
+    query scans the 2x2x2 block of voxels closest to it, which finds the exact nearest neighbour whenever it
+    is at most half a voxel away. Farther queries fall back to a KD-tree, built lazily on first use.
+
+    Args:
+        points: (N, 3) point coordinates.
+        voxel_size: Edge length of the voxels. Twice the distance cutoff of the queries resolves all queries
+            without the KD-tree.
+    """
+
+    def __init__(self, points, voxel_size=0.05):
+        self.points = np.ascontiguousarray(points, dtype=np.float64)
+        self.voxel_size = voxel_size
+        self.origin = self.points.min(axis=0) - voxel_size
+        keys = self._keys(self._voxels(self.points))
+        self.order = np.argsort(keys, kind="stable")
+        self.keys, self.starts = np.unique(keys[self.order], return_index=True)
+        self.ends = np.append(self.starts[1:], len(keys))
+        self.sorted_points = self.points[self.order]
+        self._tree = None
+
+        self.shape = self._voxels(self.points.max(axis=0)[None])[0] + 2
+        self.grid = None
+        if np.prod(self.shape) <= MAX_GRID_CELLS:
+            self.grid = np.full(self.shape, -1, dtype=np.int32)
+            occupied = self._unpack(self.keys)
+            self.grid[occupied[:, 0], occupied[:, 1], occupied[:, 2]] = np.arange(len(self.keys))
+
+    def _voxels(self, points):
+        return np.floor((points - self.origin) / self.voxel_size).astype(np.int64)
+
+    @staticmethod
+    def _keys(voxels):
+        # 21 bits per axis, offset so neighbours of voxel 0 stay non-negative
+        v = voxels + 1
+        return (v[:, 0] << 42) | (v[:, 1] << 21) | v[:, 2]
+
+    @staticmethod
+    def _unpack(keys):
+        mask = (1 << 21) - 1
+        return np.stack([(keys >> 42) & mask, (keys >> 21) & mask, keys & mask], axis=1) - 1
+
+    def _slots(self, voxels):
+        """
+        Returns the slot of every voxel in keys/starts/ends and whether the voxel is occupied.
+        """
+        if self.grid is not None:
+            inside = np.all((voxels >= 0) & (voxels < self.shape), axis=1)
+            clipped = np.clip(voxels, 0, self.shape - 1)
+            slot = self.grid[clipped[:, 0], clipped[:, 1], clipped[:, 2]]
+            return slot, inside & (slot >= 0)
+        keys = self._keys(voxels)
+        slot = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return slot, self.keys[slot] == keys
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = cKDTree(self.points)
+        return self._tree
+
+    def _voxel_query(self, queries):
+        position = (queries - self.origin) / self.voxel_size
+        voxels = np.floor(position).astype(np.int64)
+        direction = np.where(position - voxels < 0.5, -1, 1)
+        distances = np.full(len(queries), np.inf)
+        indices = np.full(len(queries), -1, dtype=np.int64)
+
+        for corner in OCTANT:
+            slot, occupied = self._slots(voxels + corner * direction)
+            hit = np.nonzero(occupied)[0]
+            if len(hit) == 0:
+                continue
+            starts, ends = self.starts[slot[hit]], self.ends[slot[hit]]
+            lengths = ends - starts
+            rows = _ragged_arange(starts, ends)
+            diff = self.sorted_points[rows] - np.repeat(queries[hit], lengths, axis=0)
+            d = np.einsum("ij,ij->i", diff, diff)
+            # Every hit is one contiguous segment of candidates, take the closest of each
+            segment_starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            closest = np.minimum.reduceat(d, segment_starts)
+            first = np.flatnonzero(d == np.repeat(closest, lengths))
+            segment = np.repeat(np.arange(len(hit)), lengths)[first]
+            first = first[np.concatenate([[True], segment[1:] != segment[:-1]])]
+            closest = np.sqrt(closest)
+            better = closest < distances[hit]
+            distances[hit[better]] = closest[better]
+            indices[hit[better]] = self.order[rows[first[better]]]
+        return distances, indices
+
+    def query(self, queries, max_distance=np.inf):
+        """
+        Returns the distance to and the index of the nearest point for every query. Queries without a point
+        within max_distance get distance inf and index -1.
+        """
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        distances, indices = self._voxel_query(queries)
+
+        # Only neighbours within half a voxel are guaranteed to be found by the voxel scan
+        unresolved = np.nonzero(distances > min(self.voxel_size / 2, max_distance))[0]
+        if len(unresolved) and max_distance > self.voxel_size / 2:
+            d, i = self.tree.query(queries[unresolved], distance_upper_bound=max_distance)
+            distances[unresolved], indices[unresolved] = d, np.where(np.isfinite(d), i, -1)
+
+        far = distances > max_distance
+        distances[far], indices[far] = np.inf, -1
+        return distances, indices
+
+class KDTreeIndex:
+    """
+    Nearest-neighbour index backed by scipy's cKDTree, with the same query interface as VoxelHashIndex.
+    """
+
+    def __init__(self, points):
+        self.tree = cKDTree(np.asarray(points, dtype=np.float64))
+
+    def query(self, queries, max_distance=np.inf):
+        distances, indices = self.tree.query(np.asarray(queries, dtype=np.float64).reshape(-1, 3), distance_upper_bound=max_distance)
+        return distances, np.where(np.isfinite(distances), indices, -1)
+
+INDEX_METHODS = ["kdtree", "voxel"]
+
+def choose_voxel_size(points, max_distance, points_per_voxel=4.0):
+    """
+    Largest voxel size up to twice max_distance whose occupied voxels hold about points_per_voxel points.
+    Mesh vertices lie on surfaces, so the occupancy is assumed to grow with the square of the voxel size.
+    """
+    voxel_size = 2 * max_distance if np.isfinite(max_distance) else 0.05
+    keys = VoxelHashIndex._keys(np.floor((points - points.min(axis=0)) / voxel_size).astype(np.int64))
+    occupancy = len(points) / len(np.unique(keys))
+    if occupancy > points_per_voxel:
+        voxel_size *= np.sqrt(points_per_voxel / occupancy)
+    return voxel_size
+
+def build_index(points, method="kdtree", voxel_size=None, max_distance=0.1):
+    if method == "voxel":
+        return VoxelHashIndex(points, voxel_size or choose_voxel_size(points, max_distance))
+    return KDTreeIndex(points)
+
+def transfer_labels(source_points, source_labels, query_points, max_distance=0.1, void_label=VOID_LABEL, method="kdtree",
+                    voxel_size=None, chunk_size=200_000, workers=None, index=None):
+    """
+    Gives every query point the label of its nearest source point, e.g. Gaussian centres the labels of the
+    nearest vertex of the ground-truth mesh. Queries farther than max_distance from every source point are
+    marked void. Queries are processed in chunks on a thread pool.
+
+    method selects the index: kdtree (scipy's cKDTree) or voxel (VoxelHashIndex, whose voxel_size is chosen
+    from the density of the source points by default). Both return exact nearest neighbours.
+
+    Returns:
+        The labels and the distances to the nearest source point (inf for void points).
+    """
+    index = index if index is not None else build_index(source_points, method, voxel_size, max_distance)
+    source_labels = np.asarray(source_labels)
+    labels = np.full(len(query_points), void_label, dtype=source_labels.dtype)
+    distances = np.empty(len(query_points))
+
+    def run(start):
+        d, i = index.query(query_points[start:start + chunk_size], max_distance)
+        found = i >= 0
+        labels[start:start + chunk_size][found] = source_labels[i[found]]
+        distances[start:start + chunk_size] = d
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        list(pool.map(run, range(0, len(query_points), chunk_size)))
+    return labels, distances
+
+def load_labelled_points(path, label_property="label"):
+    """
+    Memory-maps the vertex positions and per-vertex labels of a binary PLY mesh or point cloud.
+    """
+    vertices = map_vertices(path)
+    if label_property not in vertices.dtype.names:
+        raise ValueError(f"{path} has no vertex property {label_property}, found {vertices.dtype.names}")
+    points = np.stack([vertices["x"], vertices["y"], vertices["z"]], axis=1)
+    return points, np.asarray(vertices[label_property])
+
+def main():
+    """
+    Transfer ground-truth labels from a Replica mesh to the points of a point cloud or Gaussian model.
+
+    Usage:
+        python -m data_loading.spatial_index <office0_mesh.ply> <point_cloud.ply> <labels.npy> [--max_distance 0.1]
+    """
+    parser = argparse.ArgumentParser(description="Transfer mesh labels to the nearest points of a point cloud.")
+    parser.add_argument('mesh', help="Binary PLY mesh with per-vertex labels.")
+    parser.add_argument('points', help="Binary PLY point cloud or Gaussian model.")
+    parser.add_argument('output', help="Output .npy file with one label per point.")
+    parser.add_argument('--label_property', default="label", help="Vertex property holding the labels.")
+    parser.add_argument('--method', choices=INDEX_METHODS, default="kdtree", help="Nearest-neighbour index.")
+    parser.add_argument('--voxel_size', type=float, default=None, help="Voxel edge length of the hash, chosen from the mesh density by default.")
+    parser.add_argument('--max_distance', type=float, default=0.1, help="Points farther from the mesh are marked void.")
+    parser.add_argument('--void_label', type=int, default=VOID_LABEL, help="Label of points without a mesh vertex in reach.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of query threads.")
+    args = parser.parse_args()
+
+    source_points, source_labels = load_labelled_points(args.mesh, args.label_property)
+    vertices = map_vertices(args.points)
+    query_points = np.stack([vertices["x"], vertices["y"], vertices["z"]], axis=1)
+
+    labels, distances = transfer_labels(source_points, source_labels, query_points, args.max_distance, args.void_label,
+                                        args.method, args.voxel_size, workers=args.workers)
+    np.save(args.output, labels)
+    void = np.isinf(distances).sum()
+    print(f"Labelled {len(labels) - void} of {len(labels)} points, {void} farther than {args.max_distance} are void.")
+
+if __name__ == "__main__":
+    main()
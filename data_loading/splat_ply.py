@@ -0,0 +1,158 @@
+import numpy as np
+from numpy.lib import recfunctions
+
+PLY_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+
+FORMATS = {"binary_little_endian": "<", "binary_big_endian": ">"}
+
+def read_ply_header(path):
+    """
+    Parses the header of a binary PLY file.
+
+    Returns:
+        A dict with the byte order, the header size in bytes and the elements as a list of
+        (name, count, dtype) tuples. dtype is None for elements with list properties.
+    """
+    elements = []
+    with open(path, "rb") as f:
+        if f.readline().strip() != b"ply":
+            raise ValueError(f"{path} is not a PLY file")
+        byte_order = None
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError(f"{path} has no end_header")
+            words = line.decode("ascii").split()
+            if not words or words[0] in ("comment", "obj_info"):
+                continue
+            if words[0] == "format":
+                if words[1] not in FORMATS:
+                    raise ValueError(f"{path} is {words[1]}, only binary PLY files can be memory-mapped")
+                byte_order = FORMATS[words[1]]
+            elif words[0] == "element":
+                elements.append([words[1], int(words[2]), []])
+            elif words[0] == "property":
+                fields = elements[-1][2]
+                if fields is not None and words[1] == "list":
+                    elements[-1][2] = None
+                elif fields is not None:
+                    fields.append((words[2], byte_order + PLY_TYPES[words[1]]))
+            elif words[0] == "end_header":
+                header_size = f.tell()
+                break
+
+    return {
+        "byte_order": byte_order,
+        "header_size": header_size,
+        "elements": [(name, count, None if fields is None else np.dtype(fields)) for name, count, fields in elements],
+    }
+
+def map_vertices(path, element="vertex"):
+    """
+    Memory-maps the vertex block of a binary PLY file (e.g. an exported splat.ply or a SAGA feature point
+    cloud) as a read-only structured array. Nothing is read until fields or rows are accessed.
+    """
+    header = read_ply_header(path)
+    offset = header["header_size"]
+    for name, count, dtype in header["elements"]:
+        if name == element:
+            return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+        if dtype is None:
+            raise ValueError(f"Element {name} of {path} has list properties, so {element} cannot be located")
+        offset += count * dtype.itemsize
+    raise ValueError(f"{path} has no element {element}")
+
+def iter_chunks(vertices, columns=None, chunk_size=1 << 20, dtype=np.float64):
+    """
+    Yields (start, array) for consecutive rows of a structured array, each array of shape
+    (rows, len(columns)). Only one chunk is copied at a time.
+    """
+    columns = list(vertices.dtype.names) if columns is None else list(columns)
+    for start in range(0, len(vertices), chunk_size):
+        chunk = vertices[start:start + chunk_size][columns]
+        yield start, recfunctions.structured_to_unstructured(chunk, dtype=dtype)
+
+class RunningStats:
+    """
+    Streaming per-column mean and variance (Welford), merged chunk by chunk with Chan's parallel update so
+    the result matches the statistics over the whole array.
+    """
+
+    def __init__(self, num_columns):
+        self.count = 0
+        self.mean = np.zeros(num_columns)
+        self.m2 = np.zeros(num_columns)
+
+    def update(self, chunk):
+        n = len(chunk)
+        if n == 0:
+            return self
+        chunk_mean = chunk.mean(axis=0)
+        chunk_m2 = ((chunk - chunk_mean) ** 2).sum(axis=0)
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + chunk_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / max(self.count, 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+def vertex_statistics(path, columns=None, chunk_size=1 << 20):
+    """
+    Computes mean and standard deviation of every vertex property in a single pass over the file.
+
+    Returns:
+        The column names and their RunningStats.
+    """
+    vertices = map_vertices(path)
+    columns = list(vertices.dtype.names) if columns is None else list(columns)
+    stats = RunningStats(len(columns))
+    for _, chunk in iter_chunks(vertices, columns, chunk_size):
+        stats.update(chunk)
+    return columns, stats
+
+def standardization(path, chunk_size=1 << 20, min_variance=0.0):
+    """
+    Returns the vertex properties whose variance exceeds min_variance, with their mean and standard
+    deviation, from one streaming pass over the file.
+    """
+    columns, stats = vertex_statistics(path, chunk_size=chunk_size)
+    keep = stats.var > min_variance
+    return [c for c, k in zip(columns, keep) if k], stats.mean[keep], stats.std[keep]
+
+def iter_normalized(path, chunk_size=1 << 20, min_variance=0.0, eps=1e-8, dtype=np.float32):
+    """
+    Yields (start, array) chunks of the standardized vertex properties with a variance above min_variance,
+    using the statistics of the whole file. Only one chunk is held in memory.
+    """
+    columns, mean, std = standardization(path, chunk_size, min_variance)
+    for start, chunk in iter_chunks(map_vertices(path), columns, chunk_size):
+        yield start, ((chunk - mean) / (std + eps)).astype(dtype)
+
+def normalize_to_npy(path, output_path, chunk_size=1 << 20, min_variance=0.0, eps=1e-8):
+    """
+    Writes the standardized vertex properties with a variance above min_variance into an (N, D) float32
+    .npy file, chunk by chunk, so splat files larger than memory can be normalized.
+
+    Returns:
+        The names of the kept columns.
+    """
+    columns, mean, std = standardization(path, chunk_size, min_variance)
+    vertices = map_vertices(path)
+    output = np.lib.format.open_memmap(output_path, mode="w+", dtype=np.float32, shape=(len(vertices), len(columns)))
+    for start, chunk in iter_chunks(vertices, columns, chunk_size):
+        output[start:start + len(chunk)] = (chunk - mean) / (std + eps)
+    output.flush()
+    return columns
@@ -0,0 +1,25 @@
+import os
+import numpy as np
+from pathlib import Path
+
+def load_trajectory(trajectory_txt: Path) -> np.ndarray:
+    """Loads a Replica traj.txt (one flattened 4x4 camera-to-world matrix per line) as an (N, 4, 4) array.
+
+    The parsed poses are cached in a traj.npy sidecar next to the text file. The sidecar is memory-mapped
+    on later calls and rebuilt whenever traj.txt is newer than it.
+    """
+    trajectory_txt = Path(trajectory_txt)
+    sidecar = trajectory_txt.with_suffix(".npy")
+
+    if sidecar.exists() and sidecar.stat().st_mtime_ns >= trajectory_txt.stat().st_mtime_ns:
+        return np.load(sidecar, mmap_mode="r")
+
+    poses = np.loadtxt(trajectory_txt, dtype=np.float64, ndmin=2).reshape((-1, 4, 4))
+    try:
+        tmp_path = sidecar.with_suffix(".npy.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, poses)
+        os.replace(tmp_path, sidecar)
+    except OSError:
+        pass  # read-only dataset, parse again next time
+    return poses
@@ -0,0 +1,113 @@
+import os
+import errno
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+
+TRANSFER_MODES = ["copy", "link", "hardlink", "reflink"]
+
+def is_up_to_date(src, dst):
+    """
+    A destination is up to date if it is the same file (hardlink) or a copy with the same size and mtime.
+    """
+    try:
+        dst_stat = os.stat(dst)
+    except FileNotFoundError:
+        return False
+    src_stat = os.stat(src)
+    if (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino):
+        return True
+    return src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+
+def _replace(dst, write):
+    """
+    Writes to a temporary file next to dst and renames it, so an interrupted run never leaves a partial file
+    behind that a resumed run would take for complete.
+    """
+    tmp = f"{dst}.part"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    write(tmp)
+    os.replace(tmp, dst)
+
+def _reflink(src, tmp):
+    # copy_file_range shares extents on filesystems with reflink support (btrfs, XFS) and copies inside
+    # the kernel otherwise
+    with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+    shutil.copystat(src, tmp)
+
+def transfer_file(src, dst, mode="copy"):
+    """
+    Puts src at dst using the given mode and returns the mode that was actually used.
+
+    Modes:
+        copy: plain copy preserving metadata.
+        hardlink: hardlink, falls back to copy.
+        reflink: copy_file_range, falls back to copy.
+        link: hardlink, then reflink, then copy.
+    """
+    if mode in ("link", "hardlink"):
+        try:
+            _replace(dst, lambda tmp: os.link(src, tmp))
+            return "hardlink"
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP):
+                raise
+    if mode in ("link", "reflink") and hasattr(os, "copy_file_range"):
+        try:
+            _replace(dst, lambda tmp: _reflink(src, tmp))
+            return "reflink"
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.ENOTSUP, errno.EOPNOTSUPP):
+                raise
+    _replace(dst, lambda tmp: shutil.copy2(src, tmp))
+    return "copy"
+
+def prune_files(folder, keep, select):
+    """
+    Removes the files directly in folder that are not in keep (names), e.g. frames of an earlier subset
+    that is no longer selected. Only files for which select(name) is true are considered, so select has to
+    match just the names the transfer writes and leave any other file in the folder alone.
+
+    Returns:
+        The number of removed files.
+    """
+    keep = set(keep)
+    removed = 0
+    for entry in os.scandir(folder):
+        if entry.is_file(follow_symlinks=False) and entry.name not in keep and select(entry.name):
+            os.remove(entry.path)
+            removed += 1
+    return removed
+
+def transfer_files(pairs, mode="copy", workers=8, desc="Copying files"):
+    """
+    Transfers (src, dst) pairs on a thread pool, skipping destinations that are already up to date.
+
+    Returns:
+        A dict with the number of transferred and skipped files, the transferred bytes and the count per
+        transfer mode that was used.
+    """
+    stats = {"transferred": 0, "skipped": 0, "bytes": 0, "modes": {}}
+
+    def work(pair):
+        src, dst = pair
+        if is_up_to_date(src, dst):
+            return None, 0
+        return transfer_file(src, dst, mode), os.path.getsize(src)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for used_mode, size in tqdm(pool.map(work, pairs), total=len(pairs), desc=desc, unit="file"):
+            if used_mode is None:
+                stats["skipped"] += 1
+                continue
+            stats["transferred"] += 1
+            stats["bytes"] += size
+            stats["modes"][used_mode] = stats["modes"].get(used_mode, 0) + 1
+    return stats
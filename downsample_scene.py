@@ -1,12 +1,20 @@
 import os
 import argparse
-import shutil
-from tqdm import tqdm
+from data_loading.transfer import TRANSFER_MODES, prune_files, transfer_files
+from data_loading.scene_manifest import load_manifest
+from data_loading.trajectory import load_trajectory
+from data_loading.keyframes import add_keyframe_arguments, keyframe_options, select_keyframes
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Downsample a dataset by copying every nth file.')
     parser.add_argument('scene_root', type=str, help='Path to the scene root directory')
-    parser.add_argument('--downsample', type=int, required=True, help='Downsample factor')
+    parser.add_argument('--downsample', type=int, nargs='+', required=True, help='Downsample factors, e.g. 2 4 8')
+    parser.add_argument('--mode', choices=TRANSFER_MODES, default='copy',
+                        help='How files are placed: copy, hardlink, reflink (copy_file_range) or link (hardlink, then reflink, then copy)')
+    parser.add_argument('--workers', type=int, default=8, help='Number of copy threads')
+    parser.add_argument('--trajectory', type=str, default=None,
+                        help='traj.txt with one camera-to-world matrix per input file (in sorted order), needed by the pose-based selections')
+    add_keyframe_arguments(parser)
     return parser.parse_args()
 
 def check_directories(scene_root):
@@ -22,25 +30,53 @@ def create_downsampled_directory(scene_root, downsample_factor):
     os.makedirs(os.path.join(new_scene_root, 'input'), exist_ok=True)
     return new_scene_root
 
-def downsample_directory(input_dir, new_input_dir, downsample_factor):
-    files = sorted(os.listdir(input_dir))
-    downsampled_files = files[::downsample_factor]
+def downsample_directory(input_dir, new_input_dirs, downsample_factors, mode='copy', workers=8, camera_to_worlds=None,
+                         keyframes=None):
+    """
+    Places every nth file of input_dir into the matching output directory for all factors at once,
+    listing input_dir a single time. Files that are already up to date in the output are skipped, files
+    of input_dir that an earlier run placed in the output but are no longer selected are removed.
+
+    With keyframes (options of data_loading.keyframes.select_keyframes), a factor n instead keeps at most
+    1/n of the files, chosen by the keyframe selection from camera_to_worlds (one pose per file).
+    """
+    files = [f for f in sorted(load_manifest(input_dir).files) if os.sep not in f and not f.endswith('.part')]
+    if camera_to_worlds is not None and len(camera_to_worlds) != len(files):
+        raise ValueError(f"{len(camera_to_worlds)} poses for {len(files)} files in {input_dir}")
 
-    for file in tqdm(downsampled_files, desc='Copying files'):
-        src_file = os.path.join(input_dir, file)
-        dst_file = os.path.join(new_input_dir, file)
-        shutil.copy2(src_file, dst_file)
+    file_set = set(files)
+    pairs, removed = [], 0
+    for new_input_dir, downsample_factor in zip(new_input_dirs, downsample_factors):
+        if keyframes is None:
+            subset = files[::downsample_factor]
+        else:
+            indices = select_keyframes(len(files), -(-len(files) // downsample_factor), camera_to_worlds=camera_to_worlds,
+                                       image_paths=[os.path.join(input_dir, f) for f in files], workers=workers, **keyframes)
+            subset = [files[i] for i in indices]
+        # Files of an earlier run with another selection would otherwise remain part of the subset. Only names of
+        # input files are candidates, anything else in the output was not written by this transfer
+        removed += prune_files(new_input_dir, subset, file_set.__contains__)
+        for file in subset:
+            pairs.append((os.path.join(input_dir, file), os.path.join(new_input_dir, file)))
+
+    stats = transfer_files(pairs, mode=mode, workers=workers)
+    stats['removed'] = removed
+    return stats
 
 def main():
     """
     Downsample a dataset by copying every nth file from the original directory to a new directory.
     
     Usage:
-        python downsample_scene.py <scene_root> --downsample <downsample_factor>
+        python downsample_scene.py <scene_root> --downsample <downsample_factor> [<downsample_factor> ...] [--mode link]
     
     Arguments:
         scene_root: Path to the scene root directory which contains the 'input' subdirectory.
-        --downsample: Integer value indicating the downsampling factor (every nth file will be copied).
+        --downsample: Integer values indicating the downsampling factors (every nth file will be copied).
+        --mode: copy, hardlink, reflink or link. Linked variants take almost no time and disk space.
+        --workers: Number of threads used to copy files.
+        --selection: uniform (every nth file), motion or fps keyframes from the poses in --trajectory.
+        --similarity: Also drop near-duplicate frames by thumbnail correlation.
     """
     args = parse_arguments()
 
@@ -50,11 +86,19 @@ def main():
         print(e)
         return
 
-    new_scene_root = create_downsampled_directory(args.scene_root, args.downsample)
-    new_input_dir = os.path.join(new_scene_root, 'input')
+    new_scene_roots = [create_downsampled_directory(args.scene_root, factor) for factor in args.downsample]
+    new_input_dirs = [os.path.join(root, 'input') for root in new_scene_roots]
+
+    keyframes = keyframe_options(args)
+    camera_to_worlds = None
+    if args.trajectory is not None:
+        camera_to_worlds = load_trajectory(args.trajectory)
 
-    downsample_directory(input_dir, new_input_dir, args.downsample)
-    print(f"Downsampling complete. New directory created at: {new_scene_root}")
+    stats = downsample_directory(input_dir, new_input_dirs, args.downsample, args.mode, args.workers, camera_to_worlds, keyframes)
+    print(f"Transferred {stats['transferred']} files ({stats['bytes'] / 1024 ** 3:.2f} GB, {stats['modes']}), "
+          f"skipped {stats['skipped']} up-to-date files, removed {stats['removed']} files no longer selected.")
+    for new_scene_root in new_scene_roots:
+        print(f"Downsampling complete. New directory created at: {new_scene_root}")
 
 if __name__ == "__main__":
     main()
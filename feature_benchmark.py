@@ -1,71 +1,49 @@
 import os
-import csv
-import time
-import subprocess
-from PIL import Image
 import argparse
-import psutil
-from pynvml import nvmlInit, nvmlDeviceGetHandleByIndex, nvmlDeviceGetMemoryInfo, nvmlShutdown
+from benchmarking.harness import add_benchmark_arguments, is_repeated, run_benchmark
+from benchmarking.scheduler import Job
+from benchmarking.stage_cache import Stage, StageCache, plan_stages
+from benchmarking.warm_worker import WorkerPool
+from data_loading.scene_manifest import load_manifest
 
-def get_image_dimensions(image_path):
-    with Image.open(image_path) as img:
-        return img.size
+STAGE_NAMES = ["masks", "scale", "clip", "contrastive"]
+WARM_STAGES = ["masks", "clip"]  # The stages loading SAM and CLIP, dispatched to --warm_workers
 
-def get_gpu_usage():
-    handle = nvmlDeviceGetHandleByIndex(0)
-    info = nvmlDeviceGetMemoryInfo(handle)
-    return info.used / 1024 ** 3  # Convert bytes to gigabytes
-
-def get_cpu_memory_usage():
-    return psutil.virtual_memory().used / 1024 ** 3  # Convert bytes to gigabytes
-
-def get_folder_size_in_gb(folder_path):
-    total_size = 0
-    for dirpath, dirnames, filenames in os.walk(folder_path):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            total_size += os.path.getsize(fp)
-    return total_size / 1024 ** 3  # Convert bytes to gigabytes
-
-def run_script(command):
-    start_time = time.time()
-    gpu_usages = []
-    cpu_memory_usages = []
-    combined_usages = []
-
-    process = subprocess.Popen(command, shell=True)
-
-    while process.poll() is None:
-        gpu_usage = get_gpu_usage()
-        cpu_memory_usage = get_cpu_memory_usage()
-        combined_usage = gpu_usage + cpu_memory_usage
-
-        gpu_usages.append(gpu_usage)
-        cpu_memory_usages.append(cpu_memory_usage)
-        combined_usages.append(combined_usage)
-
-        time.sleep(1)
-
-    process.wait()  # Wait for the process to complete
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-
-    avg_gpu_usage = sum(gpu_usages) / len(gpu_usages)
-    max_gpu_usage = max(gpu_usages)
-    avg_cpu_memory_usage = sum(cpu_memory_usages) / len(cpu_memory_usages)
-    max_cpu_memory_usage = max(cpu_memory_usages)
-    avg_combined_usage = sum(combined_usages) / len(combined_usages)
-    max_combined_usage = max(combined_usages)
-
-    return elapsed_time, avg_gpu_usage, max_gpu_usage, avg_cpu_memory_usage, max_cpu_memory_usage, avg_combined_usage, max_combined_usage
+def feature_stages(args, scene_path, model_path):
+    """
+    The four SAGA feature stages of a scene as a dependency graph, in execution order.
+    """
+    images = [os.path.join(scene_path, "input"), os.path.join(scene_path, "images")]
+    trained_model = [os.path.join(model_path, "point_cloud", "iteration_30000", "point_cloud.ply"), os.path.join(model_path, "cameras.json")]
+    contrastive_dir = os.path.join(model_path, "point_cloud", "iteration_10000")
+
+    return [
+        Stage("masks",
+              f"python segment_3d_gaussians/extract_segment_everything_masks.py --image_root {scene_path} --sam_checkpoint_path {args.sam_path}",
+              inputs=images + [args.sam_path],
+              outputs=[os.path.join(scene_path, "sam_masks")]),
+        Stage("scale",
+              f"python segment_3d_gaussians/get_scale.py --image_root {scene_path} --model_path {model_path}",
+              inputs=images + trained_model,
+              outputs=[os.path.join(scene_path, "mask_scales")],
+              deps=["masks"]),
+        Stage("clip",
+              f"python segment_3d_gaussians/get_clip_features.py --image_root {scene_path} --clip_path {args.clip_path}",
+              inputs=images + [args.clip_path],
+              outputs=[os.path.join(scene_path, "clip_features")],
+              deps=["masks"]),
+        Stage("contrastive",
+              f"python segment_3d_gaussians/train_contrastive_feature.py -m {model_path} --iterations 10000 --num_sampled_rays 1000",
+              inputs=trained_model,
+              outputs=[os.path.join(contrastive_dir, "contrastive_feature_point_cloud.ply"), os.path.join(contrastive_dir, "scale_gate.pt")],
+              deps=["scale", "clip"]),
+    ]
 
 def benchmark_features(args):
     scenes_dir = args.scenes_root
     downsample_suffix = f"downsample{args.downsample}"
     output_file = os.path.join("results", "benchmarks", "train_benchmarks.csv")
 
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-
     if not os.path.exists(scenes_dir):
         print(f"Directory {scenes_dir} does not exist.")
         return
@@ -76,67 +54,51 @@ def benchmark_features(args):
         print(f"No scenes found ending with '{downsample_suffix}'.")
         return
 
-    file_exists = os.path.isfile(output_file)
-
-    with open(output_file, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        if not file_exists:
-            writer.writerow([
-                'approach', 'script', 'scene', 'time', 'image_count', 'image_width', 'image_height', 'scene_size',
-                'avg_gpu_usage', 'max_gpu_usage', 'avg_cpu_memory_usage', 'max_cpu_memory_usage', 
-                'avg_combined_usage', 'max_combined_usage'
-            ])
-
-        nvmlInit()  # Initialize NVML
-
-        for scene in scenes:
-            scene_path = os.path.join(scenes_dir, scene)
-            input_path = os.path.join(scene_path, "input")
-            model_path = os.path.join(args.model_root, scene)
-
-            if not os.path.exists(input_path):
-                print(f"Input directory {input_path} does not exist for scene {scene}.")
-                continue
-
-            images = [img for img in os.listdir(input_path) if img.endswith(".jpg")]
-
-            if not images:
-                print(f"No images found in {input_path} for scene {scene}.")
-                continue
-
-            image_path = os.path.join(input_path, images[0])
-            image_width, image_height = get_image_dimensions(image_path)
-            image_count = len(images)
-            scene_size = get_folder_size_in_gb(input_path)
-
-            scripts = [
-                f"python segment_3d_gaussians/extract_segment_everything_masks.py --image_root {scene_path} --sam_checkpoint_path {args.sam_path}",
-                f"python segment_3d_gaussians/get_scale.py --image_root {scene_path} --model_path {model_path}",
-                f"python segment_3d_gaussians/get_clip_features.py --image_root {scene_path} --clip_path {args.clip_path}",
-                f"python segment_3d_gaussians/train_contrastive_feature.py -m {model_path} --iterations 10000 --num_sampled_rays 1000"
-            ]
-
-            for script in scripts:
-                elapsed_time, avg_gpu_usage, max_gpu_usage, avg_cpu_memory_usage, max_cpu_memory_usage, avg_combined_usage, max_combined_usage = run_script(script)
-
-                writer.writerow([
-                    'saga', script.split()[1], scene, elapsed_time, image_count, image_width, image_height, scene_size,
-                    avg_gpu_usage, max_gpu_usage, avg_cpu_memory_usage, max_cpu_memory_usage, avg_combined_usage, max_combined_usage
-                ])
-                print(f"Processed scene {scene}: {elapsed_time:.2f} seconds, "
-                      f"Avg GPU: {avg_gpu_usage:.2f} GB, Max GPU: {max_gpu_usage:.2f} GB, "
-                      f"Avg CPU Memory: {avg_cpu_memory_usage:.2f} GB, Max CPU Memory: {max_cpu_memory_usage:.2f} GB, "
-                      f"Avg Combined: {avg_combined_usage:.2f} GB, Max Combined: {max_combined_usage:.2f} GB, "
-                      f"Scene Size: {scene_size:.2f} GB")
-
-        nvmlShutdown()  # Shutdown NVML
+    cache = None if args.no_cache else StageCache(args.cache_dir)
+    # Repeated trials measure every stage, the cache only receives their outputs
+    force = ["all"] if is_repeated(args) else args.force
+    chains = []
+
+    for scene in scenes:
+        scene_path = os.path.join(scenes_dir, scene)
+        input_path = os.path.join(scene_path, "input")
+        model_path = os.path.join(args.model_root, scene)
+
+        if not os.path.exists(input_path):
+            print(f"Input directory {input_path} does not exist for scene {scene}.")
+            continue
+
+        manifest = load_manifest(input_path)
+        images = manifest.images(".jpg")
+
+        if not images:
+            print(f"No images found in {input_path} for scene {scene}.")
+            continue
+
+        image_width, image_height = manifest.dimensions(images)
+        image_count = len(images)
+        scene_size = manifest.size_gb()
+        metadata = {'image_count': image_count, 'image_width': image_width, 'image_height': image_height, 'scene_size': scene_size}
+
+        stages = feature_stages(args, scene_path, model_path)
+        if cache is not None:
+            stages = plan_stages(stages, cache, force)
+
+        # Stages of a scene run one after another in dependency order
+        chains.append([Job(scene, stage.command.split()[1], stage.command, shell=True,
+                           metadata=dict(metadata, stage=stage, cache_paths=stage.inputs), warm=stage.name in WARM_STAGES)
+                       for stage in stages])
+
+    on_success = None if cache is None else lambda job: cache.store(job.metadata['stage'])
+    workers = WorkerPool(args.warm_workers, args.sam_path, clip_path=args.clip_path) if args.warm_workers > 0 else None
+    run_benchmark(args, output_file, 'saga', chains, on_success, workers)
 
 if __name__ == "__main__":
     """
     Benchmark script for feature extraction and processing scenes.
     
     Usage:
-    python feature_benchmark.py --scenes_root <path_to_scenes> --downsample <downsample_factor> --sam_path <path_to_sam> --model_root <path_to_models> --clip_path <path_to_clip>
+    python feature_benchmark.py --scenes_root <path_to_scenes> --downsample <downsample_factor> --sam_path <path_to_sam> --model_root <path_to_models> --clip_path <path_to_clip> [--warm_workers 1]
     """
     parser = argparse.ArgumentParser(description="Benchmark script for feature extraction and processing scenes.")
     parser.add_argument('--scenes_root', required=True, help="The path to the folder containing the scenes directory.")
@@ -144,6 +106,12 @@ if __name__ == "__main__":
     parser.add_argument('--sam_path', required=True, help="Path to the SAM checkpoint.")
     parser.add_argument('--model_root', required=True, help="Root directory where models are stored.")
     parser.add_argument('--clip_path', required=True, help="Path to the CLIP checkpoint.")
+    parser.add_argument('--cache_dir', default=os.path.join("results", "stage_cache"), help="Directory of the stage cache.")
+    parser.add_argument('--no_cache', action='store_true', help="Always run every stage and don't cache outputs.")
+    parser.add_argument('--force', nargs='*', default=[], choices=STAGE_NAMES + ["all"], help="Rerun these stages and every stage depending on them.")
+    parser.add_argument('--warm_workers', type=int, default=0,
+                        help="Run the SAM and CLIP stages in this many long-lived workers that load the models once, instead of a new process per stage and scene.")
+    add_benchmark_arguments(parser)
     args = parser.parse_args()
 
     benchmark_features(args)
@@ -0,0 +1,187 @@
+import os
+import csv
+import time
+import argparse
+import numpy as np
+from benchmarking.common import rotate_legacy_results
+from benchmarking.feature_index import IVFIndex, file_fingerprint, index_dir, load_or_build
+from benchmarking.query_backends import FeatureBackend, SyntheticBackend
+from benchmarking.sampler import DEFAULT_INTERVAL, ResourceSampler, get_gpu_backend
+from benchmarking.text_embeddings import DEFAULT_CACHE
+from data_loading.labels import LABEL_SETS
+
+RESULTS_HEADER = [
+    'scene', 'backend', 'prompt_type', 'num_points', 'feature_dim', 'num_queries', 'batch_size', 'load_time', 'query_time',
+    'p50_latency', 'p95_latency', 'p99_latency', 'mean_latency', 'queries_per_second', 'max_cpu_memory_usage', 'max_gpu_usage',
+    'index_time', 'nprobe', 'recall'
+]
+
+DEFAULT_PROMPTS = [
+    "chair", "table", "sofa", "cushion", "lamp", "plant", "book", "blinds", "door", "window",
+    "rug", "shelf", "monitor", "picture", "pillow", "bottle", "vase", "bench", "cabinet", "ceiling"
+]
+
+def prompt_batches(args, num_points, count, rng):
+    """
+    Returns count prompts in batches: lists of strings for text prompts, lists of point index tuples for clicks.
+    """
+    if args.prompt_type == "text":
+        prompts = DEFAULT_PROMPTS
+        if args.prompts is not None:
+            with open(args.prompts) as f:
+                prompts = [line.strip() for line in f if line.strip()]
+        stream = [prompts[i] for i in rng.integers(0, len(prompts), count)]
+    else:
+        stream = [tuple(rng.integers(0, num_points, args.clicks)) for _ in range(count)]
+    return [stream[start:start + args.batch_size] for start in range(0, count, args.batch_size)]
+
+def run_queries(backend, args):
+    """
+    Fires the prompt stream at a loaded backend, after unmeasured warmup queries.
+
+    Returns:
+        The latency of every measured batch in seconds and the number of measured queries.
+    """
+    embed = backend.encode_text if args.prompt_type == "text" else backend.click_embedding
+    rng = np.random.default_rng(args.seed)
+
+    for batch in prompt_batches(args, backend.num_points, args.warmup, rng):
+        backend.segment(embed(batch), args.threshold)
+    backend.synchronize()
+
+    latencies = []
+    batches = prompt_batches(args, backend.num_points, args.num_queries, rng)
+    for batch in batches:
+        start = time.perf_counter()
+        backend.segment(embed(batch), args.threshold)
+        backend.synchronize()
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies), sum(len(batch) for batch in batches)
+
+def attach_index(backend, args):
+    """
+    Loads, updates or builds the feature index of the backend. Indices of trained scenes are saved next to
+    their features; the synthetic index only lives in memory.
+    """
+    features = backend.feature_array()
+    if args.backend == "synthetic":
+        backend.index = IVFIndex.build(features, args.nlist, seed=args.seed)
+    else:
+        fingerprint = file_fingerprint(args.features, scale_gate=args.scale_gate, scale=args.scale)
+        backend.index = load_or_build(features, index_dir(args.features), fingerprint, args.nlist)
+    backend.nprobe = args.nprobe
+
+def measure_recall(backend, args, num_queries=20):
+    """
+    Fraction of the points found by a brute-force scan that the index also finds, over a few prompts.
+    """
+    embed = backend.encode_text if args.prompt_type == "text" else backend.click_embedding
+    batches = prompt_batches(args, backend.num_points, num_queries, np.random.default_rng(args.seed + 1))
+    found = exact = 0
+    for batch in batches:
+        queries = embed(batch)
+        found += backend.segment(queries, args.threshold).sum()
+        index, backend.index = backend.index, None
+        exact += backend.segment(queries, args.threshold).sum()
+        backend.index = index
+    return found / exact if exact else 1.0
+
+def benchmark_queries(args):
+    if args.backend == "synthetic":
+        backend = SyntheticBackend(args.num_points, args.feature_dim, args.seed)
+    else:
+        backend = FeatureBackend(args.features, args.scale_gate, args.scale, args.clip_path, args.clip_model, args.device,
+                                 args.prompt_template, args.text_cache, args.preload_labels)
+
+    gpu_backend = get_gpu_backend(args.device != "cpu")
+    sampler = ResourceSampler(os.getpid(), args.sample_interval, gpu_backend).start()
+
+    start = time.perf_counter()
+    backend.load()
+    load_time = time.perf_counter() - start
+
+    index_time = nprobe = recall = None
+    if args.index:
+        start = time.perf_counter()
+        attach_index(backend, args)
+        index_time, nprobe = time.perf_counter() - start, args.nprobe
+
+    latencies, num_queries = run_queries(backend, args)
+    if args.index:
+        recall = measure_recall(backend, args)
+    sampler.stop()
+    gpu_backend.close()
+    summary = sampler.summary()
+
+    query_time = latencies.sum()
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    row = [
+        args.scene, backend.name, args.prompt_type, backend.num_points, backend.feature_dim, num_queries, args.batch_size,
+        load_time, query_time, p50, p95, p99, latencies.mean(), num_queries / query_time,
+        summary['max_cpu_memory_usage'], summary['max_gpu_usage'], index_time, nprobe, recall
+    ]
+
+    os.makedirs(os.path.dirname(args.output_file), exist_ok=True)
+    rotate_legacy_results(args.output_file, RESULTS_HEADER)
+    with open(args.output_file, mode='a', newline='') as file:
+        writer = csv.writer(file)
+        if file.tell() == 0:
+            writer.writerow(RESULTS_HEADER)
+        writer.writerow(row)
+
+    print(f"Scene {args.scene} ({backend.name}, {backend.num_points} points x {backend.feature_dim}): "
+          f"load {load_time:.2f} s, {num_queries} {args.prompt_type} queries in {query_time:.2f} s, "
+          f"p50 {p50 * 1000:.2f} ms, p95 {p95 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms per batch of {args.batch_size}, "
+          f"{num_queries / query_time:.1f} queries/s, Max CPU Memory: {summary['max_cpu_memory_usage']:.2f} GB, "
+          f"Max GPU: {summary['max_gpu_usage']:.2f} GB")
+    if args.index:
+        print(f"Index with {backend.index.nlist} lists loaded in {index_time:.2f} s, recall at nprobe {nprobe}: {recall:.3f}")
+    return row
+
+if __name__ == "__main__":
+    """
+    Benchmark of open-vocabulary segmentation queries against a loaded scene.
+
+    Per-point features are loaded once, then a stream of text or click prompts is segmented one batch at a
+    time. Reports the model load time separately from the query latencies (p50/p95/p99) and throughput.
+
+    Usage:
+    python seginference_benchmark.py --backend synthetic --num_points 1000000 --prompt_type click
+    python seginference_benchmark.py --backend features --features <model>/point_cloud/iteration_10000/contrastive_feature_point_cloud.ply --scale_gate <model>/point_cloud/iteration_10000/scale_gate.pt --prompt_type click
+    python seginference_benchmark.py --backend features --features <clip_features.npy> --clip_path <path_to_clip> --prompt_type text
+    """
+    parser = argparse.ArgumentParser(description="Benchmark of segmentation query latency and throughput.")
+    parser.add_argument('--backend', choices=["synthetic", "features"], default="synthetic", help="Random CPU features or the features of a trained scene.")
+    parser.add_argument('--scene', default="synthetic", help="Scene name recorded with the results.")
+    parser.add_argument('--features', help="PLY or .npy file with per-point features (features backend).")
+    parser.add_argument('--scale_gate', default=None, help="SAGA scale_gate.pt applied to the features.")
+    parser.add_argument('--scale', type=float, default=1.0, help="Segmentation scale for the scale gate.")
+    parser.add_argument('--clip_path', default=None, help="open_clip checkpoint for text prompts.")
+    parser.add_argument('--clip_model', default="ViT-B-16", help="open_clip architecture of the checkpoint.")
+    parser.add_argument('--prompt_template', default="{}", help="Template of text prompts, e.g. 'a photo of a {}.'")
+    parser.add_argument('--text_cache', default=DEFAULT_CACHE, help="SQLite file of the text-embedding cache.")
+    parser.add_argument('--preload_labels', nargs='*', default=[], choices=list(LABEL_SETS), help="Label sets encoded while loading.")
+    parser.add_argument('--device', default="cuda", help="torch device of the features backend, cpu disables GPU sampling.")
+    parser.add_argument('--num_points', type=int, default=1_000_000, help="Number of synthetic points.")
+    parser.add_argument('--feature_dim', type=int, default=32, help="Dimension of the synthetic features.")
+    parser.add_argument('--prompt_type', choices=["text", "click"], default="click", help="Kind of prompts to send.")
+    parser.add_argument('--prompts', default=None, help="Text file with one text prompt per line.")
+    parser.add_argument('--clicks', type=int, default=1, help="Number of clicked points per click prompt.")
+    parser.add_argument('--num_queries', type=int, default=1000, help="Number of measured queries.")
+    parser.add_argument('--warmup', type=int, default=10, help="Number of unmeasured queries before the measured ones.")
+    parser.add_argument('--batch_size', type=int, default=1, help="Number of prompts segmented together.")
+    parser.add_argument('--threshold', type=float, default=0.5, help="Cosine similarity above which a point belongs to the segment.")
+    parser.add_argument('--index', action='store_true', help="Segment through an IVF feature index instead of scanning every point.")
+    parser.add_argument('--nlist', type=int, default=None, help="Number of index lists, defaults to 4 * sqrt(points).")
+    parser.add_argument('--nprobe', type=int, default=8, help="Number of index lists scanned per query, trades recall for latency.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for synthetic features and prompts.")
+    parser.add_argument('--sample_interval', type=float, default=DEFAULT_INTERVAL, help="Seconds between two resource samples.")
+    parser.add_argument('--output_file', default=os.path.join("results", "benchmarks", "seginference_benchmarks.csv"), help="Results CSV.")
+    args = parser.parse_args()
+
+    if args.backend == "features" and args.features is None:
+        parser.error("--backend features needs --features")
+    if args.backend == "synthetic":
+        args.device = "cpu"
+
+    benchmark_queries(args)
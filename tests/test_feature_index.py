@@ -0,0 +1,15 @@
+import numpy as np
+from benchmarking.feature_index import spherical_kmeans
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def test_spherical_kmeans_with_trailing_empty_lists():
+    # Two rows near x, three near y; the last two centroids point away from all rows and stay empty
+    features = _unit([[1.0, 0.1], [1.0, 0.2], [0.1, 1.0], [0.2, 1.0], [0.3, 1.0]])
+    init = _unit([[1.0, 0.0], [0.0, 1.0], [-1.0, -1.0], [-1.0, -0.5]])
+    centroids = spherical_kmeans(features, 4, iterations=1, init=init)
+
+    np.testing.assert_allclose(centroids[0], _unit([features[:2].sum(axis=0)])[0], atol=1e-6)
+    np.testing.assert_allclose(centroids[1], _unit([features[2:].sum(axis=0)])[0], atol=1e-6)
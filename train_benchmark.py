@@ -1,31 +1,8 @@
 import os
-import csv
-import time
-import subprocess
-from PIL import Image
 import argparse
-import psutil
-from pynvml import nvmlInit, nvmlDeviceGetHandleByIndex, nvmlDeviceGetMemoryInfo, nvmlShutdown
-
-def get_image_dimensions(image_path):
-    with Image.open(image_path) as img:
-        return img.size
-
-def get_gpu_usage():
-    handle = nvmlDeviceGetHandleByIndex(0)
-    info = nvmlDeviceGetMemoryInfo(handle)
-    return info.used / 1024 ** 3  # Convert bytes to gigabytes
-
-def get_cpu_memory_usage():
-    return psutil.virtual_memory().used / 1024 ** 3  # Convert bytes to gigabytes
-
-def get_folder_size_in_gb(folder_path):
-    total_size = 0
-    for dirpath, dirnames, filenames in os.walk(folder_path):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            total_size += os.path.getsize(fp)
-    return total_size / 1024 ** 3  # Convert bytes to gigabytes
+from benchmarking.harness import add_benchmark_arguments, run_benchmark
+from benchmarking.scheduler import Job
+from data_loading.scene_manifest import load_manifest
 
 def train_gaussian_splatting(args):
     scenes_dir = args.scenes_root
@@ -33,8 +10,6 @@ def train_gaussian_splatting(args):
     output_file = os.path.join("results", "benchmarks", "train_benchmarks.csv")
     script_name = "segment_3d_gaussians/train_scene.py"
 
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-
     if not os.path.exists(scenes_dir):
         print(f"Directory {scenes_dir} does not exist.")
         return
@@ -45,79 +20,33 @@ def train_gaussian_splatting(args):
         print(f"No scenes found ending with '{downsample_suffix}'.")
         return
 
-    file_exists = os.path.isfile(output_file)
-
-    with open(output_file, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        if not file_exists:
-            writer.writerow([
-                'approach', 'script', 'scene', 'time', 'image_count', 'image_width', 'image_height', 'scene_size',
-                'avg_gpu_usage', 'max_gpu_usage', 'avg_cpu_memory_usage', 'max_cpu_memory_usage', 
-                'avg_combined_usage', 'max_combined_usage'
-            ])
-
-        nvmlInit()  # Initialize NVML
-
-        for scene in scenes:
-            scene_path = os.path.join(scenes_dir, scene)
-            input_path = os.path.join(scene_path, "input")
-            model_path = os.path.join("results", "splatting_models", scene)
+    chains = []
 
-            if not os.path.exists(input_path):
-                print(f"Input directory {input_path} does not exist for scene {scene}.")
-                continue
+    for scene in scenes:
+        scene_path = os.path.join(scenes_dir, scene)
+        input_path = os.path.join(scene_path, "input")
+        model_path = os.path.join("results", "splatting_models", scene)
 
-            images = [img for img in os.listdir(input_path) if img.endswith(".jpg")]
+        if not os.path.exists(input_path):
+            print(f"Input directory {input_path} does not exist for scene {scene}.")
+            continue
 
-            if not images:
-                print(f"No images found in {input_path} for scene {scene}.")
-                continue
+        manifest = load_manifest(input_path)
+        images = manifest.images(".jpg")
 
-            image_path = os.path.join(input_path, images[0])
-            image_width, image_height = get_image_dimensions(image_path)
-            image_count = len(images)
-            scene_size = get_folder_size_in_gb(input_path)
+        if not images:
+            print(f"No images found in {input_path} for scene {scene}.")
+            continue
 
-            start_time = time.time()
-            gpu_usages = []
-            cpu_memory_usages = []
-            combined_usages = []
+        image_width, image_height = manifest.dimensions(images)
+        image_count = len(images)
+        scene_size = manifest.size_gb()
+        metadata = {'image_count': image_count, 'image_width': image_width, 'image_height': image_height, 'scene_size': scene_size,
+                    'cache_paths': [scene_path]}
 
-            process = subprocess.Popen(["python", script_name, "-s", scene_path, "-m", model_path])
+        chains.append([Job(scene, 'train_scene.py', ["python", script_name, "-s", scene_path, "-m", model_path], metadata=metadata)])
 
-            while process.poll() is None:
-                gpu_usage = get_gpu_usage()
-                cpu_memory_usage = get_cpu_memory_usage()
-                combined_usage = gpu_usage + cpu_memory_usage
-
-                gpu_usages.append(gpu_usage)
-                cpu_memory_usages.append(cpu_memory_usage)
-                combined_usages.append(combined_usage)
-
-                time.sleep(1)
-
-            process.wait()  # Wait for the process to complete
-            end_time = time.time()
-            elapsed_time = end_time - start_time
-
-            avg_gpu_usage = sum(gpu_usages) / len(gpu_usages)
-            max_gpu_usage = max(gpu_usages)
-            avg_cpu_memory_usage = sum(cpu_memory_usages) / len(cpu_memory_usages)
-            max_cpu_memory_usage = max(cpu_memory_usages)
-            avg_combined_usage = sum(combined_usages) / len(combined_usages)
-            max_combined_usage = max(combined_usages)
-
-            writer.writerow([
-                'saga', 'train_scene.py', scene, elapsed_time, image_count, image_width, image_height, scene_size,
-                avg_gpu_usage, max_gpu_usage, avg_cpu_memory_usage, max_cpu_memory_usage, avg_combined_usage, max_combined_usage
-            ])
-            print(f"Processed scene {scene}: {elapsed_time:.2f} seconds, "
-                  f"Avg GPU: {avg_gpu_usage:.2f} GB, Max GPU: {max_gpu_usage:.2f} GB, "
-                  f"Avg CPU Memory: {avg_cpu_memory_usage:.2f} GB, Max CPU Memory: {max_cpu_memory_usage:.2f} GB, "
-                  f"Avg Combined: {avg_combined_usage:.2f} GB, Max Combined: {max_combined_usage:.2f} GB, "
-                  f"Scene Size: {scene_size:.2f} GB")
-
-        nvmlShutdown()  # Shutdown NVML
+    run_benchmark(args, output_file, 'saga', chains)
 
 def train_opennerf():
     """
@@ -136,7 +65,78 @@ def train_opennerf():
     downscale_suffix = ""
     output_file = os.path.join("results", "benchmarks", "train_benchmarks.csv")
 
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    if not os.path.exists(scenes_dir):
+        print(f"Directory {scenes_dir} does not exist.")
+        return
+
+    scenes = [d for d in os.listdir(scenes_dir) if d.endswith(downsample_suffix) and os.path.isdir(os.path.join(scenes_dir, d))]
+
+    if not scenes:
+        print(f"No scenes found ending with '{downsample_suffix}'.")
+        return
+
+    chains = []
+
+    for scene in ["replica_office0"]:#scenes:
+        scene_path = os.path.join(scenes_dir, scene)
+        input_path = os.path.join(scene_path, "images", downscale_suffix)
+        output_path = os.path.join("results", "opennerf_outputs")
+
+        if not os.path.exists(input_path):
+            print(f"Input directory {input_path} does not exist for scene {scene}.")
+            continue
+
+        manifest = load_manifest(input_path)
+        images = manifest.images(".jpg")
+
+        if not images:
+            print(f"No images found in {input_path} for scene {scene}.")
+            continue
+
+        image_width, image_height = manifest.dimensions(images)
+        image_count = len(images)
+        scene_size = manifest.size_gb()
+        metadata = {'image_count': image_count, 'image_width': image_width, 'image_height': image_height, 'scene_size': scene_size,
+                    'cache_paths': [input_path]}
+
+        command = [
+            "/home/luca_luis/anaconda3/envs/opennerf/bin/python",
+            "/home/luca_luis/anaconda3/envs/opennerf/lib/python3.10/site-packages/nerfstudio/scripts/train.py",
+            f"opennerf",
+            f"--vis=wandb",  # viewer+wandb
+            f"--data={scene_path}",
+            f"--output-dir={output_path}",
+            f"--timestamp=benchmark"]
+        chains.append([Job(scene, 'nerfstudio/train.py', command, metadata=metadata)])
+
+    run_benchmark(args, output_file, 'opennerf', chains)
+
+def saga_frame_count(image_count, render_views):
+    """
+    Number of views rendered by SAGA's render.py. Without --eval every image is a training view, with --eval
+    every 8th image is held out as test view.
+    """
+    test_count = -(-image_count // 8)
+    return test_count if render_views == "test" else image_count
+
+def segment_gaussian_splatting(args):
+    """
+    Function for SAGA segmentation and label rendering
+
+    Args:
+        --scenes_root       Folder containing the *_downsampleN scenes, trained into results/splatting_models/<scene>
+        --downsample        The downsampling factor to look for in scene names
+        --render_views      train renders every training view, test the held-out views
+        --segment_target    coarse_seg_everything clusters the contrastive features into labels, seg renders
+                            the mask given by --precomputed_mask
+    """
+    scenes_dir = args.scenes_root
+    downsample_suffix = f"downsample{args.downsample}"
+    output_file = os.path.join("results", "benchmarks", "train_benchmarks.csv")
+    script_name = "segment_3d_gaussians/render.py"
+
+    if args.segment_target == "seg" and args.precomputed_mask is None:
+        raise ValueError("--segment_target seg needs --precomputed_mask.")
 
     if not os.path.exists(scenes_dir):
         print(f"Directory {scenes_dir} does not exist.")
@@ -148,89 +148,39 @@ def train_opennerf():
         print(f"No scenes found ending with '{downsample_suffix}'.")
         return
 
-    file_exists = os.path.isfile(output_file)
-
-    with open(output_file, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        if not file_exists:
-            writer.writerow([
-                'approach', 'script', 'scene', 'time', 'image_count', 'image_width', 'image_height', 'scene_size',
-                'avg_gpu_usage', 'max_gpu_usage', 'avg_cpu_memory_usage', 'max_cpu_memory_usage', 
-                'avg_combined_usage', 'max_combined_usage'
-            ])
-
-        nvmlInit()  # Initialize NVML
-
-        for scene in ["replica_office0"]:#scenes:
-            scene_path = os.path.join(scenes_dir, scene)
-            input_path = os.path.join(scene_path, "images", downscale_suffix)
-            output_path = os.path.join("results", "opennerf_outputs")
-
-            if not os.path.exists(input_path):
-                print(f"Input directory {input_path} does not exist for scene {scene}.")
-                continue
-
-            images = [img for img in os.listdir(input_path) if img.endswith(".jpg")]
-
-            if not images:
-                print(f"No images found in {input_path} for scene {scene}.")
-                continue
-
-            image_path = os.path.join(input_path, images[0])
-            image_width, image_height = get_image_dimensions(image_path)
-            image_count = len(images)
-            scene_size = get_folder_size_in_gb(input_path)
-
-            start_time = time.time()
-            gpu_usages = []
-            cpu_memory_usages = []
-            combined_usages = []
-
-            process = subprocess.Popen(
-                ["/home/luca_luis/anaconda3/envs/opennerf/bin/python",
-                "/home/luca_luis/anaconda3/envs/opennerf/lib/python3.10/site-packages/nerfstudio/scripts/train.py",
-                f"opennerf",
-                f"--vis=wandb",  # viewer+wandb
-                f"--data={scene_path}",
-                f"--output-dir={output_path}",
-                f"--timestamp=benchmark"])
-
-            while process.poll() is None:
-                gpu_usage = get_gpu_usage()
-                cpu_memory_usage = get_cpu_memory_usage()
-                combined_usage = gpu_usage + cpu_memory_usage
-
-                gpu_usages.append(gpu_usage)
-                cpu_memory_usages.append(cpu_memory_usage)
-                combined_usages.append(combined_usage)
-
-                time.sleep(1)
-
-            process.wait()  # Wait for the process to complete
-            end_time = time.time()
-            elapsed_time = end_time - start_time
-
-            avg_gpu_usage = sum(gpu_usages) / len(gpu_usages)
-            max_gpu_usage = max(gpu_usages)
-            avg_cpu_memory_usage = sum(cpu_memory_usages) / len(cpu_memory_usages)
-            max_cpu_memory_usage = max(cpu_memory_usages)
-            avg_combined_usage = sum(combined_usages) / len(combined_usages)
-            max_combined_usage = max(combined_usages)
-
-            writer.writerow([
-                'opennerf', 'nerfstudio/train.py', scene, elapsed_time, image_count, image_width, image_height, scene_size,
-                avg_gpu_usage, max_gpu_usage, avg_cpu_memory_usage, max_cpu_memory_usage, avg_combined_usage, max_combined_usage
-            ])
-            print(f"Processed scene {scene}: {elapsed_time:.2f} seconds, "
-                  f"Avg GPU: {avg_gpu_usage:.2f} GB, Max GPU: {max_gpu_usage:.2f} GB, "
-                  f"Avg CPU Memory: {avg_cpu_memory_usage:.2f} GB, Max CPU Memory: {max_cpu_memory_usage:.2f} GB, "
-                  f"Avg Combined: {avg_combined_usage:.2f} GB, Max Combined: {max_combined_usage:.2f} GB, "
-                  f"Scene Size: {scene_size:.2f} GB")
-
-        nvmlShutdown()  # Shutdown NVML
-
-def segment_gaussian_splatting():
-    pass
+    chains = []
+
+    for scene in scenes:
+        scene_path = os.path.join(scenes_dir, scene)
+        input_path = os.path.join(scene_path, "input")
+        model_path = os.path.join("results", "splatting_models", scene)
+        feature_path = os.path.join(model_path, "point_cloud", "iteration_10000", "contrastive_feature_point_cloud.ply")
+
+        if not os.path.exists(feature_path):
+            print(f"No contrastive features found in {model_path} for scene {scene}, run feature_benchmark.py first.")
+            continue
+
+        manifest = load_manifest(input_path)
+        images = manifest.images(".jpg")
+
+        if not images:
+            print(f"No images found in {input_path} for scene {scene}.")
+            continue
+
+        image_width, image_height = manifest.dimensions(images)
+        image_count = len(images)
+        scene_size = manifest.size_gb()
+        metadata = {'image_count': image_count, 'image_width': image_width, 'image_height': image_height, 'scene_size': scene_size,
+                    'frame_count': saga_frame_count(image_count, args.render_views), 'render_views': args.render_views,
+                    'cache_paths': [scene_path, model_path]}
+
+        command = ["python", script_name, "-m", model_path, "-s", scene_path, "--target", args.segment_target]
+        if args.segment_target == "seg":
+            command += ["--precomputed_mask", args.precomputed_mask, "--segment"]
+        command += ["--eval", "--skip_train"] if args.render_views == "test" else ["--skip_test"]
+        chains.append([Job(scene, 'render.py', command, metadata=metadata)])
+
+    run_benchmark(args, output_file, 'saga', chains)
 
 def segment_opennerf():
     """
@@ -249,8 +199,6 @@ def segment_opennerf():
     downscale_suffix = ""
     output_file = os.path.join("results", "benchmarks", "train_benchmarks.csv")
 
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-
     if not os.path.exists(scenes_dir):
         print(f"Directory {scenes_dir} does not exist.")
         return
@@ -261,86 +209,43 @@ def segment_opennerf():
         print(f"No scenes found ending with '{downsample_suffix}'.")
         return
 
-    file_exists = os.path.isfile(output_file)
-
-    with open(output_file, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        if not file_exists:
-            writer.writerow([
-                'approach', 'script', 'scene', 'time', 'image_count', 'image_width', 'image_height', 'scene_size',
-                'avg_gpu_usage', 'max_gpu_usage', 'avg_cpu_memory_usage', 'max_cpu_memory_usage', 
-                'avg_combined_usage', 'max_combined_usage'
-            ])
-
-        nvmlInit()  # Initialize NVML
-
-        for scene in ["replica_office0"]:#scenes:
-            scene_path = os.path.join(scenes_dir, scene)
-            input_path = os.path.join(scene_path, "images", downscale_suffix)
-            output_path = os.path.join("results", "opennerf_outputs", scene)
-
-            if not os.path.exists(input_path):
-                print(f"Input directory {input_path} does not exist for scene {scene}.")
-                continue
-
-            images = [img for img in os.listdir(input_path) if img.endswith(".jpg")]
-
-            if not images:
-                print(f"No images found in {input_path} for scene {scene}.")
-                continue
-
-            image_path = os.path.join(input_path, images[0])
-            image_width, image_height = get_image_dimensions(image_path)
-            image_count = len(images)
-            scene_size = get_folder_size_in_gb(input_path)
-
-            start_time = time.time()
-            gpu_usages = []
-            cpu_memory_usages = []
-            combined_usages = []
-
-            process = subprocess.Popen(
-                [f"/home/luca_luis/anaconda3/envs/opennerf/bin/python",
-                f"/home/luca_luis/adl4cv/nerf_segmentation/opennerf/datasets/replica_semantics.py",
-                f"interpolate",
-                f"--interpolation-steps=1",
-                f"--pose_source=train",
-                f"--load-config=/home/luca_luis/adl4cv/nerf_segmentation/results/opennerf_outputs/{scene}/opennerf/benchmark/config.yml",
-                f"--output_path=/home/luca_luis/adl4cv/nerf_segmentation/results/opennerf_outputs/{scene}/opennerf/benchmark/"])
-
-            while process.poll() is None:
-                gpu_usage = get_gpu_usage()
-                cpu_memory_usage = get_cpu_memory_usage()
-                combined_usage = gpu_usage + cpu_memory_usage
-
-                gpu_usages.append(gpu_usage)
-                cpu_memory_usages.append(cpu_memory_usage)
-                combined_usages.append(combined_usage)
-
-                time.sleep(1)
-
-            process.wait()  # Wait for the process to complete
-            end_time = time.time()
-            elapsed_time = end_time - start_time
-
-            avg_gpu_usage = sum(gpu_usages) / len(gpu_usages)
-            max_gpu_usage = max(gpu_usages)
-            avg_cpu_memory_usage = sum(cpu_memory_usages) / len(cpu_memory_usages)
-            max_cpu_memory_usage = max(cpu_memory_usages)
-            avg_combined_usage = sum(combined_usages) / len(combined_usages)
-            max_combined_usage = max(combined_usages)
-
-            writer.writerow([
-                'opennerf', 'opennerf/replica_semantics.py', scene, elapsed_time, image_count, image_width, image_height, scene_size,
-                avg_gpu_usage, max_gpu_usage, avg_cpu_memory_usage, max_cpu_memory_usage, avg_combined_usage, max_combined_usage
-            ])
-            print(f"Processed scene {scene}: {elapsed_time:.2f} seconds, "
-                  f"Avg GPU: {avg_gpu_usage:.2f} GB, Max GPU: {max_gpu_usage:.2f} GB, "
-                  f"Avg CPU Memory: {avg_cpu_memory_usage:.2f} GB, Max CPU Memory: {max_cpu_memory_usage:.2f} GB, "
-                  f"Avg Combined: {avg_combined_usage:.2f} GB, Max Combined: {max_combined_usage:.2f} GB, "
-                  f"Scene Size: {scene_size:.2f} GB")
-
-        nvmlShutdown()  # Shutdown NVML
+    chains = []
+
+    for scene in ["replica_office0"]:#scenes:
+        scene_path = os.path.join(scenes_dir, scene)
+        input_path = os.path.join(scene_path, "images", downscale_suffix)
+        output_path = os.path.join("results", "opennerf_outputs", scene)
+
+        if not os.path.exists(input_path):
+            print(f"Input directory {input_path} does not exist for scene {scene}.")
+            continue
+
+        manifest = load_manifest(input_path)
+        images = manifest.images(".jpg")
+
+        if not images:
+            print(f"No images found in {input_path} for scene {scene}.")
+            continue
+
+        image_width, image_height = manifest.dimensions(images)
+        image_count = len(images)
+        scene_size = manifest.size_gb()
+        # Interpolating with one step per training pose renders every training view once, but along the camera
+        # path instead of SAGA's dataset views, so the rows are kept apart from SAGA's train views
+        metadata = {'image_count': image_count, 'image_width': image_width, 'image_height': image_height, 'scene_size': scene_size,
+                    'frame_count': image_count, 'render_views': "interpolated_train", 'cache_paths': [input_path]}
+
+        command = [
+            f"/home/luca_luis/anaconda3/envs/opennerf/bin/python",
+            f"/home/luca_luis/adl4cv/nerf_segmentation/opennerf/datasets/replica_semantics.py",
+            f"interpolate",
+            f"--interpolation-steps=1",
+            f"--pose_source=train",
+            f"--load-config=/home/luca_luis/adl4cv/nerf_segmentation/results/opennerf_outputs/{scene}/opennerf/benchmark/config.yml",
+            f"--output_path=/home/luca_luis/adl4cv/nerf_segmentation/results/opennerf_outputs/{scene}/opennerf/benchmark/"]
+        chains.append([Job(scene, 'opennerf/replica_semantics.py', command, metadata=metadata)])
+
+    run_benchmark(args, output_file, 'opennerf', chains)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Benchmark script for training scenes.")
@@ -349,6 +254,11 @@ if __name__ == "__main__":
     parser.add_argument('--mode', required=True, help="Mode for benchmarking, select --train or --segment")
     parser.add_argument('--gaussian_splatting', action='store_true', help="Run the script for Gaussian Splatting.")
     parser.add_argument('--opennerf', action='store_true', help="Run the script for OpenNeRF.")
+    parser.add_argument('--render_views', choices=["train", "test"], default="train", help="Views rendered by --gaussian_splatting --mode segment.")
+    parser.add_argument('--segment_target', choices=["coarse_seg_everything", "seg"], default="coarse_seg_everything",
+                        help="SAGA render target: labels of all clustered segments or a precomputed mask.")
+    parser.add_argument('--precomputed_mask', default=None, help="SAGA segmentation mask (.pt) rendered with --segment_target seg.")
+    add_benchmark_arguments(parser)
     args = parser.parse_args()
 
     if args.gaussian_splatting and args.opennerf: